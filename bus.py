@@ -0,0 +1,158 @@
+from math import ceil
+
+from mem_ifc import MemoryInterface
+
+
+"""
+    Bus contention: an explicit bus in front of a level of the hierarchy, shared by every transfer to that level.
+
+    The transfer_cycles of each level charge its latency and the beats of a transfer as if the bus was always free.
+    A Bus stage plugs into the chain in front of a level (like a PrefetchStage), and tracks when the bus is busy:
+    -   Each transfer through it (a load or a store of a block, from any level or core above) occupies the bus for
+        its beats, ceil(8 * size / width) cycles, starting when the bus is free. The latency of the level is not
+        bus time, other transfers may use the bus meanwhile (split transactions).
+    -   A transfer that arrives while the bus is busy waits for it, and the wait is added to its cycles. Bandwidth
+        bound behaviour (write backs, prefetches, several cores on a shared bus) thus shows in the cycles elapsed.
+    The stage follows the time of the CPU through tick (the start of each access). Transfers issued back to back
+    (i.e: a fetch and its write back, or a batch of prefetches) follow each other on the bus, without waiting for
+    the latency of each other. Background transfers (prefetches, write buffer drains) occupy the bus as well, and
+    delay the demand transfers that follow them.
+
+    Statistics (see get_extra_statistics), prefixed by the name of the bus:
+    -   transfers, bytes: amount of transfers / bytes through the bus
+    -   utilization: fraction of the simulated time the bus was busy
+    -   bandwidth: achieved bandwidth, in bytes per cycle
+    -   queued, queue_cycles: amount of transfers that waited for the bus / total cycles they waited
+    -   avg_queue_delay: average wait of all transfers, in cycles
+"""
+
+
+class Bus(MemoryInterface):
+    """
+    A bus in front of a level of the hierarchy, see the module documentation.
+    """
+
+    DEFAULT_BUS_WIDTH = 64  # In bits, when the level behind the bus has no MEM_BUS_WIDTH
+
+    # Follows the time of the CPU
+    clocked = True
+
+    def __init__(self, next_mem_arg: MemoryInterface, bus_width: int = None, name: str = 'bus'):
+        """
+        :param next_mem_arg: The level behind the bus
+        :param bus_width: Width of the bus in bits (optional, the MEM_BUS_WIDTH of the level behind it by default)
+        :param name: Prefix of the statistics of this bus
+        """
+        super(Bus, self).__init__(next_mem_arg)
+        if bus_width is None:
+            bus_width = getattr(next_mem_arg, 'MEM_BUS_WIDTH', self.DEFAULT_BUS_WIDTH)
+        self.bus_width = bus_width
+        self.name = name
+
+        self.clock = 0       # Time of the next transfer
+        self.busy_until = 0  # The bus is free from this cycle on
+
+        # Statistics
+        self.transfers = 0
+        self.bytes = 0
+        self.busy_cycles = 0
+        self.queued = 0
+        self.queue_cycles = 0
+
+    def get_block_size(self) -> int:
+        return self.next_mem.get_block_size()
+
+    def is_address_present(self, address: int) -> bool:
+        return self.next_mem.is_address_present(address)
+
+    def flush_if_needed(self, address: int) -> int:
+        return self.next_mem.flush_if_needed(address)
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        return self.next_mem.read(address, data_size)
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        return self.next_mem.write(address, mark_dirty, data_size, data)
+
+    def occupy(self, data_size: int) -> int:
+        """
+        Schedules a transfer on the bus at the current time, the next transfer is issued once it leaves the bus.
+        :param data_size: The amount of data transferred, in bytes
+        :return: Clock cycles the transfer waits for the bus
+        """
+        beats = ceil(8 * data_size / self.bus_width)
+        start = max(self.clock, self.busy_until)
+        wait_cycles = start - self.clock
+        self.busy_until = start + beats
+        self.clock = self.busy_until
+
+        self.transfers += 1
+        self.bytes += data_size
+        self.busy_cycles += beats
+        if wait_cycles:
+            self.queued += 1
+            self.queue_cycles += wait_cycles
+        return wait_cycles
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Forwards a load to the level behind the bus, once the bus is free.
+        """
+        wait_cycles = self.occupy(block_size)
+        data, cycles_elapsed = self.next_mem.load(address, block_size)
+        return data, cycles_elapsed + wait_cycles
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Forwards a store to the level behind the bus, once the bus is free.
+        """
+        wait_cycles = self.occupy(block_size)
+        return self.next_mem.store(address, block_size, data) + wait_cycles
+
+    def prefetch(self, address: int) -> int:
+        """
+        Prefetches into the level behind the bus: the block is brought from the levels beyond it, so the bus itself
+        carries no data.
+        """
+        return self.next_mem.prefetch(address)
+
+    def evict_block(self, address: int, block_size: int, data, is_dirty: bool) -> int:
+        """
+        Hands a victim of the level above to the level behind the bus, over the bus when it is transferred.
+        """
+        if not (is_dirty or self.next_mem.keeps_clean_victims):
+            return 0
+        wait_cycles = self.occupy(block_size)
+        return self.next_mem.evict_block(address, block_size, data, is_dirty) + wait_cycles
+
+    def tick(self, now: int, idle_cycles: int):
+        """
+        Moves the time of the bus to the start of the next access of the CPU (the bus stays busy if it is).
+        """
+        self.clock = now + idle_cycles
+
+    def warm_access(self, address: int, is_store: bool):
+        """The bus holds no state to warm, functional warming passes through (see MemoryInterface.warm_access)"""
+        self.next_mem.warm_access(address, is_store)
+
+    def get_extra_statistics(self) -> dict:
+        """
+        :return: The bandwidth statistics of this bus (see module documentation)
+        """
+        elapsed_cycles = max(self.clock, self.busy_until)
+        return {
+            self.name + '_transfers': self.transfers,
+            self.name + '_bytes': self.bytes,
+            self.name + '_utilization': self.busy_cycles / elapsed_cycles if elapsed_cycles else 0.0,
+            self.name + '_bandwidth': self.bytes / elapsed_cycles if elapsed_cycles else 0.0,
+            self.name + '_queued': self.queued,
+            self.name + '_queue_cycles': self.queue_cycles,
+            self.name + '_avg_queue_delay': self.queue_cycles / self.transfers if self.transfers else 0.0,
+        }
+
+    def dump_memory(self, *file_names):
+        """The bus holds no data, all files belong to the levels behind it."""
+        self.next_mem.dump_memory(*file_names)
+
+    def print_mem(self, limit=-1):
+        self.next_mem.print_mem(limit)
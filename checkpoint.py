@@ -0,0 +1,147 @@
+import json
+import mmap
+import struct
+import sys
+
+from mem_ifc import MemoryInterface
+
+
+"""
+    Checkpoints of the complete state of a simulation: the contents of every level of the memory hierarchy, their
+    statistics counters, the cycle counters of the CPU and the offset in the trace.
+
+    A simulation can be run up to some point of the trace (i.e: after warming up the caches) and checkpointed, and
+    then resumed from the checkpoint any number of times, without loading memin or replaying the trace prefix.
+
+    File format:
+    -   Header: 8 byte magic, followed by the size of the metadata as uint64 (little endian).
+    -   Metadata: JSON - the CPU counters, and for each level (first level first): its type, its small state
+        (see MemoryInterface.checkpoint_state), its statistics counters and the location of its arrays in the file.
+    -   Arrays: raw contents, each starting on an ARRAY_ALIGNMENT boundary.
+    The file is memory-mapped on restore, and arrays are handed to the levels as views of the mapping. Main memory
+    keeps its pages as such views (copied on first write), so restoring does not copy the bulk of the memory.
+
+    Non-blocking timing models and the background state of clocked components are not part of checkpoints, except
+    for DRAM memory (its row buffers and write queue are saved with its contents).
+"""
+
+CHECKPOINT_MAGIC = b'MEMCKPT1'
+CHECKPOINT_HEADER = struct.Struct('<8sQ')  # Magic, size of metadata
+ARRAY_ALIGNMENT = 4096
+
+# Statistics counters of each level, saved and restored with its state
+COUNTER_NAMES = ('read_hits', 'read_misses', 'write_hits', 'write_misses', 'evictions', 'read_transfers', 'read_bytes',
+                 'write_transfers', 'write_bytes')
+
+
+def hierarchy_levels(mem_interface) -> list:
+    """
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    :return: All levels of the hierarchy, first level first
+    """
+    levels = []
+    while mem_interface is not None:
+        levels.append(mem_interface)
+        mem_interface = mem_interface.next_mem
+    return levels
+
+
+def check_checkpoint_support(mem_interface):
+    """
+    Raises for levels that can't be checkpointed (see MemoryInterface.checkpoint_state), so a simulation can be
+    rejected before it runs up to its checkpoint.
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    """
+    for level in hierarchy_levels(mem_interface):
+        if type(level).checkpoint_state is MemoryInterface.checkpoint_state:
+            raise NotImplementedError(type(level).__name__ + " does not support checkpoints")
+
+
+def align(offset: int) -> int:
+    """
+    :return: The offset, rounded up to ARRAY_ALIGNMENT
+    """
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+
+def save_checkpoint(file_name, mem_interface, trace_offset: int, cpu_counters):
+    """
+    Writes a checkpoint of the simulation.
+    :param file_name: Path of the checkpoint file
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    :param trace_offset: Amount of trace records executed so far
+    :param cpu_counters: (clock cycles, memory clock cycles, memory instructions) so far, see simulate_cpu
+    """
+    levels_metadata = []
+    array_segments = []  # (offset, list of segments) of all arrays, in file order
+    offset = 0
+    for level in hierarchy_levels(mem_interface):
+        state, arrays = level.checkpoint_state()
+        array_locations = {}
+        for name, segments in arrays.items():
+            if not isinstance(segments, list):
+                segments = [segments]
+            size = sum(memoryview(segment).nbytes for segment in segments)
+            array_locations[name] = (offset, size)
+            array_segments.append((offset, segments))
+            offset = align(offset + size)
+        levels_metadata.append({
+            'type': type(level).__name__,
+            'state': state,
+            'counters': {name: int(getattr(level, name)) for name in COUNTER_NAMES},
+            'arrays': array_locations,
+        })
+
+    metadata = json.dumps({
+        'byteorder': sys.byteorder,
+        'trace_offset': trace_offset,
+        'cpu_counters': list(cpu_counters),
+        'levels': levels_metadata,
+    }).encode('utf-8')
+    arrays_start = align(CHECKPOINT_HEADER.size + len(metadata))
+
+    with open(file_name, 'wb') as checkpoint_out:
+        checkpoint_out.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, len(metadata)))
+        checkpoint_out.write(metadata)
+        for array_offset, segments in array_segments:
+            checkpoint_out.seek(arrays_start + array_offset)
+            for segment in segments:
+                checkpoint_out.write(segment)
+        checkpoint_out.truncate(arrays_start + offset)
+
+
+def restore_checkpoint(file_name, mem_interface) -> (int, tuple):
+    """
+    Restores a checkpoint into a memory hierarchy of the same configuration.
+    :param file_name: Path of the checkpoint file
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    :return: (Amount of trace records executed at the checkpoint,
+              (clock cycles, memory clock cycles, memory instructions) at the checkpoint)
+    """
+    with open(file_name, 'rb') as checkpoint_in:
+        checkpoint_map = mmap.mmap(checkpoint_in.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # The mapping stays alive as long as views of it are held by the levels
+    checkpoint_view = memoryview(checkpoint_map)
+    magic, metadata_size = CHECKPOINT_HEADER.unpack_from(checkpoint_view)
+    if magic != CHECKPOINT_MAGIC:
+        raise ValueError("Not a checkpoint file: " + str(file_name))
+    metadata = json.loads(bytes(checkpoint_view[CHECKPOINT_HEADER.size:CHECKPOINT_HEADER.size + metadata_size]))
+    if metadata['byteorder'] != sys.byteorder:
+        raise ValueError("Checkpoint was written on a machine of different byte order")
+    arrays_start = align(CHECKPOINT_HEADER.size + metadata_size)
+
+    levels = hierarchy_levels(mem_interface)
+    level_types = [type(level).__name__ for level in levels]
+    checkpoint_types = [level_metadata['type'] for level_metadata in metadata['levels']]
+    if level_types != checkpoint_types:
+        raise ValueError("Checkpoint hierarchy " + str(checkpoint_types) + " does not match " + str(level_types))
+
+    for level, level_metadata in zip(levels, metadata['levels']):
+        arrays = {name: checkpoint_view[arrays_start + offset:arrays_start + offset + size]
+                  for name, (offset, size) in level_metadata['arrays'].items()}
+        level.restore_state(level_metadata['state'], arrays)
+        for name, value in level_metadata['counters'].items():
+            setattr(level, name, value)
+
+    return metadata['trace_offset'], tuple(metadata['cpu_counters'])
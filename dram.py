@@ -0,0 +1,267 @@
+from collections import OrderedDict
+from math import ceil
+from math import log2
+
+from main_memory import MainMemory
+
+
+"""
+    DRAM timing model for main memory: the latency of an access depends on the state of the row buffer of its bank,
+    instead of the flat MEM_ACCESS_TIME of MainMemory. The contents of memory are kept as in MainMemory.
+
+    Organization: channels x ranks x banks, each bank with a row buffer holding one open row of ROW_SIZE_IN_BYTES.
+    Addresses are interleaved as (from the LSB): column | channel | bank | rank | row, so consecutive rows of the
+    address space spread over all banks. Accesses are serial in this simulator, so channels and ranks only add row
+    buffers (no channel parallelism is modeled).
+
+    Latency of an access (in CPU clock cycles), on top of CONTROLLER_TIME and the bus beats as in MainMemory:
+    -   Row hit (the row is open in the row buffer): tCL
+    -   Row empty (no row open in the bank): tRCD + tCL
+    -   Row conflict (another row is open): tRP + tRCD + tCL
+    Page policy: 'open' leaves the row open after each access (row hits are possible), 'closed' precharges the bank
+    after each access (every access is a row empty, conflicts never happen).
+
+    Writes (write backs from the caches) are posted into a write queue of WRITE_QUEUE_SIZE entries, and cost only
+    CONTROLLER_TIME to the requester. The queue drains in the idle cycles of the CPU (see tick), and when it is full,
+    in which case the write stalls for one drain. Drains are scheduled FR-FCFS: the oldest write to an open row
+    first, the oldest write otherwise. Reads have priority over queued writes (data is always up to date, the queue
+    only holds the timing of the writes).
+
+    Statistics (see get_extra_statistics): row hits / empties / conflicts and the row buffer hit rate of all accesses
+    (reads and drained writes), average read latency, write queue drains and stalls, and the accesses and row hits of
+    each bank.
+"""
+
+PAGE_POLICIES = ('open', 'closed')
+
+# DRAM statistics counters, saved and restored with the state of the DRAM (see checkpoint_state)
+DRAM_COUNTER_NAMES = ('row_hits', 'row_empties', 'row_conflicts', 'reads', 'read_cycles', 'drains', 'stalls')
+
+
+class DRAMMemory(MainMemory):
+    """
+    Main memory with DRAM timing, see the module documentation.
+    """
+
+    # Organization
+    NUM_OF_CHANNELS = 1
+    NUM_OF_RANKS = 1
+    NUM_OF_BANKS = 8              # Per rank
+    ROW_SIZE_IN_BYTES = 2 * 1024  # Per bank
+    PAGE_POLICY = 'open'
+
+    # Timing, in CPU clock cycles
+    CONTROLLER_TIME = 10  # Queueing and command overhead of every access
+    T_CL = 30             # Column access (CAS latency)
+    T_RCD = 30            # Row activation (RAS to CAS delay)
+    T_RP = 30             # Precharge (closing the open row)
+
+    WRITE_QUEUE_SIZE = 16
+
+    # Drains the write queue in the idle cycles of the CPU
+    clocked = True
+
+    def __init__(self, mem_input_file, channels: int = None, ranks: int = None, banks: int = None,
+                 row_size: int = None, page_policy: str = None, t_cl: int = None, t_rcd: int = None,
+                 t_rp: int = None, write_queue_size: int = None):
+        """
+        :param mem_input_file: The initial contents of main memory (see MainMemory)
+        :param channels: Number of channels (optional, NUM_OF_CHANNELS by default)
+        :param ranks: Number of ranks per channel (optional, NUM_OF_RANKS by default)
+        :param banks: Number of banks per rank (optional, NUM_OF_BANKS by default)
+        :param row_size: Size of a row in bytes (optional, ROW_SIZE_IN_BYTES by default)
+        :param page_policy: 'open' or 'closed' (optional, PAGE_POLICY by default)
+        :param t_cl: CAS latency in cycles (optional, T_CL by default)
+        :param t_rcd: RAS to CAS delay in cycles (optional, T_RCD by default)
+        :param t_rp: Precharge time in cycles (optional, T_RP by default)
+        :param write_queue_size: Entries of the write queue (optional, WRITE_QUEUE_SIZE by default)
+        """
+        super(DRAMMemory, self).__init__(mem_input_file)
+        for name, value in (('NUM_OF_CHANNELS', channels), ('NUM_OF_RANKS', ranks), ('NUM_OF_BANKS', banks),
+                            ('ROW_SIZE_IN_BYTES', row_size), ('PAGE_POLICY', page_policy), ('T_CL', t_cl),
+                            ('T_RCD', t_rcd), ('T_RP', t_rp), ('WRITE_QUEUE_SIZE', write_queue_size)):
+            if value is not None:
+                setattr(self, name, value)
+
+        if self.PAGE_POLICY not in PAGE_POLICIES:
+            raise ValueError("Invalid page policy: " + str(self.PAGE_POLICY))
+        for name in ('NUM_OF_CHANNELS', 'NUM_OF_RANKS', 'NUM_OF_BANKS', 'ROW_SIZE_IN_BYTES'):
+            value = getattr(self, name)
+            if value < 1 or value & (value - 1):
+                raise ValueError(name + " must be a positive power of 2, got " + str(value))
+        if self.WRITE_QUEUE_SIZE < 1:
+            raise ValueError("The write queue needs at least one entry, got " + str(self.WRITE_QUEUE_SIZE))
+
+        self.column_bits = int(log2(self.ROW_SIZE_IN_BYTES))
+        self.channel_bits = int(log2(self.NUM_OF_CHANNELS))
+        self.bank_bits = int(log2(self.NUM_OF_BANKS))
+        self.rank_bits = int(log2(self.NUM_OF_RANKS))
+        self.num_of_all_banks = self.NUM_OF_CHANNELS * self.NUM_OF_RANKS * self.NUM_OF_BANKS
+
+        self.reset_timing()
+
+    def reset_timing(self):
+        """Closes all rows, empties the write queue and clears the DRAM statistics."""
+        self.open_rows = [None] * self.num_of_all_banks  # Open row of each bank, None when precharged
+        self.write_queue = OrderedDict()                  # Queued write id -> (bank, row), oldest first
+        self.next_write_id = 0
+        self.drain_credit = 0                             # Idle cycles available for draining (see WriteBuffer)
+
+        self.row_hits = 0
+        self.row_empties = 0
+        self.row_conflicts = 0
+        self.reads = 0
+        self.read_cycles = 0
+        self.drains = 0
+        self.stalls = 0
+        self.bank_accesses = [0] * self.num_of_all_banks
+        self.bank_row_hits = [0] * self.num_of_all_banks
+
+    def reset(self):
+        super(DRAMMemory, self).reset()
+        self.reset_timing()
+
+    def timing_config(self) -> dict:
+        """
+        :return: The organization and timing parameters of the DRAM
+        """
+        return {name: getattr(self, name) for name in (
+            'NUM_OF_CHANNELS', 'NUM_OF_RANKS', 'NUM_OF_BANKS', 'ROW_SIZE_IN_BYTES', 'PAGE_POLICY', 'CONTROLLER_TIME',
+            'T_CL', 'T_RCD', 'T_RP', 'WRITE_QUEUE_SIZE')}
+
+    def checkpoint_state(self) -> (dict, dict):
+        """
+        :return: The contents of memory as MainMemory, with the row buffers, the write queue and the DRAM statistics
+                 (see MemoryInterface.checkpoint_state)
+        """
+        state, arrays = super(DRAMMemory, self).checkpoint_state()
+        state = dict(state, config=self.timing_config(), open_rows=self.open_rows,
+                     write_queue=[[write_id, bank, row] for write_id, (bank, row) in self.write_queue.items()],
+                     next_write_id=self.next_write_id, drain_credit=self.drain_credit,
+                     counters={name: getattr(self, name) for name in DRAM_COUNTER_NAMES},
+                     bank_accesses=self.bank_accesses, bank_row_hits=self.bank_row_hits)
+        return state, arrays
+
+    def restore_state(self, state: dict, arrays: dict):
+        """
+        Restores the contents of memory as MainMemory, and the DRAM state of a DRAM of the same configuration.
+        """
+        if state['config'] != self.timing_config():
+            raise ValueError("Checkpoint of DRAM does not match its configuration: " + str(state['config']))
+        super(DRAMMemory, self).restore_state(state, arrays)
+        self.open_rows = list(state['open_rows'])
+        self.write_queue = OrderedDict((write_id, (bank, row)) for write_id, bank, row in state['write_queue'])
+        self.next_write_id = state['next_write_id']
+        self.drain_credit = state['drain_credit']
+        for name, value in state['counters'].items():
+            setattr(self, name, value)
+        self.bank_accesses = list(state['bank_accesses'])
+        self.bank_row_hits = list(state['bank_row_hits'])
+
+    def address_to_bank_row(self, address: int) -> (int, int):
+        """
+        :param address: Address input
+        :return: (Index of the bank among all banks of all channels and ranks, row within the bank)
+        """
+        address >>= self.column_bits
+        channel = address & (self.NUM_OF_CHANNELS - 1)
+        address >>= self.channel_bits
+        bank = address & (self.NUM_OF_BANKS - 1)
+        address >>= self.bank_bits
+        rank = address & (self.NUM_OF_RANKS - 1)
+        row = address >> self.rank_bits
+        return (channel * self.NUM_OF_RANKS + rank) * self.NUM_OF_BANKS + bank, row
+
+    def access_bank(self, bank: int, row: int) -> int:
+        """
+        Accesses a row of a bank, updating its row buffer according to the page policy.
+        :return: Clock cycles of the row buffer access (without the controller time and bus beats)
+        """
+        open_row = self.open_rows[bank]
+        self.bank_accesses[bank] += 1
+        if open_row == row:
+            self.row_hits += 1
+            self.bank_row_hits[bank] += 1
+            cycles_elapsed = self.T_CL
+        elif open_row is None:
+            self.row_empties += 1
+            cycles_elapsed = self.T_RCD + self.T_CL
+        else:
+            self.row_conflicts += 1
+            cycles_elapsed = self.T_RP + self.T_RCD + self.T_CL
+
+        self.open_rows[bank] = row if self.PAGE_POLICY == 'open' else None
+        return cycles_elapsed
+
+    def burst_cycles(self, data_size: int) -> int:
+        """
+        :param data_size: The amount of data passed on the bus
+        :return: Cycles of the additional bus beats, as in MainMemory.transfer_cycles
+        """
+        return (ceil(8*data_size / self.MEM_BUS_WIDTH) - 1) * self.MEM_BUS_ACCESS_TIME
+
+    def drain_write(self) -> int:
+        """
+        Performs the queued write chosen by FR-FCFS: the oldest write to an open row, or the oldest write.
+        :return: Clock cycles of the write
+        """
+        write_id = next((write_id for write_id, (bank, row) in self.write_queue.items()
+                         if self.open_rows[bank] == row), None)
+        if write_id is None:
+            write_id = next(iter(self.write_queue))
+        bank, row = self.write_queue.pop(write_id)
+        self.drains += 1
+        return self.CONTROLLER_TIME + self.access_bank(bank, row)
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        """
+        Reads as MainMemory does, the latency depends on the row buffer of the bank (see module documentation).
+        """
+        data = super(DRAMMemory, self).read(address, data_size)[0]
+        cycles_elapsed = self.CONTROLLER_TIME + self.access_bank(*self.address_to_bank_row(address)) + \
+            self.burst_cycles(data_size)
+        self.reads += 1
+        self.read_cycles += cycles_elapsed
+        return data, cycles_elapsed
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        """
+        Writes as MainMemory does, the write is posted to the write queue (see module documentation).
+        """
+        super(DRAMMemory, self).write(address, mark_dirty, data_size, data)
+        cycles_elapsed = self.CONTROLLER_TIME + self.burst_cycles(data_size)
+        if len(self.write_queue) >= self.WRITE_QUEUE_SIZE:
+            self.stalls += 1
+            cycles_elapsed += self.drain_write()
+        self.write_queue[self.next_write_id] = self.address_to_bank_row(address)
+        self.next_write_id += 1
+        return cycles_elapsed
+
+    def tick(self, now: int, idle_cycles: int):
+        """
+        Drains queued writes in the idle cycles of the CPU (the last drain may overrun, as in WriteBuffer.tick).
+        """
+        self.drain_credit += idle_cycles
+        while self.write_queue and self.drain_credit > 0:
+            self.drain_credit -= self.drain_write()
+        if not self.write_queue:
+            self.drain_credit = min(self.drain_credit, 0)  # Idle cycles can't be saved for later
+
+    def get_extra_statistics(self) -> dict:
+        """
+        :return: The DRAM statistics (see module documentation)
+        """
+        accesses = self.row_hits + self.row_empties + self.row_conflicts
+        statistics = {
+            'dram_row_hits': self.row_hits,
+            'dram_row_empties': self.row_empties,
+            'dram_row_conflicts': self.row_conflicts,
+            'dram_row_hit_rate': self.row_hits / accesses if accesses else 0.0,
+            'dram_avg_read_latency': self.read_cycles / self.reads if self.reads else 0.0,
+            'dram_write_drains': self.drains,
+            'dram_write_stalls': self.stalls,
+        }
+        for bank in range(self.num_of_all_banks):
+            statistics['dram_bank' + str(bank) + '_accesses'] = self.bank_accesses[bank]
+            statistics['dram_bank' + str(bank) + '_row_hits'] = self.bank_row_hits[bank]
+        return statistics
@@ -0,0 +1,297 @@
+import heapq
+
+from mem_ifc import MemoryInterface
+from sim_constants import CPU_DATA_SIZE
+from trace_reader import TRACE_OP_STORE, chunk_records, read_trace
+
+
+"""
+    Discrete event simulation kernel: a global clock and a queue of timestamped events, in place of the cycles
+    summed by the serial loop of the CPU (see sim.simulate_cpu).
+
+    The kernel (EventKernel) keeps the events in a heap ordered by (time, order of scheduling), so scheduling is
+    O(log n) and events at the same cycle are handled in the order they were posted. All events of a cycle are popped
+    as one batch before they are handled, events they post for the same cycle form the next batch.
+
+    Components post and consume events:
+    -   TraceCPU: a core executing a trace. Each access is a request event at the cycle it is issued (its gap after
+        the previous access completed), and a response event when the hierarchy returns its data. The CPU blocks
+        until the response, as in the serial model.
+    -   LevelPort: a port in front of a level of the hierarchy (L2 cache or main memory), through which the levels
+        above reach it. By default it only forwards the requests, and the simulation takes the same cycles as the
+        serial one. With posted write backs, the write backs reaching the level are posted: the data is written at
+        once, but the level then stays busy for the cycles of the write, and a completion event is posted for when
+        it is done. The level above doesn't wait for the write, while the demand requests that reach the level
+        before it completes wait for it.
+    The caches and main memory are unchanged: the cycles of each request are still returned by their load and
+    store methods, the ports and the CPU place them on the time line of the kernel.
+
+    Statistics (see get_extra_statistics): the events handled by the kernel, and for each port (prefixed by its
+    name) the write backs posted through it, the most posted write backs in flight and the cycles demand requests
+    waited for them.
+"""
+
+
+class EventKernel(object):
+    """
+    Global clock and event queue of a discrete event simulation, see the module documentation.
+    """
+
+    def __init__(self):
+        self.now = 0             # Current cycle, the time of the events being handled
+        self.queue = []          # Heap of (time, sequence number, handler, arguments)
+        self.sequence = 0        # Order of scheduling, breaks ties between events of the same cycle
+        self.events_handled = 0
+
+    def schedule(self, time: int, handler, *args):
+        """
+        Posts an event.
+        :param time: Cycle of the event, not before the current cycle
+        :param handler: Callable handling the event, called with args
+        """
+        if time < self.now:
+            raise ValueError("Can't schedule an event in the past: " + str(time) + " < " + str(self.now))
+        heapq.heappush(self.queue, (time, self.sequence, handler, args))
+        self.sequence += 1
+
+    def run(self, until: int = None) -> int:
+        """
+        Handles the events in order of time, a batch of all events of the same cycle at a time.
+        :param until: Cycle to stop before (optional, the kernel runs until no events are left)
+        :return: The current cycle
+        """
+        queue = self.queue
+        heappop = heapq.heappop
+        while queue:
+            time = queue[0][0]
+            if until is not None and time >= until:
+                break
+            self.now = time
+            batch = [heappop(queue)]
+            while queue and queue[0][0] == time:
+                batch.append(heappop(queue))
+            self.events_handled += len(batch)
+            for _, _, handler, args in batch:
+                handler(*args)
+        return self.now
+
+    def get_extra_statistics(self) -> dict:
+        return {'events_handled': self.events_handled}
+
+
+class LevelPort(MemoryInterface):
+    """
+    A port in front of a level of the hierarchy, that may post the write backs reaching it (see module
+    documentation).
+    """
+
+    def __init__(self, next_mem_arg: MemoryInterface, kernel: EventKernel, posted_writebacks: bool = False,
+                 name: str = 'port'):
+        """
+        :param next_mem_arg: The level behind the port
+        :param kernel: The kernel whose clock the port follows
+        :param posted_writebacks: True to post the write backs, False to forward them as the serial model does
+        :param name: Prefix of the statistics of this port
+        """
+        super(LevelPort, self).__init__(next_mem_arg)
+        self.kernel = kernel
+        self.posted_writebacks = posted_writebacks
+        self.name = name
+
+        self.busy_until = 0  # The level is done with the posted write backs from this cycle on
+        self.in_flight = 0   # Posted write backs not completed yet
+
+        # Statistics
+        self.posted = 0
+        self.max_in_flight = 0
+        self.stalls = 0
+        self.stall_cycles = 0
+
+    def get_block_size(self) -> int:
+        return self.next_mem.get_block_size()
+
+    def is_address_present(self, address: int) -> bool:
+        return self.next_mem.is_address_present(address)
+
+    def flush_if_needed(self, address: int) -> int:
+        return self.next_mem.flush_if_needed(address)
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        return self.next_mem.read(address, data_size)
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        return self.next_mem.write(address, mark_dirty, data_size, data)
+
+    def wait_cycles(self) -> int:
+        """
+        :return: Clock cycles a demand request arriving now waits for the posted write backs
+        """
+        wait_cycles = max(0, self.busy_until - self.kernel.now)
+        if wait_cycles:
+            self.stalls += 1
+            self.stall_cycles += wait_cycles
+        return wait_cycles
+
+    def post(self, cycles_elapsed: int) -> int:
+        """
+        Keeps the level busy for a posted write back, after the ones already in flight.
+        :param cycles_elapsed: Clock cycles of the write back
+        :return: Clock cycles the level above waits for the write back (none)
+        """
+        self.busy_until = max(self.busy_until, self.kernel.now) + cycles_elapsed
+        self.kernel.schedule(self.busy_until, self.complete)
+        self.posted += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return 0
+
+    def complete(self):
+        """Handles the completion event of a posted write back."""
+        self.in_flight -= 1
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Forwards a load to the level behind the port, once it is done with the posted write backs.
+        """
+        wait_cycles = self.wait_cycles() if self.posted_writebacks else 0
+        data, cycles_elapsed = self.next_mem.load(address, block_size)
+        return data, cycles_elapsed + wait_cycles
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Forwards a write back to the level behind the port, posted or not.
+        """
+        cycles_elapsed = self.next_mem.store(address, block_size, data)
+        return self.post(cycles_elapsed) if self.posted_writebacks else cycles_elapsed
+
+    def prefetch(self, address: int) -> int:
+        """Prefetches into the level behind the port, as a demand request would."""
+        wait_cycles = self.wait_cycles() if self.posted_writebacks else 0
+        return self.next_mem.prefetch(address) + wait_cycles
+
+    def evict_block(self, address: int, block_size: int, data, is_dirty: bool) -> int:
+        """
+        Hands a victim of the level above to the level behind the port, dirty victims are posted write backs.
+        """
+        cycles_elapsed = self.next_mem.evict_block(address, block_size, data, is_dirty)
+        if is_dirty and self.posted_writebacks:
+            return self.post(cycles_elapsed)
+        return cycles_elapsed
+
+    def get_extra_statistics(self) -> dict:
+        """
+        :return: The posted write back statistics of this port (see module documentation)
+        """
+        if not self.posted_writebacks:
+            return {}
+        return {
+            self.name + '_posted_writebacks': self.posted,
+            self.name + '_max_in_flight': self.max_in_flight,
+            self.name + '_stalls': self.stalls,
+            self.name + '_stall_cycles': self.stall_cycles,
+        }
+
+    def dump_memory(self, *file_names):
+        """The port holds no data, all files belong to the levels behind it."""
+        self.next_mem.dump_memory(*file_names)
+
+    def print_mem(self, limit=-1):
+        self.next_mem.print_mem(limit)
+
+
+class TraceCPU(object):
+    """
+    A core executing a trace on the event kernel, see the module documentation.
+    """
+
+    def __init__(self, kernel: EventKernel, trace, mem_interface: MemoryInterface):
+        """
+        :param kernel: The kernel the core runs on
+        :param trace: Trace file (text or binary), or an iterable of TraceChunk objects
+        :param mem_interface: First level of the hierarchy of the core
+        """
+        self.kernel = kernel
+        self.mem_interface = mem_interface
+        trace_chunks = read_trace(trace) if isinstance(trace, str) else trace
+        self.records = (record for chunk in trace_chunks for record in chunk_records(chunk))
+
+        # Levels that follow the time of the core (see MemoryInterface.tick), deepest first
+        self.clocked_levels = []
+        mem_level = mem_interface
+        while mem_level is not None:
+            if mem_level.clocked:
+                self.clocked_levels.insert(0, mem_level)
+            mem_level = mem_level.next_mem
+
+        self.cycles = 0        # Cycle the last access completed at
+        self.mem_cycles = 0
+        self.mem_instructions = 0
+
+    def start(self):
+        """Issues the first access of the trace."""
+        self.issue_next(0)
+
+    def issue_next(self, now: int):
+        """
+        Posts the request event of the next access of the trace, if any.
+        :param now: Cycle the previous access completed at
+        """
+        record = next(self.records, None)
+        if record is not None:
+            self.kernel.schedule(now + record[0], self.request, record)
+
+    def request(self, record):
+        """Handles a request event: performs the access, and posts its response."""
+        num_of_cycles_passed, op, address, data = record
+        now = self.kernel.now
+        for mem_level in self.clocked_levels:
+            mem_level.tick(now - num_of_cycles_passed, num_of_cycles_passed)
+        if op == TRACE_OP_STORE:
+            cycles_elapsed = self.mem_interface.store(address, CPU_DATA_SIZE, data.to_bytes(CPU_DATA_SIZE, 'little'))
+        else:
+            cycles_elapsed = self.mem_interface.load(address, CPU_DATA_SIZE)[1]
+        self.kernel.schedule(now + cycles_elapsed, self.response, cycles_elapsed)
+
+    def response(self, cycles_elapsed: int):
+        """Handles a response event: the access completed, the next one is issued."""
+        self.cycles = self.kernel.now
+        self.mem_cycles += cycles_elapsed
+        self.mem_instructions += 1
+        self.issue_next(self.cycles)
+
+
+def attach_ports(kernel: EventKernel, top_levels, port_levels, posted_writebacks: bool = False) -> list:
+    """
+    Plugs a port in front of each of the given levels: all levels above that point to one of them point to its port
+    instead, so a level shared by several cores gets a single shared port (as sim.attach_buses does).
+    :param kernel: The kernel of the simulation
+    :param top_levels: First level of the hierarchy of each core
+    :param port_levels: List of (level to put a port in front of, name of the port)
+    :param posted_writebacks: True to post the write backs reaching the levels (see LevelPort)
+    :return: The ports
+    """
+    ports = {id(level): LevelPort(level, kernel, posted_writebacks, name) for level, name in port_levels}
+    for top_level in top_levels:
+        mem_level = top_level
+        while mem_level.next_mem is not None:
+            port = ports.get(id(mem_level.next_mem))
+            if port is not None and port is not mem_level:
+                mem_level.next_mem = port
+            mem_level = mem_level.next_mem
+    return list(ports.values())
+
+
+def simulate_events(kernel: EventKernel, traces, mem_interfaces) -> list:
+    """
+    Simulates cores executing their traces on the event kernel, until all traces are done.
+    :param kernel: The kernel of the simulation, with the ports already attached (see attach_ports)
+    :param traces: Trace of each core (text or binary file, or iterable of TraceChunk objects)
+    :param mem_interfaces: First level of the hierarchy of each core
+    :return: For each core: (Amount of clock cycles the core took, Amount of clock cycles only its memory
+             operations took, Amount of store / load instructions it executed), as sim.simulate_cpu
+    """
+    cpus = [TraceCPU(kernel, trace, mem_interface) for trace, mem_interface in zip(traces, mem_interfaces)]
+    for cpu in cpus:
+        cpu.start()
+    kernel.run()
+    return [(cpu.cycles, cpu.mem_cycles, cpu.mem_instructions) for cpu in cpus]
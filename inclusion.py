@@ -0,0 +1,209 @@
+from mem_ifc import MemoryInterface
+from sectored_cache import SectoredCache
+
+
+"""
+    Inclusion policies between two cache levels (i.e: L1 and L2). By default the hierarchy is non-inclusive: each
+    level fills the blocks that miss in it, and evicts its victims on its own, so a block may be held by both levels,
+    or only by one of them.
+
+    An InclusionPort is plugged between the upper cache and the lower cache, and enforces one of the policies:
+    -   nine (non-inclusive non-exclusive): the default behavior, the port only reports the statistics.
+    -   inclusive: every block of the upper cache is also in the lower cache. Fills go through the lower cache as
+        usual, and when the lower cache evicts a block (see MemoryInterface.evict_hook), the copies of the block in
+        the upper cache are back-invalidated. Dirty copies are merged into the evicted block first, so its write back
+        carries them.
+    -   exclusive: a block is held by at most one of the levels, the lower cache holds the victims of the upper
+        cache (clean ones too). A miss of the upper cache that hits in the lower cache moves (swaps) the block up:
+        it is invalidated in the lower cache, and the victim of the upper cache takes its place. A miss in both
+        levels is filled from the level below the lower cache directly into the upper cache. The upper cache gets
+        the block clean, so a dirty block moving up is written back to the level below. Both caches must have the
+        same block size.
+    The inclusive and exclusive policies move and invalidate whole blocks of the upper cache, so it can't be a
+    sectored cache.
+
+    Statistics (see get_extra_statistics, prefixed by the name of the port): back-invalidations (and the dirty ones
+    among them), swaps (and their write backs), and the effective capacity at the end of the simulation: the bytes
+    held by each level, the bytes held by both (duplicates) and the unique bytes held by the two levels together.
+"""
+
+INCLUSION_POLICIES = ('nine', 'inclusive', 'exclusive')
+
+# Effective capacity statistics, scanning the blocks of both caches (see InclusionPort.capacity_statistics)
+CAPACITY_STATISTICS = ('upper_bytes', 'lower_bytes', 'duplicate_bytes', 'unique_bytes')
+
+
+class InclusionPort(MemoryInterface):
+    """
+    A port between two cache levels that enforces an inclusion policy, see the module documentation.
+    """
+
+    def __init__(self, upper_cache: MemoryInterface, lower_cache: MemoryInterface, policy: str,
+                 name: str = 'inclusion'):
+        """
+        :param upper_cache: The upper cache (i.e: L1), the port becomes its next level
+        :param lower_cache: The lower cache (i.e: L2), the next level of the port
+        :param policy: One of INCLUSION_POLICIES
+        :param name: Prefix of the statistics of this port
+        """
+        super(InclusionPort, self).__init__(lower_cache)
+        if policy not in INCLUSION_POLICIES:
+            raise ValueError("Invalid inclusion policy: " + str(policy) + ", expected one of " +
+                             ", ".join(INCLUSION_POLICIES))
+        if policy != 'nine' and isinstance(upper_cache, SectoredCache):
+            raise ValueError("Inclusion policies move and invalidate whole blocks of the upper cache, it can't be "
+                             "sectored")
+        if policy == 'exclusive' and upper_cache.get_block_size() != lower_cache.get_block_size():
+            raise ValueError("Exclusive caches must have the same block size, got " +
+                             str(upper_cache.get_block_size()) + " and " + str(lower_cache.get_block_size()))
+        self.upper = upper_cache
+        self.lower = lower_cache  # The port may be behind buses or ports (see sim), its requests go to next_mem
+        self.policy = policy
+        self.name = name
+
+        # The lower cache of an exclusive pair holds the victims of the upper cache, clean ones too
+        self.keeps_clean_victims = policy == 'exclusive'
+        if policy == 'inclusive':
+            lower_cache.evict_hook = self.back_invalidate
+
+        # Statistics
+        self.back_invalidations = 0
+        self.dirty_back_invalidations = 0
+        self.swaps = 0
+        self.swap_writebacks = 0
+
+    def get_block_size(self) -> int:
+        return self.next_mem.get_block_size()
+
+    def is_address_present(self, address: int) -> bool:
+        return self.next_mem.is_address_present(address)
+
+    def flush_if_needed(self, address: int) -> int:
+        return self.next_mem.flush_if_needed(address)
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        return self.next_mem.read(address, data_size)
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        return self.next_mem.write(address, mark_dirty, data_size, data)
+
+    def back_invalidate(self, address: int, block_size: int):
+        """
+        Evict hook of the lower cache of an inclusive pair: invalidates the copies of the evicted block in the upper
+        cache, merging the dirty ones into the evicted block.
+        :param address: Start address of the block evicted by the lower cache
+        :param block_size: Block size of the lower cache
+        """
+        upper_block_size = self.upper.get_block_size()
+        for upper_address in range(address, address + block_size, upper_block_size):
+            if not self.upper.is_address_present(upper_address):
+                continue
+            data = bytes(self.upper.read(upper_address, upper_block_size)[0])
+            self.back_invalidations += 1
+            if self.upper.invalidate_block(upper_address):
+                self.dirty_back_invalidations += 1
+                self.lower.write(upper_address, True, upper_block_size, data)
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Serves a miss of the upper cache. In an exclusive pair, a hit in the lower cache swaps the block up, a miss
+        is filled from the level below the lower cache.
+        """
+        if self.policy != 'exclusive':
+            return self.next_mem.load(address, block_size)
+
+        if self.lower.is_address_present(address):
+            data, cycles_elapsed = self.next_mem.load(address, block_size)
+            data = bytes(data)  # The block leaves the lower cache
+            self.swaps += 1
+            if self.lower.invalidate_block(address):
+                self.swap_writebacks += 1
+                block_address = address - (address % self.lower.get_block_size())
+                cycles_elapsed += self.lower.next_mem.store(block_address, len(data), data)
+                self.lower.count_write_traffic(len(data))
+            return data, cycles_elapsed
+
+        # Miss in both levels, the block bypasses the lower cache (its bus is still crossed)
+        self.lower.read_misses += 1
+        data, cycles_elapsed = self.lower.next_mem.load(address, block_size)
+        self.lower.count_read_traffic(block_size)
+        return data, cycles_elapsed + self.lower.transfer_cycles(block_size)
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Writes a store of the upper cache (a write back, a write through or a store around it) to the lower cache.
+        In an exclusive pair, stores of blocks the lower cache doesn't hold go around it.
+        """
+        if self.policy == 'exclusive' and not self.lower.is_address_present(address):
+            self.lower.write_misses += 1
+            return self.lower.transfer_cycles(block_size) + self.lower.next_mem.store(address, block_size, data)
+        return self.next_mem.store(address, block_size, data)
+
+    def prefetch(self, address: int) -> int:
+        return self.next_mem.prefetch(address)
+
+    def evict_block(self, address: int, block_size: int, data, is_dirty: bool) -> int:
+        """
+        Hands a victim of the upper cache to the lower cache. In an exclusive pair, every victim is placed in the
+        lower cache (without fetching it), evicting a victim of the lower cache if needed.
+        """
+        if self.policy != 'exclusive':
+            return self.next_mem.evict_block(address, block_size, data, is_dirty)
+
+        if self.lower.is_address_present(address):
+            # Already held (i.e: prefetched): only dirty contents are newer
+            return self.lower.write(address, True, block_size, data) if is_dirty else 0
+        cycles_elapsed = self.lower.flush_if_needed(address)
+        return cycles_elapsed + self.lower.write(address, is_dirty, block_size, data)
+
+    def warm_access(self, address: int, is_store: bool):
+        """Not warmed, functional warming passes through to the next level (see MemoryInterface.warm_access)"""
+        self.next_mem.warm_access(address, is_store)
+
+    def capacity_statistics(self) -> dict:
+        """
+        :return: The bytes held by each level, by both levels (duplicates), and the unique bytes held by the two
+                 levels together, at the time of the call
+        """
+        upper_block_size = self.upper.get_block_size()
+        upper_blocks = self.upper.resident_blocks()
+        lower_bytes = len(self.lower.resident_blocks()) * self.lower.get_block_size()
+        duplicate_bytes = upper_block_size * sum(1 for address in upper_blocks
+                                                 if self.lower.is_address_present(address))
+        upper_bytes = len(upper_blocks) * upper_block_size
+        values = (upper_bytes, lower_bytes, duplicate_bytes, upper_bytes + lower_bytes - duplicate_bytes)
+        return {self.name + '_' + name: value for name, value in zip(CAPACITY_STATISTICS, values)}
+
+    def counter_statistics(self) -> dict:
+        """
+        :return: The back-invalidation and swap counters of this port
+        """
+        return {
+            self.name + '_back_invalidations': self.back_invalidations,
+            self.name + '_dirty_back_invalidations': self.dirty_back_invalidations,
+            self.name + '_swaps': self.swaps,
+            self.name + '_swap_writebacks': self.swap_writebacks,
+        }
+
+    def get_extra_statistics(self) -> dict:
+        """
+        :return: The inclusion statistics of this port (see module documentation)
+        """
+        statistics = self.counter_statistics()
+        statistics.update(self.capacity_statistics())
+        return statistics
+
+    def get_interval_statistics(self) -> dict:
+        """
+        :return: The counters of this port, the capacity statistics scan both caches and are left out (None)
+        """
+        statistics = self.counter_statistics()
+        statistics.update((self.name + '_' + name, None) for name in CAPACITY_STATISTICS)
+        return statistics
+
+    def dump_memory(self, *file_names):
+        """The port holds no data, all files belong to the levels behind it."""
+        self.next_mem.dump_memory(*file_names)
+
+    def print_mem(self, limit=-1):
+        self.next_mem.print_mem(limit)
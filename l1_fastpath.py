@@ -0,0 +1,179 @@
+#!/usr/bin/python
+
+import argparse
+import sys
+import traceback
+from collections import namedtuple
+
+from l1cache import L1Cache
+from main_memory import MainMemory
+from sim import compute_statistics, simulate_cpu
+from sim_constants import CPU_DATA_SIZE
+from trace_reader import BINARY_RECORD_FIELDS, TRACE_OP_STORE, load_trace_records
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the fast path is unavailable without it
+    np = None
+
+
+"""
+    Vectorized fast path for L1 only hierarchies (levels == 1), for timing-only studies.
+
+    L1Cache is direct-mapped, write-back and write-allocate, so whether an access hits depends only on the previous
+    access to the same set: it hits if and only if both have the same tag. The fast path resolves the whole trace at
+    once with NumPy:
+    -   Index and tag arrays are computed for all accesses, with the masks of an L1Cache of the same geometry.
+    -   Accesses are stably sorted by set, so the accesses of each set are consecutive and in trace order.
+    -   An access misses when it is the first of its set, or its tag differs from the previous access of the set.
+    -   Each miss starts a "residency" of a block in the set, which ends with the next miss of the set. The block
+        evicted by a miss is dirty if and only if the previous residency of the set contained a store.
+    Cycles are then summed per outcome, with the same costs the object model charges (see l1_cycle_costs).
+
+    No data is simulated, so memory dumps are not available in this mode.
+"""
+
+# Results of the fast path: the L1 counters, as in L1Cache, and the totals returned by simulate_cpu
+L1FastPathResult = namedtuple('L1FastPathResult', ['read_hits', 'write_hits', 'read_misses', 'write_misses',
+                                                   'dirty_evictions', 'cycles', 'mem_cycles', 'mem_instructions'])
+
+
+def l1_cycle_costs(l1_cache: L1Cache, main_mem: MainMemory) -> (int, int, int):
+    """
+    The cycles the object model charges for each outcome of an L1 access, for L1 directly over main memory.
+    :param l1_cache: L1 Cache object of the simulated geometry
+    :param main_mem: Main memory object
+    :return: (Cycles of a hit,
+              Cycles of a miss - fetching the block from main memory, then accessing the CPU word in L1,
+              Additional cycles when the miss evicts a dirty block - writing it back to main memory)
+    """
+    hit_cycles = l1_cache.transfer_cycles(CPU_DATA_SIZE)
+    block_transfer_cycles = main_mem.transfer_cycles(l1_cache.block_size)
+    return hit_cycles, block_transfer_cycles + hit_cycles, block_transfer_cycles
+
+
+def simulate_l1_records(records, block_size: int, cache_size: int = None) -> L1FastPathResult:
+    """
+    Simulates an L1 only hierarchy over decoded trace records.
+    :param records: Flat uint32 buffer of trace records, BINARY_RECORD_FIELDS per record (see load_trace_records)
+    :param block_size: Block size for L1 cache
+    :param cache_size: Capacity of L1 cache in bytes (optional, L1Cache.CACHE_SIZE_IN_BYTES by default)
+    :return: L1FastPathResult of the simulation
+    """
+    if np is None:
+        raise RuntimeError("The L1 fast path requires NumPy")
+
+    main_mem = MainMemory(None)
+    l1_cache = L1Cache(main_mem, block_size, cache_size)  # Used for its masks and timing only
+    hit_cycles, miss_cycles, writeback_cycles = l1_cycle_costs(l1_cache, main_mem)
+
+    table = np.frombuffer(records, dtype=np.uint32).reshape(-1, BINARY_RECORD_FIELDS)
+    gaps = table[:, 0].astype(np.int64)
+    is_store = table[:, 1] == TRACE_OP_STORE
+    addresses = table[:, 2].astype(np.int64)
+    num_of_accesses = len(addresses)
+    if num_of_accesses == 0:
+        return L1FastPathResult(0, 0, 0, 0, 0, 0, 0, 0)
+
+    indices = (addresses & l1_cache.index_mask) >> l1_cache.offset_bits
+    tags = (addresses & l1_cache.tag_mask) >> (l1_cache.offset_bits + l1_cache.index_bits)
+
+    # Group the accesses of each set together, keeping the trace order within each set
+    order = np.argsort(indices, kind='stable')
+    set_indices = indices[order]
+    set_tags = tags[order]
+    set_stores = is_store[order]
+
+    first_in_set = np.ones(num_of_accesses, dtype=bool)
+    first_in_set[1:] = set_indices[1:] != set_indices[:-1]
+    is_miss = first_in_set.copy()
+    is_miss[1:] |= set_tags[1:] != set_tags[:-1]
+
+    # Residencies are numbered by their starting miss; a miss evicts the previous residency of the same set
+    residency = np.cumsum(is_miss) - 1
+    residency_dirty = np.bincount(residency, weights=set_stores) > 0
+    evicting_misses = residency[is_miss & ~first_in_set]
+    dirty_evictions = int(np.count_nonzero(residency_dirty[evicting_misses - 1]))
+
+    misses = int(np.count_nonzero(is_miss))
+    write_misses = int(np.count_nonzero(is_miss & set_stores))
+    stores = int(np.count_nonzero(is_store))
+    read_misses = misses - write_misses
+    write_hits = stores - write_misses
+    read_hits = num_of_accesses - stores - read_misses
+
+    mem_cycles = (num_of_accesses - misses) * hit_cycles + misses * miss_cycles + dirty_evictions * writeback_cycles
+    cycles = int(gaps.sum()) + mem_cycles
+    return L1FastPathResult(read_hits, write_hits, read_misses, write_misses, dirty_evictions,
+                            cycles, mem_cycles, num_of_accesses)
+
+
+def simulate_l1_fast(trace, block_size: int, cache_size: int = None) -> L1FastPathResult:
+    """
+    Simulates an L1 only hierarchy over a trace file.
+    :param trace: Trace file (text or binary)
+    :param block_size: Block size for L1 cache
+    :param cache_size: Capacity of L1 cache in bytes (optional, L1Cache.CACHE_SIZE_IN_BYTES by default)
+    :return: L1FastPathResult of the simulation
+    """
+    return simulate_l1_records(load_trace_records(trace), block_size, cache_size)
+
+
+def fast_path_statistics(result: L1FastPathResult) -> dict:
+    """
+    :param result: L1FastPathResult of a simulation
+    :return: Dictionary of statistics, as compute_statistics returns for an L1 only simulation
+    """
+    return compute_statistics(result, None, result.cycles, result.mem_cycles, result.mem_instructions)
+
+
+def check_against_model(trace, memin, block_size: int, cache_size: int = None) -> list:
+    """
+    Compares the fast path against the object model (L1Cache over MainMemory) on the same trace.
+    :param trace: Trace file (text or binary)
+    :param memin: Initial state of the main memory
+    :param block_size: Block size for L1 cache
+    :param cache_size: Capacity of L1 cache in bytes (optional, L1Cache.CACHE_SIZE_IN_BYTES by default)
+    :return: List of (statistic name, fast path value, object model value) of mismatching statistics
+    """
+    fast_statistics = fast_path_statistics(simulate_l1_fast(trace, block_size, cache_size))
+
+    l1_cache = L1Cache(MainMemory(memin), block_size, cache_size)
+    cycles_elapsed, mem_cycles_elapsed, mem_instructions_count = simulate_cpu(trace, l1_cache)
+    model_statistics = compute_statistics(l1_cache, None, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count)
+
+    return [(name, fast_statistics[name], value) for name, value in model_statistics.items()
+            if fast_statistics[name] != value]
+
+
+if __name__ == "__main__":
+    """
+    Main function for the L1 fast path: prints the statistics of an L1 only simulation.
+    """
+    parser = argparse.ArgumentParser(description='Vectorized hit / miss and cycle counting for L1 only hierarchies.')
+    parser.add_argument('trace', help='Trace file (text or binary)')
+    parser.add_argument('b1', type=int, help='L1 block size')
+    parser.add_argument('--l1-size', type=int, default=None, help='L1 capacity in bytes')
+    parser.add_argument('--check', metavar='MEMIN', default=None,
+                        help='Compare against the object model, simulated with this memin')
+    args = parser.parse_args()
+
+    try:
+        fast_result = simulate_l1_fast(args.trace, args.b1, args.l1_size)
+        for stat_name, stat_value in fast_path_statistics(fast_result).items():
+            print(stat_name.ljust(20) + ("{0:.4f}".format(stat_value) if isinstance(stat_value, float)
+                                         else str(stat_value)))
+        print('dirty_evictions'.ljust(20) + str(fast_result.dirty_evictions))
+
+        if args.check is not None:
+            check_mismatches = check_against_model(args.trace, args.check, args.b1, args.l1_size)
+            for mismatch in check_mismatches:
+                print('Mismatch: ' + str(mismatch))
+            print('Check ' + ('passed' if not check_mismatches else 'failed'))
+            if check_mismatches:
+                sys.exit(1)
+    except Exception as err:
+        print("Simulation ended with an error.")
+        tb = traceback.format_exc()
+        print(tb)
+        sys.exit(1)
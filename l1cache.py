@@ -1,3 +1,4 @@
+from array import array
 from math import ceil
 from math import log2
 
@@ -8,7 +9,8 @@ class L1Cache(MemoryInterface):
     """
         The Level 1 cache of the system.
         -   Can be connected directly to Main Memory, or to a Level 2 cache.
-        -   Cache type: Direct-mapped, Write-back, Write-allocate.
+        -   Cache type: Direct-mapped, Write-back, Write-allocate (by default, see MemoryInterface.write_through and
+            write_allocate).
         -   Uses 24 bits for address, 32 bit for data (both configurable).
         -   Initializes to 0 for all cells in beginning of each session.
 
@@ -25,8 +27,10 @@ class L1Cache(MemoryInterface):
     MEM_BUS_ACCESS_TIME = 1         # Any additional transfer on bus after accessing for first entry
     ADDRESS_BITS = 24               # Amount of bits allocated for addresses space in cache
 
-    # L1 Cache contents, initialized to 0 until data is accessed
-    data_mem = [0] * CACHE_SIZE_IN_BYTES
+    # L1 Cache contents, initialized to 0 until data is accessed (allocated per instance by the c'tor).
+    # Stored as a single contiguous bytearray, blocks are read and written through memoryview slices of it.
+    data_mem = None
+    data_view = None
     tag_mem = []
 
     # Block size for L1 Cache
@@ -72,13 +76,16 @@ class L1Cache(MemoryInterface):
 
         return mask
 
-    def __init__(self, next_mem_arg: MemoryInterface, block_size: int):
+    def __init__(self, next_mem_arg: MemoryInterface, block_size: int, cache_size: int = None):
         """
         C'tor for L1 Cache object, initialized to 0 for each mem cell in the beginning of each simulation.
         :param next_mem_arg: A pointer to the next memory level in the hierarchy (L2 cache or Main memory)
         :param block_size: Block size for this level of cache (atomic actions operate on this amount of bytes).
+        :param cache_size: Capacity of the cache in bytes (optional, CACHE_SIZE_IN_BYTES by default).
         """
         super(L1Cache, self).__init__(next_mem_arg)  # Call super constructor with next level of hierarchy
+        if cache_size is not None:
+            self.CACHE_SIZE_IN_BYTES = cache_size
         self.block_size = block_size
 
         num_of_blocks = int(self.CACHE_SIZE_IN_BYTES / block_size)
@@ -107,9 +114,17 @@ class L1Cache(MemoryInterface):
         self.dirty_mask = self.create_mask(1, self.dirty_bit_index)
         self.valid_mask = self.create_mask(1, self.valid_bit_index)
 
-        # Initialize the tag memory according to the number of blocks in cache
+        # Initialize the data memory and the tag memory according to the number of blocks in cache
+        self.data_mem = bytearray(self.CACHE_SIZE_IN_BYTES)
+        self.data_view = memoryview(self.data_mem)
         self.tag_mem = [0] * num_of_blocks
 
+    def set_tag_only(self):
+        """Releases the data memory, only the tag memory is kept (see MemoryInterface.set_tag_only)"""
+        self.tag_only = True
+        self.data_mem = bytearray()
+        self.data_view = memoryview(self.data_mem)
+
     def address_to_offset(self, address: int) -> int:
         """
         Return the offset of the address within the block
@@ -185,6 +200,61 @@ class L1Cache(MemoryInterface):
         """
         return self.block_size
 
+    def invalidate_block(self, address: int) -> bool:
+        """
+        Invalidates the block of the address, if present (see MemoryInterface.invalidate_block)
+        """
+        if not self.is_address_present(address):
+            return False
+        index = self.address_to_block_num(address)
+        is_dirty = bool(self.tag_mem[index] & self.dirty_mask)
+        self.tag_mem[index] = 0
+        return is_dirty
+
+    def resident_blocks(self) -> list:
+        return [self.address_from_tag_index(tag_mem_entry & self.tag_mem_mask, index)
+                for index, tag_mem_entry in enumerate(self.tag_mem) if tag_mem_entry & self.valid_mask]
+
+    def warm_access(self, address: int, is_store: bool):
+        """
+        Tag-only update of the cache for an access (see MemoryInterface.warm_access)
+        """
+        index = self.address_to_block_num(address)
+        if is_store and self.warm_write_policy(address):
+            return
+        if self.is_address_present(address):
+            if is_store:
+                self.tag_mem[index] |= self.dirty_mask
+            return
+
+        # Miss: the block is fetched from the next level, then a dirty victim is written back (same order as load)
+        cached_tag_mem = self.tag_mem[index]
+        self.next_mem.warm_access(address - (address % self.block_size), False)
+        if (cached_tag_mem & self.valid_mask) and (cached_tag_mem & self.dirty_mask):
+            flushed_address = self.address_from_tag_index(cached_tag_mem & self.tag_mem_mask, index)
+            self.next_mem.warm_access(flushed_address, True)
+
+        tag_mem_entry = self.address_to_tag(address) | self.valid_mask
+        if is_store:
+            tag_mem_entry |= self.dirty_mask
+        self.tag_mem[index] = tag_mem_entry
+
+    def checkpoint_state(self) -> (dict, dict):
+        """
+        :return: The geometry of the cache, and its data and tag memories (see MemoryInterface.checkpoint_state)
+        """
+        state = {'block_size': self.block_size, 'cache_size': self.CACHE_SIZE_IN_BYTES}
+        return state, {'data_mem': self.data_mem, 'tag_mem': array('I', self.tag_mem)}
+
+    def restore_state(self, state: dict, arrays: dict):
+        """
+        Restores the data and tag memories of a cache of the same geometry (see MemoryInterface.restore_state)
+        """
+        if state != {'block_size': self.block_size, 'cache_size': self.CACHE_SIZE_IN_BYTES}:
+            raise ValueError("Checkpoint of L1 cache does not match its geometry: " + str(state))
+        self.data_mem[:] = arrays['data_mem']
+        self.tag_mem = arrays['tag_mem'].cast('I').tolist()
+
     def flush_if_needed(self, address: int) -> int:
         """
         This callback is triggered after a new block is loaded from the next mem level,
@@ -206,9 +276,11 @@ class L1Cache(MemoryInterface):
         is_dirty = (cached_tag_mem & self.dirty_mask) >> self.dirty_bit_index
 
         cycles_elapsed = 0
+        if is_valid:
+            self.evictions += 1
 
-        # Only flush to next level if block is valid and content is dirty
-        if is_valid and is_dirty:
+        # Only flush to next level if block is valid and content is dirty (or the next level keeps clean victims)
+        if is_valid and (is_dirty or self.next_mem.keeps_clean_victims):
 
             # First read the old block data we should flush (ignore cycles_elapsed, this is not a read operation
             # that sends data over the bus so no cycles should elapse).
@@ -218,12 +290,14 @@ class L1Cache(MemoryInterface):
             # Reconstruct the flushed block address by using the cached tag value and index bits
             tag = cached_tag_mem & self.tag_mem_mask  # Filter out valid, dirty bits
             flushed_address = self.address_from_tag_index(tag, index)
-            cycles_elapsed = self.next_mem.store(flushed_address, self.block_size, data)  # Flush block to next level
+            # Flush block to next level
+            cycles_elapsed = self.next_mem.evict_block(flushed_address, self.block_size, data, bool(is_dirty))
+            self.count_write_traffic(self.block_size)
             self.tag_mem[index] &= ~self.dirty_mask  # Turn dirty bit off
 
         return cycles_elapsed
 
-    def write(self, address: int, mark_dirty: bool, data_size: int, data=[]) -> int:
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
         """
         Save the data to the given address.
         Data will be marked as "valid" and possibly "dirty", according to write-back policy.
@@ -233,7 +307,7 @@ class L1Cache(MemoryInterface):
         :param address: Address to write to, 4 byte aligned
         :param mark_dirty: When true, the written block will be marked as dirty. False when not.
         :param data_size: Data size to write to memory, in amount of bytes
-        :param data: Data to be saved, as a list of bytes, little endian format expected (will be saved as is)
+        :param data: Data to be saved, as a bytes-like object, little endian format expected (will be saved as is)
         :return: (clock cycles elapsed as int - this is the amount of cycles expected to take to transfer the
                   writen data on the bus from the CPU to L1 Cache)
         """
@@ -244,9 +318,10 @@ class L1Cache(MemoryInterface):
         start = block_num * self.block_size + offset  # Note: We read the amount of bytes equal to data_size
         end = start + data_size
 
-        # Copy data to data memory
-        for new_data_cursor, mem_cursor in enumerate(range(start, end)):
-            self.data_mem[mem_cursor] = data[new_data_cursor]
+        # Copy the first data_size bytes of data to data memory, as a single slice assignment.
+        # (a missed block fetched from the next level may be longer than data_size, when its block size is larger)
+        if not self.tag_only:
+            self.data_view[start:end] = data[:data_size]
 
         # Update tag memory, turn both valid and (possibly) dirty bits on
         tag = self.address_to_tag(address)
@@ -261,7 +336,7 @@ class L1Cache(MemoryInterface):
 
         return elapsed_time
 
-    def read(self, address: int, data_size: int) -> (list, int):
+    def read(self, address: int, data_size: int) -> (memoryview, int):
         """
         Perform read operation from the memory, using the memory's inner logic.
         This method assumes the data is stored in the cache, and is valid.
@@ -269,7 +344,8 @@ class L1Cache(MemoryInterface):
         :param data_size: Amount of data in bytes to read from L1 cache memory and return to previous level.
                           Note this is not necessarily the L1Cache block_size: the previous level may request less bytes
                           to transfer on the bus.
-        :return: (data read as list of bytes, clock cycles elapsed as int to pass this data to previous mem level)
+        :return: (data read as a memoryview of bytes, clock cycles elapsed as int to pass this data to previous
+                  mem level)
         """
 
         # Fetch the index bits to choose the block from the data memory
@@ -278,8 +354,8 @@ class L1Cache(MemoryInterface):
         start = block_num * self.block_size + offset  # Note: We read the amount of bytes equal to data_size
         end = start + data_size
 
-        # Read a whole block
-        data_read = self.data_mem[start:end]
+        # Read a whole block (a view into data memory, no copy)
+        data_read = self.NO_DATA[:data_size] if self.tag_only else self.data_view[start:end]
 
         # L1 cache only knows how to read amount of bytes according to L1 Cache block_size, but
         # the CPU may request "less bytes than L1.BlockSize"
@@ -1,3 +1,5 @@
+from array import array
+
 from mem_ifc import MemoryInterface
 from l1cache import L1Cache
 from math import log2, ceil
@@ -10,18 +12,24 @@ class L2Cache(MemoryInterface):
     MEM_HIT_TIME = 4  # In clock cycles
     MEM_BUS_ACCESS_TIME = 1  # Any additional transfer on bus after accessing for first entry
 
-    def __init__(self, next_mem_arg: MemoryInterface, block_size: int):
+    def __init__(self, next_mem_arg: MemoryInterface, block_size: int, cache_size: int = None):
         """
         C'tor for L2 Cache object, initialized to 0 for each mem cell in the beginning of each simulation.
         :param next_mem_arg: A pointer to the next memory level in the hierarchy (L2 cache or Main memory)
         :param block_size: Block size for this level of cache (atomic actions operate on this amount of bytes).
+        :param cache_size: Capacity of the cache in bytes (optional, CACHE_SIZE_IN_BYTES by default).
         """
         super(L2Cache, self).__init__(next_mem_arg)  # Call super constructor with next level of hierarchy
+        if cache_size is not None:
+            self.CACHE_SIZE_IN_BYTES = cache_size
 
         self.block_size = block_size
         num_of_lines = int(self.CACHE_SIZE_IN_BYTES / (self.NUM_OF_WAYS*block_size))
 
-        self.data_mem = [[[0 for i in range(block_size)] for j in range(self.NUM_OF_WAYS)] for k in range(num_of_lines)]
+        # Data memory is a single contiguous bytearray, laid out line after line, and way after way within each line.
+        # Blocks are read and written through memoryview slices of it (see line_offset).
+        self.data_mem = bytearray(num_of_lines * self.NUM_OF_WAYS * block_size)
+        self.data_view = memoryview(self.data_mem)
         self.tag_mem = [[0 for i in range(self.NUM_OF_WAYS)] for j in range(num_of_lines)]
         self.lru_mem = [0 for i in range(num_of_lines)]
 
@@ -44,15 +52,90 @@ class L2Cache(MemoryInterface):
         self.dirty_mask = L1Cache.create_mask(1, self.dirty_bit_index)
         self.valid_mask = L1Cache.create_mask(1, self.valid_bit_index)
 
+    def set_tag_only(self):
+        """Releases the data memory, only the tag and LRU memories are kept (see MemoryInterface.set_tag_only)"""
+        self.tag_only = True
+        self.data_mem = bytearray()
+        self.data_view = memoryview(self.data_mem)
+
     def get_block_size(self) -> int:
         """
         :return: The block size in bytes for L2 Cache
         """
         return self.block_size
 
+    def invalidate_block(self, address: int) -> bool:
+        """
+        Invalidates the block of the address, if present (see MemoryInterface.invalidate_block). Its way becomes the
+        LRU way, the next block of the line fills it.
+        """
+        way = self.address_present_in_way(address)
+        if way == -1:
+            return False
+        index = self.apply_mask(address, self.index_mask, self.offset_bits)
+        is_dirty = bool(self.tag_mem[index][way] & self.dirty_mask)
+        self.tag_mem[index][way] = 0
+        self.lru_mem[index] = way
+        return is_dirty
+
+    def resident_blocks(self) -> list:
+        return [self.address_from_tag_index(self.apply_mask(tag_mem_entry, self.tag_mem_mask, 0), index)
+                for index, line in enumerate(self.tag_mem) for tag_mem_entry in line
+                if tag_mem_entry & self.valid_mask]
+
+    def warm_access(self, address: int, is_store: bool):
+        """
+        Tag-only update of the cache for an access (see MemoryInterface.warm_access)
+        """
+        if is_store and self.warm_write_policy(address):
+            return
+        index = self.apply_mask(address, self.index_mask, self.offset_bits)
+        way = self.address_present_in_way(address)
+        if way == -1:
+            # Miss: the block is fetched from the next level, then the LRU way is replaced (written back if dirty)
+            way = self.lru_mem[index]
+            cached_tag_mem = self.tag_mem[index][way]
+            self.next_mem.warm_access(address - (address % self.block_size), False)
+            if (cached_tag_mem & self.valid_mask) and (cached_tag_mem & self.dirty_mask):
+                tag = self.apply_mask(cached_tag_mem, self.tag_mem_mask, 0)
+                self.next_mem.warm_access(self.address_from_tag_index(tag, index), True)
+            self.tag_mem[index][way] = self.apply_mask(address, self.tag_mask, self.offset_bits + self.index_bits) |\
+                self.valid_mask
+
+        if is_store:
+            self.tag_mem[index][way] |= self.dirty_mask
+        self.lru_mem[index] = 1 - way  # The accessed way becomes the most recently used
+
+    def checkpoint_state(self) -> (dict, dict):
+        """
+        :return: The geometry of the cache, and its data, tag and LRU memories (see MemoryInterface.checkpoint_state)
+        """
+        state = {'block_size': self.block_size, 'cache_size': self.CACHE_SIZE_IN_BYTES}
+        tag_mem = array('I', [entry for line in self.tag_mem for entry in line])
+        return state, {'data_mem': self.data_mem, 'tag_mem': tag_mem, 'lru_mem': bytes(self.lru_mem)}
+
+    def restore_state(self, state: dict, arrays: dict):
+        """
+        Restores the data, tag and LRU memories of a cache of the same geometry (see MemoryInterface.restore_state)
+        """
+        if state != {'block_size': self.block_size, 'cache_size': self.CACHE_SIZE_IN_BYTES}:
+            raise ValueError("Checkpoint of L2 cache does not match its geometry: " + str(state))
+        self.data_mem[:] = arrays['data_mem']
+        tag_mem = arrays['tag_mem'].cast('I').tolist()
+        self.tag_mem = [tag_mem[i:i + self.NUM_OF_WAYS] for i in range(0, len(tag_mem), self.NUM_OF_WAYS)]
+        self.lru_mem = list(arrays['lru_mem'])
+
     def apply_mask(self, num: int, mask: int, shift_right: int) -> int:
         return (num & mask) >> shift_right
 
+    def line_offset(self, index: int, way: int) -> int:
+        """
+        :param index: Index bits of the address (the line number)
+        :param way: The way within the line
+        :return: The offset of the first byte of the block stored in the given line and way, within data_mem.
+        """
+        return (index * self.NUM_OF_WAYS + way) * self.block_size
+
     def address_from_tag_index(self, tag: int, index: int) -> int:
         """
         Construct address from tag and index bits (offset is assumed as 0)
@@ -115,11 +198,20 @@ class L2Cache(MemoryInterface):
         index = self.apply_mask(address, self.index_mask, self.offset_bits)
         cached_tag_mem = self.tag_mem[index][self.lru_mem[index]]
 
+        if self.evict_hook is not None and cached_tag_mem & self.valid_mask:
+            victim_way = self.lru_mem[index]
+            tag = self.apply_mask(cached_tag_mem, self.tag_mem_mask, 0)
+            self.evict_hook(self.address_from_tag_index(tag, index), self.block_size)
+            self.lru_mem[index] = victim_way  # Writes of the hook to the victim don't change the victim
+            cached_tag_mem = self.tag_mem[index][victim_way]
+
         # Check the valid & dirty bits
         is_valid = self.apply_mask(cached_tag_mem, self.valid_mask, self.valid_bit_index)
         is_dirty = self.apply_mask(cached_tag_mem, self.dirty_mask, self.dirty_bit_index)
 
         cycles_elapsed = 0
+        if is_valid:
+            self.evictions += 1
         
         # Only flush to next level if block is valid and content is dirty
         if is_valid and is_dirty:
@@ -134,13 +226,14 @@ class L2Cache(MemoryInterface):
 
             # Flush block to next level
             cycles_elapsed = self.next_mem.store(flushed_address, self.block_size, data)
+            self.count_write_traffic(self.block_size)
 
             # Turn dirty bit off
             self.tag_mem[index][self.lru_mem[index]] &= ~self.dirty_mask
 
         return cycles_elapsed
 
-    def write(self, address: int, mark_dirty: bool, data_size: int, data=[]) -> int:
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
         """
         Save the data to the given address.
         Data will be marked as "valid" and possibly "dirty", according to write-back policy.
@@ -150,22 +243,22 @@ class L2Cache(MemoryInterface):
         :param address: Address to write to, 4 byte aligned
         :param mark_dirty: When true, the written block will be marked as dirty. False when not.
         :param data_size: Data size to write to memory, in amount of bytes
-        :param data: Data to be saved, as a list of bytes, little endian format expected (will be saved as is)
+        :param data: Data to be saved, as a bytes-like object, little endian format expected (will be saved as is)
         :return: (clock cycles elapsed as int - this is the amount of cycles expected to take to transfer the
                   writen data on the bus from the L1 cache to the L2 cache)
         """
         # Fetch the index bits to choose the block from the data memory
         index = self.apply_mask(address, self.index_mask, self.offset_bits)
-        if mark_dirty:
-            way = self.address_present_in_way(address)
-        else:
-            way = self.lru_mem[index]
-        start = self.apply_mask(address, self.offset_mask, 0)   # Offset of address within the block
+        way = self.address_present_in_way(address)
+        if way == -1:
+            way = self.lru_mem[index]  # A block fetched from the next level fills the LRU way
+        start = self.line_offset(index, way) + self.apply_mask(address, self.offset_mask, 0)  # Offset within block
         end = start + data_size
         
-        # Copy data to data memory
-        for new_data_cursor, mem_cursor in enumerate(range(start, end)):
-            self.data_mem[index][way][mem_cursor] = data[new_data_cursor]
+        # Copy the first data_size bytes of data to data memory, as a single slice assignment.
+        # (a missed block fetched from the next level may be longer than data_size, when its block size is larger)
+        if not self.tag_only:
+            self.data_view[start:end] = data[:data_size]
 
         # Update tag memory, turn both valid and (possibly) dirty bits on
         tag = self.apply_mask(address, self.tag_mask, self.offset_bits + self.index_bits)
@@ -182,7 +275,7 @@ class L2Cache(MemoryInterface):
 
         return elapsed_time
 
-    def read(self, address: int, data_size: int) -> (list, int):
+    def read(self, address: int, data_size: int) -> (memoryview, int):
         """
         Perform read operation from the memory, using the memory's inner logic.
         This method assumes the data is stored in the cache, and is valid.
@@ -190,16 +283,17 @@ class L2Cache(MemoryInterface):
         :param data_size: Amount of data in bytes to read from current memory level and return to previous level.
                           Note this is not necessarily the block size: the previous level may request less bytes
                           to transfer on the bus.
-        :return: (data read as list of bytes, clock cycles elapsed as int to pass this data to previous mem level)
+        :return: (data read as a memoryview of bytes, clock cycles elapsed as int to pass this data to previous
+                  mem level)
         """
          # Fetch the index bits to choose the block from the data memory
         index = self.apply_mask(address, self.index_mask, self.offset_bits)
         way = self.address_present_in_way(address)
-        start = self.apply_mask(address, self.offset_mask, 0)   # Offset of address within the block
+        start = self.line_offset(index, way) + self.apply_mask(address, self.offset_mask, 0)  # Offset within block
         end = start + data_size
 
-        # Read a whole data
-        data_read = self.data_mem[index][way][start:end]
+        # Read a whole data (a view into data memory, no copy)
+        data_read = self.NO_DATA[:data_size] if self.tag_only else self.data_view[start:end]
 
         # Update LRU - assuming there are only 2 ways, for more ways needed to implement something more complex
         if self.lru_mem[index] == way:
@@ -212,11 +306,14 @@ class L2Cache(MemoryInterface):
 
         return data_read, elapsed_time
 
-    def mem_table_to_list(self, way: int) -> list:
-        mem_list = []
-        for i in range(len(self.data_mem)):
-            mem_list.extend(self.data_mem[i][way])
-        return mem_list
+    def mem_table_to_list(self, way: int) -> bytes:
+        """
+        :param way: The way to collect
+        :return: The contents of the given way, for all lines in order, as a single bytes object.
+        """
+        num_of_lines = len(self.tag_mem)
+        return b''.join(self.data_view[self.line_offset(i, way):self.line_offset(i, way) + self.block_size]
+                        for i in range(num_of_lines))
         
     def dump_memory(self, *file_names):
         """ Dumps the contents of memory hierarchy to the file names given as argument.
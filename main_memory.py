@@ -1,6 +1,8 @@
+from array import array
 from math import ceil
 
 from mem_ifc import MemoryInterface
+from mem_io import load_mem_file
 
 
 class MainMemory(MemoryInterface):
@@ -16,8 +18,14 @@ class MainMemory(MemoryInterface):
     MEM_ACCESS_TIME = 100                      # In clock cycles
     MEM_BUS_ACCESS_TIME = 1                    # Any additional transfer on bus after accessing for first entry
 
-    # Main memory contents, initialized to 0 until input file is loaded
-    mem = [0] * MAIN_MEM_SIZE_IN_BYTES
+    # Main memory contents are kept in pages, which are only allocated when first written to.
+    # Pages that were never written read back as the memin image, or as zeros if memin doesn't cover them.
+    PAGE_SIZE_IN_BYTES = 4 * 1024
+    PAGE_OFFSET_BITS = 12
+    NUM_OF_PAGES = MAIN_MEM_SIZE_IN_BYTES // PAGE_SIZE_IN_BYTES
+
+    # A single read-only page of zeros, shared by all untouched pages (4K, the only allocation at import time)
+    ZERO_PAGE = memoryview(bytes(PAGE_SIZE_IN_BYTES))
 
     def __init__(self, mem_input_file):
         """
@@ -26,17 +34,106 @@ class MainMemory(MemoryInterface):
                                contents in this file are too short.
                                (assumption: file is valid, each line contains a single byte value for the
                                next sequential memory entry, starting from 0)
+                               May be None, to start from an all zero memory (see load_image).
         """
 
         super(MainMemory, self).__init__(None)  # Call super constructor with no "next" memory (main mem is the last)
-        cursor = 0  # Start writing to mem from address 0
+
+        # Initial image of the memory, as loaded from memin: page number -> read-only page contents.
+        # All zero pages are not kept.
+        self.image_pages = {}
+
+        # Pages written to during the simulation: page number -> writable page contents (memoryview of a bytearray).
+        # A page is copied from the image (or zero page) the first time it is written to.
+        self.pages = {}
 
         # Init main memory from input file
-        with open(mem_input_file, 'r') as mem_in:
-            for line in mem_in:
-                entry = line.rstrip()
-                self.mem[cursor] = int(entry, 16)
-                cursor += 1
+        if mem_input_file is not None:
+            self.load_image(load_mem_file(mem_input_file))
+
+    def load_image(self, image):
+        """
+        Sets the initial contents of main memory, starting from address 0. The rest of the memory is zero.
+        :param image: Initial memory contents, as a bytes-like object.
+        """
+        self.image_pages = {}
+        self.pages = {}
+        for page_start in range(0, len(image), self.PAGE_SIZE_IN_BYTES):
+            page = bytes(image[page_start:page_start + self.PAGE_SIZE_IN_BYTES]).ljust(self.PAGE_SIZE_IN_BYTES, b'\0')
+            if page != self.ZERO_PAGE:
+                self.image_pages[page_start >> self.PAGE_OFFSET_BITS] = memoryview(page)
+
+    def reset(self):
+        """
+        Restores main memory to its initial image and clears the statistics, so the same object can be reused
+        by another simulation run without reloading memin (only the pages written to are dropped).
+        """
+        self.pages = {}
+        self.read_hits = 0
+        self.read_misses = 0
+        self.write_hits = 0
+        self.write_misses = 0
+
+    def set_tag_only(self):
+        """Drops the memory image and all pages, main memory holds no data (see MemoryInterface.set_tag_only)"""
+        self.tag_only = True
+        self.image_pages = {}
+        self.pages = {}
+
+    def warm_access(self, address: int, is_store: bool):
+        """Main memory holds all blocks, there is no state to warm (see MemoryInterface.warm_access)"""
+        pass
+
+    def checkpoint_state(self) -> (dict, dict):
+        """
+        :return: The current contents of all non-zero pages (see MemoryInterface.checkpoint_state)
+        """
+        page_nums = sorted(set(self.image_pages) | set(self.pages))
+        return {}, {'page_nums': array('I', page_nums), 'pages': [self.get_page(num) for num in page_nums]}
+
+    def restore_state(self, state: dict, arrays: dict):
+        """
+        Restores the contents of main memory. The pages are views into the checkpoint and are not copied: they
+        become the initial image of the memory, copied on first write like memin pages (reset returns to them).
+        """
+        pages = arrays['pages']
+        self.image_pages = {}
+        self.pages = {}
+        for i, page_num in enumerate(arrays['page_nums'].cast('I')):
+            self.image_pages[page_num] = pages[i * self.PAGE_SIZE_IN_BYTES:(i + 1) * self.PAGE_SIZE_IN_BYTES]
+
+    def get_page(self, page_num: int) -> memoryview:
+        """
+        :param page_num: Number of the page to fetch
+        :return: The current contents of the page. The view is read-only if the page was never written to.
+        """
+        page = self.pages.get(page_num)
+        if page is None:
+            page = self.image_pages.get(page_num, self.ZERO_PAGE)
+        return page
+
+    def get_writable_page(self, page_num: int) -> memoryview:
+        """
+        :param page_num: Number of the page to fetch
+        :return: The contents of the page as a writable view, allocating the page if it was never written to.
+        """
+        page = self.pages.get(page_num)
+        if page is None:
+            page = memoryview(bytearray(self.image_pages.get(page_num, self.ZERO_PAGE)))
+            self.pages[page_num] = page
+        return page
+
+    def iter_pages(self):
+        """
+        :return: Iterator over the current contents of all pages in order (untouched pages share the same object).
+        """
+        return (self.get_page(page_num) for page_num in range(self.NUM_OF_PAGES))
+
+    def contents(self) -> bytes:
+        """
+        :return: The entire contents of main memory, as a single bytes object.
+        """
+        return b''.join(self.iter_pages())
 
     def transfer_cycles(self, data_size: int) -> int:
         """
@@ -71,34 +168,56 @@ class MainMemory(MemoryInterface):
         """
         raise NotImplementedError('Main memory does not implement flush_if_needed, this is an application error.')
 
-    def write(self, address: int, mark_dirty: bool, data_size: int, data=[]) -> int:
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
         """
         Save the block of data to the given address.
         :param address: Address to write to, 4 byte aligned
         :param mark_dirty: Ignored for Main Memory
         :param data_size: Block size to write to memory, in amount of bytes
-        :param data: Data to be saved, as a list of bytes, little endian format expected (will be saved as is)
+        :param data: Data to be saved, as a bytes-like object, little endian format expected (will be saved as is)
         :return: (clock cycles elapsed as int - this is the amount of cycles expected to take to transfer the
                   writen data on the bus from the PREVIOUS memory level to the current memory level)
         """
 
         # Store data in mem cells from "address" to "address+data_size".
-        for i in range(0, data_size):
-            self.mem[address + i] = data[i]
+        # Assigning through the memoryview copies the block at once, and fails loudly on a size mismatch
+        # (instead of silently resizing the bytearray). Blocks are aligned so they rarely cross a page boundary.
+        if self.tag_only:
+            return self.transfer_cycles(data_size)
+
+        offset = address & (self.PAGE_SIZE_IN_BYTES - 1)
+        if offset + data_size <= self.PAGE_SIZE_IN_BYTES:
+            page = self.get_writable_page(address >> self.PAGE_OFFSET_BITS)
+            page[offset:offset+data_size] = data[:data_size]
+        else:
+            data = bytes(data[:data_size])
+            for i in range(0, data_size):
+                page = self.get_writable_page((address + i) >> self.PAGE_OFFSET_BITS)
+                page[(address + i) & (self.PAGE_SIZE_IN_BYTES - 1)] = data[i]
 
         access_time = self.transfer_cycles(data_size)
         return access_time
 
-    def read(self, address: int, data_size: int) -> (list, int):
+    def read(self, address: int, data_size: int) -> (memoryview, int):
         """
         Perform read operation from the main memory, at the size of data_size.
         This method assumes the data is stored in the memory, and is valid.
         :param address: Address to read from, 4 byte aligned
         :param data_size: Block size to read from memory and return to previous level, in amount of bytes.
-        :return: (data read as list of bytes, clock cycles elapsed as int to pass this data to previous mem level)
+        :return: (data read as a memoryview of bytes, clock cycles elapsed as int to pass this data to previous
+                  mem level)
         """
 
-        data = self.mem[address:address+data_size]
+        if self.tag_only:
+            return self.NO_DATA[:data_size], self.transfer_cycles(data_size)
+
+        offset = address & (self.PAGE_SIZE_IN_BYTES - 1)
+        if offset + data_size <= self.PAGE_SIZE_IN_BYTES:
+            data = self.get_page(address >> self.PAGE_OFFSET_BITS)[offset:offset+data_size]
+        else:
+            data = memoryview(bytes(self.get_page((address + i) >> self.PAGE_OFFSET_BITS)[
+                                        (address + i) & (self.PAGE_SIZE_IN_BYTES - 1)]
+                                    for i in range(0, data_size)))
         access_time = self.transfer_cycles(data_size)
 
         return data, access_time
@@ -114,7 +233,7 @@ class MainMemory(MemoryInterface):
                            beyond it.
         """
         file_name = file_names[0]
-        self.dump_output_file(file_name, self.mem)
+        self.dump_output_file(file_name, self.iter_pages())
 
     def print_mem(self, limit=-1):
         """Prints the contents of the main memory to the console, for debugging and logging purposes.
@@ -122,7 +241,7 @@ class MainMemory(MemoryInterface):
         cursor = 0
         print("Main memory:")
 
-        for entry in self.mem:
+        for entry in self.contents():
             if cursor % 4 == 0:
                 print('\n0x' + str(cursor).zfill(6) + ' ', end="")
             print(hex(entry)[2:] + ' ', end="")
@@ -1,5 +1,7 @@
 import abc
-from sim_constants import CPU_DATA_SIZE
+
+from mem_io import write_mem_file, write_sparse_mem_file
+from sim_constants import CPU_DATA_SIZE, NO_DUMP
 
 
 class MemoryInterface(object):
@@ -12,11 +14,51 @@ class MemoryInterface(object):
     # I.e: L1 Cache can't perform read - it delegates to L2 cache / Main memory
     next_mem = None
 
+    # When true, memory dumps are written in the sparse format (see mem_io) instead of the reference format
+    sparse_dumps = False
+
+    # When true, the previous level hands this level its clean victims too, not only the dirty ones (see evict_block)
+    keeps_clean_victims = False
+
+    # When true, tick is called with the idle cycles of the CPU (non memory instructions), see sim.simulate_cpu
+    clocked = False
+
+    # When true, the level only tracks tags, valid / dirty bits and replacement state, and holds no data (see
+    # set_tag_only). Reads return NO_DATA, writes are not stored, and memory dumps are rejected (see dump_output_file).
+    tag_only = False
+
+    # Called as evict_hook(block address, block size) before the level evicts a valid block to make room for another,
+    # when set (i.e: inclusion.InclusionPort back-invalidates the copies of the block in the level above). The hook
+    # may still write to the block, the write back that follows carries its changes.
+    evict_hook = None
+
+    # Contents returned by reads of tag-only levels: a shared read-only buffer of zeros, sliced to the size read
+    NO_DATA = memoryview(bytes(4 * 1024))
+
+    # Write policies of the level (see store):
+    # -   write_through: stores update the level without marking the block dirty, and are also written to the next
+    #     level (write-back when false: dirty blocks are written to the next level when evicted)
+    # -   write_allocate: a store miss fetches the block into the level first (no-write-allocate when false: the
+    #     store goes around the level, to the next one)
+    write_through = False
+    write_allocate = True
+
     # Statistics
     read_hits = 0
     read_misses = 0
     write_hits = 0
     write_misses = 0
+    evictions = 0  # Valid blocks replaced to make room for others (clean or dirty), counted by the caches
+
+    # Traffic between this level and the next one, counted by the level that sends the data (see count_read_traffic,
+    # count_write_traffic): blocks fetched from the next level, and blocks or words written to it (write backs, write
+    # throughs and stores around a no-write-allocate level). Reported under traffic_name, when set (see
+    # traffic_statistics).
+    traffic_name = None
+    read_transfers = 0
+    read_bytes = 0
+    write_transfers = 0
+    write_bytes = 0
 
     def __init__(self, next_mem_arg):
         """
@@ -57,20 +99,23 @@ class MemoryInterface(object):
         pass
 
     @abc.abstractmethod
-    def read(self, address: int, data_size: int) -> (list, int):
+    def read(self, address: int, data_size: int) -> (memoryview, int):
         """
         Perform read operation from the memory, using the memory's inner logic.
         This method assumes the data is stored in the cache, and is valid.
+        The data is returned as a memoryview into the storage of the current level (no copy is made), so it is only
+        valid until the next operation that modifies the memory hierarchy.
         :param address: Address to read from, 4 byte aligned
         :param data_size: Amount of data in bytes to read from current memory level and return to previous level.
                           Note this is not necessarily the block size: the previous level may request less bytes
                           to transfer on the bus.
-        :return: (data read as list of bytes, clock cycles elapsed as int to pass this data to previous mem level)
+        :return: (data read as a memoryview of bytes, clock cycles elapsed as int to pass this data to previous
+                  mem level)
         """
         pass
 
     @abc.abstractmethod
-    def write(self, address: int, mark_dirty: bool, data_size: int, data=[]) -> int:
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
         """
         Save the data to the given address.
         Data will be marked as "valid" and possibly "dirty", according to write-back policy.
@@ -80,18 +125,19 @@ class MemoryInterface(object):
         :param address: Address to write to, 4 byte aligned
         :param mark_dirty: When true, the written block will be marked as dirty. False when not.
         :param data_size: Data size to write to memory, in amount of bytes
-        :param data: Data to be saved, as a list of bytes, little endian format expected (will be saved as is)
+        :param data: Data to be saved, as a bytes-like object (bytes, bytearray or memoryview) of exactly data_size
+                     bytes, little endian format expected (will be saved as is)
         :return: (clock cycles elapsed as int - this is the amount of cycles expected to take to transfer the
                   writen data on the bus from the PREVIOUS memory level to the current memory level)
         """
         pass
 
-    def load(self, address: int, block_size: int) -> (list, int):
+    def load(self, address: int, block_size: int) -> (memoryview, int):
         """
         Loads data from the given address, and updates statistics. Delegates to next mem level if needed.
         :param address: Address to read from, 4 byte aligned
         :param block_size: Block size the previous memory level requested to read from memory, in amount of bytes
-        :return: (data read as list of bytes, clock cycles elapsed as int)
+        :return: (data read as a bytes-like object, clock cycles elapsed as int)
         """
         if self.is_address_present(address):  # Cache hit (or memory hit)
             self.read_hits += 1
@@ -102,6 +148,11 @@ class MemoryInterface(object):
             # Fetch entire block from next level
             block_start_address = address - (address % self.get_block_size())
             fetched_block, cycles_elapsed = self.next_mem.load(block_start_address, self.get_block_size())
+            self.count_read_traffic(self.get_block_size())
+
+            # The fetched block is a view into the next level's storage, and flushing below may overwrite it there
+            # (i.e: the flushed block evicts it from L2). Take a snapshot of it first, this is a single memcpy.
+            fetched_block = bytes(fetched_block)
 
             # Data now arrived from next level..
             # Before we write it to the current mem level, flush old dirty blocks if needed
@@ -122,24 +173,37 @@ class MemoryInterface(object):
 
             return fetched_block, cycles_elapsed
 
-    def store(self, address: int, block_size: int, data=[]) -> int:
+    def store(self, address: int, block_size: int, data=b'') -> int:
         """
         Save the data to the given address, and updates statistics. Delegates to next mem level if needed.
         :param address: Address to write to, 4 byte aligned
         :param block_size: Block size the previous memory level requested to write to memory, in amount of bytes
-        :param data: Data to be saved, as a list of bytes, little endian format expected (will be saved as is)
+        :param data: Data to be saved, as a bytes-like object, little endian format expected (will be saved as is)
         :return: (clock cycles elapsed as int)
         """
         if self.is_address_present(address):
             self.write_hits += 1
+            if self.write_through:
+                # The block stays clean here, the store is written to the next level as well
+                cycles_elapsed = self.write(address, False, block_size, data)
+                return cycles_elapsed + self.write_to_next(address, block_size, data)
             mark_dirty = True
             return self.write(address, mark_dirty, block_size, data)
         else:
             self.write_misses += 1
 
+            if not self.write_allocate:
+                # No-write-allocate: the store crosses the bus to this level, and goes around it to the next one
+                return self.transfer_cycles(block_size) + self.write_to_next(address, block_size, data)
+
             # Fetch entire block from next level
             block_start_address = address - (address % self.get_block_size())
             fetched_block, cycles_elapsed = self.next_mem.load(block_start_address, self.get_block_size())
+            self.count_read_traffic(self.get_block_size())
+
+            # The fetched block is a view into the next level's storage, and flushing below may overwrite it there
+            # (i.e: the flushed block evicts it from L2). Take a snapshot of it first, this is a single memcpy.
+            fetched_block = bytes(fetched_block)
 
             # Data now arrived from next level..
             # Before we write it to the current mem level, flush old dirty blocks if needed
@@ -154,25 +218,192 @@ class MemoryInterface(object):
 
             # Now update the cache with the new data we've been tasked to store.
             # Here we pay the "hit time" - of transferring data on the bus between the prev and current memory levels.
-            mark_dirty = True
+            mark_dirty = not self.write_through
             write_cycles = self.write(address, mark_dirty, block_size, data)
             cycles_elapsed += write_cycles
+            if self.write_through:
+                cycles_elapsed += self.write_to_next(address, block_size, data)
 
             return cycles_elapsed
 
+    def write_to_next(self, address: int, data_size: int, data) -> int:
+        """
+        Writes a store through (or around) the current memory level to the next one (see write_through,
+        write_allocate).
+        :param address: Address of the store
+        :param data_size: Size of the store in bytes
+        :param data: Data of the store
+        :return: (clock cycles elapsed as int - the latency of the store in the next level)
+        """
+        self.count_write_traffic(data_size)
+        return self.next_mem.store(address, data_size, data)
+
+    def count_read_traffic(self, data_size: int):
+        """Counts a block fetched from the next level (see traffic_name)."""
+        self.read_transfers += 1
+        self.read_bytes += data_size
+
+    def count_write_traffic(self, data_size: int):
+        """Counts a block or word written to the next level (see traffic_name)."""
+        self.write_transfers += 1
+        self.write_bytes += data_size
+
+    def prefetch(self, address: int) -> int:
+        """
+        Brings the block of the given address into the current memory level ahead of demand, if it is not present.
+        Same as the miss path of load, but the access is not counted in the statistics of this level.
+        :param address: Address to prefetch, 4 byte aligned
+        :return: (clock cycles elapsed as int - the latency of the prefetch, 0 if the block is already present)
+        """
+        if self.is_address_present(address):
+            return 0
+
+        block_start_address = address - (address % self.get_block_size())
+        fetched_block, cycles_elapsed = self.next_mem.load(block_start_address, self.get_block_size())
+        self.count_read_traffic(self.get_block_size())
+        fetched_block = bytes(fetched_block)  # Snapshot before flushing, see load
+        cycles_elapsed += self.flush_if_needed(address)
+        self.write(block_start_address, False, self.get_block_size(), fetched_block)
+        return cycles_elapsed
+
+    def evict_block(self, address: int, block_size: int, data, is_dirty: bool) -> int:
+        """
+        Called by the previous level when it evicts a block. By default only dirty blocks are written (stored) to
+        this level, levels that set keeps_clean_victims receive the clean ones as well.
+        :param address: Address of the evicted block
+        :param block_size: Block size of the previous level
+        :param data: Contents of the block, as a bytes-like object (may be a view into the previous level)
+        :param is_dirty: True if the block was modified in the previous level
+        :return: (clock cycles elapsed as int)
+        """
+        if is_dirty:
+            return self.store(address, block_size, data)
+        return 0
+
+    def invalidate_block(self, address: int) -> bool:
+        """
+        Invalidates the block of the given address in the current memory level, if present, without writing it back.
+        :param address: Address within the block
+        :return: True if the block was present and dirty (its changes are discarded, the caller writes them back)
+        """
+        raise NotImplementedError(type(self).__name__ + " does not support invalidations")
+
+    def resident_blocks(self) -> list:
+        """
+        :return: Start addresses of the blocks the current memory level holds (see inclusion.InclusionPort)
+        """
+        raise NotImplementedError(type(self).__name__ + " does not list its blocks")
+
+    def set_tag_only(self):
+        """
+        Switches the current memory level to tag-only mode (see tag_only), before the simulation starts.
+        Statistics and cycles are the same as in the full mode, only the data is not moved. Levels that hold data
+        release it, levels that only pass data along (buffers, stages) keep working on the NO_DATA contents.
+        """
+        self.tag_only = True
+
+    def tick(self, now: int, idle_cycles: int):
+        """
+        Called for levels that set clocked before each access of the CPU (deepest level first), with the non memory
+        instructions executed since the previous access: the memory hierarchy is idle for idle_cycles cycles (maybe
+        0), starting at cycle now, and the access starts at now + idle_cycles. Levels may use them for background
+        work, or to follow the time of the CPU.
+        :param now: The cycle the idle period starts at
+        :param idle_cycles: Length of the idle period, in cycles
+        """
+        pass
+
+    def warm_access(self, address: int, is_store: bool):
+        """
+        Functional warming (see sampling.py): updates the tags, dirty bits and replacement state of the current
+        memory level for an access, as load / store would, without moving data, counting statistics or cycles.
+        Blocks and write backs are warmed through the next levels the same way.
+        :param address: Accessed address (for fills from the previous level: the block start address)
+        :param is_store: True for stores (and write backs from the previous level), False for loads (and fills)
+        """
+        raise NotImplementedError(type(self).__name__ + " does not support functional warming")
+
+    def warm_write_policy(self, address: int) -> bool:
+        """
+        Functional warming of a store to a write-through or no-write-allocate level, as store does: a store around
+        the level only warms the next level, a store written through warms the block here as a clean fill (a load)
+        and the store in the next level.
+        :param address: Address of the store
+        :return: True if the store was warmed, False for write-back write-allocate levels, which warm it themselves
+        """
+        if not self.write_allocate and not self.is_address_present(address):
+            self.next_mem.warm_access(address, True)
+            return True
+        if self.write_through:
+            self.warm_access(address, False)
+            self.next_mem.warm_access(address, True)
+            return True
+        return False
+
+    def checkpoint_state(self) -> (dict, dict):
+        """
+        Captures the state of the current memory level for a checkpoint (see checkpoint.py).
+        Statistics counters are captured by the checkpoint itself, levels only capture their contents.
+        :return: (Small state and parameters, as a JSON serializable dictionary,
+                  Large arrays, as a dictionary of name -> bytes-like object or list of bytes-like segments)
+        """
+        raise NotImplementedError(type(self).__name__ + " does not support checkpoints")
+
+    def restore_state(self, state: dict, arrays: dict):
+        """
+        Restores the state of the current memory level from a checkpoint.
+        :param state: Small state and parameters, as returned by checkpoint_state
+        :param arrays: Large arrays, as name -> read-only memoryview (of the memory-mapped checkpoint file)
+        """
+        raise NotImplementedError(type(self).__name__ + " does not support checkpoints")
+
+    def get_extra_statistics(self) -> dict:
+        """
+        Components that collect statistics beyond the hit / miss counters return them here, to be appended to the
+        stats file (see sim.collect_extra_statistics).
+        :return: Dictionary of statistic name -> value, empty by default
+        """
+        return {}
+
+    def get_interval_statistics(self) -> dict:
+        """
+        The extra statistics of a snapshot taken during the run (see sim_stats). Statistics that are costly to
+        collect (i.e: scans of the contents of the caches) are only collected at the end of the run, they are None
+        in the snapshots.
+        :return: Dictionary of statistic name -> value, get_extra_statistics by default
+        """
+        return self.get_extra_statistics()
+
+    def traffic_statistics(self) -> dict:
+        """
+        :return: The traffic between the current memory level and the next one, as a dictionary of statistic name
+                 -> value prefixed by traffic_name (empty when traffic_name is not set)
+        """
+        if self.traffic_name is None:
+            return {}
+        return {
+            self.traffic_name + '_read_transfers': self.read_transfers,
+            self.traffic_name + '_read_bytes': self.read_bytes,
+            self.traffic_name + '_write_transfers': self.write_transfers,
+            self.traffic_name + '_write_bytes': self.write_bytes,
+        }
+
     def dump_output_file(self, file_name, mem):
         """
         Helper method for dumping contents of memory to a single output file.
         :param file_name: The path of output file + name.
-        :param mem: The mem (list format, iterable expected) to be dumped to file
-        """
-        cursor = 0  # Count number of elements printed, for newline control
-        with open(file_name, 'w') as mem_out:
-            for entry in mem:
-                mem_out.write(str(hex(entry)[2:]).upper().zfill(2))  # Pad with 2 zeros, to uppercase, hex-format
-                cursor += 1
-                if len(mem) != cursor:  # Avoid newline at eof
-                    mem_out.write("\n")
+        :param mem: The mem to be dumped to file, as a bytes-like object, or an iterable of bytes-like segments
+                    to be dumped one after the other. Nothing is written when file_name is NO_DUMP.
+        """
+        if file_name == NO_DUMP:
+            return  # The dump still runs through the hierarchy, so buffered blocks are written back
+        if self.tag_only:
+            raise ValueError(type(self).__name__ + " is in tag-only mode, it has no contents to dump to " +
+                             str(file_name))
+        if self.sparse_dumps:
+            write_sparse_mem_file(file_name, mem)
+        else:
+            write_mem_file(file_name, mem)
 
     @abc.abstractmethod
     def dump_memory(self, *file_names):
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+
+import sys
+
+
+"""
+    Bulk readers and writers for the memory files of the simulator.
+
+    Reference format (memin.txt, memout.txt, l1.txt, ...): a byte per line, as 2 uppercase hex digits,
+    no newline at end of file.
+
+    Sparse format: only the non-zero ranges of the memory are written, which keeps dumps of the mostly empty
+    16MB main memory small. The first line is a header holding the size of the dumped memory, then each line holds
+    a range as "<start address hex> <hex bytes>":
+        #sparse 16777216
+        000100 0A0B000C
+        004000 FF
+    Use "mem_io.py expand <sparse file> <output file>" to expand it back to the reference format (i.e: for diffing).
+"""
+
+SPARSE_HEADER = '#sparse'
+
+# Granularity of ranges in sparse dumps, zeros are trimmed from both ends of each range
+SPARSE_RANGE_SIZE = 4 * 1024
+
+
+def load_mem_file(file_name) -> bytes:
+    """
+    Loads a memory file in the reference (byte per line) format.
+    :param file_name: Path of memory file
+    :return: Contents of the memory file, byte after byte
+    """
+    with open(file_name, 'rb') as mem_in:
+        contents = mem_in.read()
+
+    # Fast path: all lines are exactly 2 hex digits, so the whole file decodes in a single call
+    num_of_lines = contents.count(b'\n') + (1 if contents and not contents.endswith(b'\n') else 0)
+    digits = contents.translate(None, b' \t\r\n')
+    if len(digits) == 2 * num_of_lines:
+        try:
+            return bytes.fromhex(digits.decode('ascii'))
+        except ValueError:
+            pass
+
+    # Irregular lines (single digit bytes, empty lines) are parsed one at a time
+    return bytes(int(line, 16) for line in contents.split())
+
+
+def format_mem_lines(mem) -> str:
+    """
+    :param mem: Memory contents, as a bytes-like object
+    :return: The contents in the reference format: a byte per line as 2 uppercase hex digits, no trailing newline
+    """
+    return memoryview(mem).hex('\n').upper()
+
+
+def write_mem_file(file_name, segments):
+    """
+    Writes memory contents to a file in the reference format.
+    :param file_name: Path of output file
+    :param segments: The memory contents, as a bytes-like object or as an iterable of bytes-like segments that
+                     are written one after the other. A segment repeated in a row (the same object, i.e: a shared
+                     page of zeros) is formatted only once.
+    """
+    if isinstance(segments, (bytes, bytearray, memoryview)):
+        segments = [segments]
+
+    last_segment = None
+    last_lines = ''
+    is_first_line = True
+    with open(file_name, 'w') as mem_out:
+        for segment in segments:
+            if segment is not last_segment:
+                last_segment = segment
+                last_lines = format_mem_lines(segment)
+            if not last_lines:
+                continue
+            if not is_first_line:
+                mem_out.write('\n')  # Avoid newline at eof
+            mem_out.write(last_lines)
+            is_first_line = False
+
+
+def write_sparse_mem_file(file_name, segments):
+    """
+    Writes memory contents to a file in the sparse format, only non-zero ranges are written.
+    :param file_name: Path of output file
+    :param segments: The memory contents, as a bytes-like object or as an iterable of bytes-like segments that
+                     are written one after the other.
+    """
+    if isinstance(segments, (bytes, bytearray, memoryview)):
+        segments = [segments]
+
+    ranges = []
+    address = 0
+    for segment in segments:
+        segment = memoryview(segment)
+        for start in range(0, len(segment), SPARSE_RANGE_SIZE):
+            data = segment[start:start + SPARSE_RANGE_SIZE].tobytes()
+            trimmed = data.lstrip(b'\0')
+            if trimmed:
+                range_start = address + start + len(data) - len(trimmed)
+                ranges.append(format(range_start, '06X') + ' ' + trimmed.rstrip(b'\0').hex().upper())
+        address += len(segment)
+
+    with open(file_name, 'w') as mem_out:
+        mem_out.write(SPARSE_HEADER + ' ' + str(address))
+        for line in ranges:
+            mem_out.write('\n' + line)
+
+
+def is_sparse_mem_file(file_name) -> bool:
+    """
+    :param file_name: Path of memory file
+    :return: True if the file is in the sparse format, False otherwise
+    """
+    with open(file_name, 'r') as mem_in:
+        return mem_in.read(len(SPARSE_HEADER)) == SPARSE_HEADER
+
+
+def load_sparse_mem_file(file_name) -> bytearray:
+    """
+    Loads a memory file in the sparse format.
+    :param file_name: Path of sparse memory file
+    :return: The full contents of the memory, zeros included
+    """
+    with open(file_name, 'r') as mem_in:
+        header = mem_in.readline().split()
+        mem = bytearray(int(header[1]))
+        for line in mem_in:
+            if not line.strip():
+                continue
+            start, data = line.split()
+            data = bytes.fromhex(data)
+            mem[int(start, 16):int(start, 16) + len(data)] = data
+    return mem
+
+
+def expand_sparse_mem_file(sparse_file_name, file_name):
+    """
+    Converts a memory file in the sparse format back to the reference format.
+    :param sparse_file_name: Path of sparse memory file
+    :param file_name: Path of output file, in the reference format
+    """
+    write_mem_file(file_name, load_sparse_mem_file(sparse_file_name))
+
+
+if __name__ == "__main__":
+    """
+    Memory file tools.
+    Usage: mem_io.py expand <sparse file> <output file>
+    """
+    if len(sys.argv) != 4 or sys.argv[1] != 'expand':
+        print("Usage: mem_io.py expand <sparse file> <output file>")
+        exit(1)
+
+    expand_sparse_mem_file(sys.argv[2], sys.argv[3])
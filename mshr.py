@@ -0,0 +1,126 @@
+import heapq
+
+
+"""
+    Non-blocking timing model: caches with MSHRs (miss status holding registers), where misses overlap.
+
+    The functional simulation is unchanged: every access still goes through the hierarchy serially, and its cycles
+    are those of the serial model. This model replays the same accesses on a separate clock, where a miss of the
+    first level only occupies an MSHR for its latency instead of stalling the CPU:
+    -   A primary miss allocates an MSHR, which is busy until the block arrives (now + latency of the miss).
+    -   A secondary miss - an access to a block whose miss is still in flight - merges into its MSHR.
+    -   When all MSHRs are busy, the CPU stalls until the earliest one completes.
+    -   Hits, primary and secondary misses take the hit time of the first level to issue.
+    The trace holds no dependencies between accesses, so they are assumed independent: the CPU never waits for the
+    data of a load, only for a free MSHR, and for all outstanding misses at the end of the trace.
+    With a single MSHR misses cannot overlap each other, though hits still proceed under a miss.
+    The serial model (see sim.simulate_cpu) stays the reference: its cycles are still the ones in the stats file.
+
+    Statistics (see get_extra_statistics):
+    -   mshr_cycles: total cycles of the simulation in this model
+    -   mshr_primary_misses, mshr_merged_misses: misses that allocated an MSHR / merged into an in-flight one
+    -   mshr_stall_cycles, mshr_full_stalls: cycles / times the CPU waited for a free MSHR
+    -   mshr_mlp: memory level parallelism, average amount of outstanding misses while at least one is outstanding
+    -   mshr_occupancy: average amount of busy MSHRs over the whole simulation
+    -   mshr_peak_occupancy: maximal amount of busy MSHRs
+"""
+
+
+class MSHRTimingModel(object):
+    """
+    Overlapping-miss timing of the first level of the hierarchy, see the module documentation.
+    """
+
+    def __init__(self, num_of_mshrs: int, block_size: int, hit_time: int):
+        """
+        :param num_of_mshrs: Number of MSHRs of the first level
+        :param block_size: Block size of the first level, misses to the same block merge
+        :param hit_time: Cycles to issue an access to the first level
+        """
+        if num_of_mshrs < 1:
+            raise ValueError("At least one MSHR is required, got " + str(num_of_mshrs))
+        self.num_of_mshrs = num_of_mshrs
+        self.block_size = block_size
+        self.hit_time = hit_time
+
+        self.now = 0
+        self.completions = []  # Heap of (completion cycle, block address) of busy MSHRs
+        self.in_flight = {}    # Block address -> completion cycle of its MSHR
+
+        self.primary_misses = 0
+        self.merged_misses = 0
+        self.stall_cycles = 0
+        self.full_stalls = 0
+        self.peak_occupancy = 0
+        self.busy_cycles = 0       # Sum of the latencies of all MSHR allocations
+        self.covered_cycles = 0    # Cycles with at least one MSHR busy
+        self.covered_until = 0
+
+    def retire(self, now: int):
+        """
+        Frees the MSHRs of all misses completed by the given cycle.
+        :param now: Current cycle
+        """
+        completions = self.completions
+        while completions and completions[0][0] <= now:
+            completion, block_address = heapq.heappop(completions)
+            if self.in_flight.get(block_address) == completion:
+                del self.in_flight[block_address]
+
+    def access(self, gap_cycles: int, address: int, is_miss: bool, serial_cycles: int):
+        """
+        Replays an access of the trace.
+        :param gap_cycles: Cycles of non memory instructions before the access
+        :param address: Accessed address
+        :param is_miss: True if the access missed the first level
+        :param serial_cycles: Cycles of the access in the serial model (the latency of the miss, for misses)
+        """
+        self.now += gap_cycles
+        self.retire(self.now)
+
+        block_address = address - (address % self.block_size)
+        if block_address in self.in_flight:
+            self.merged_misses += 1
+        elif is_miss:
+            if len(self.completions) == self.num_of_mshrs:
+                # All MSHRs are busy, wait for the earliest to complete
+                earliest = self.completions[0][0]
+                self.stall_cycles += earliest - self.now
+                self.full_stalls += 1
+                self.now = earliest
+                self.retire(self.now)
+
+            completion = self.now + serial_cycles
+            heapq.heappush(self.completions, (completion, block_address))
+            self.in_flight[block_address] = completion
+            self.primary_misses += 1
+            self.peak_occupancy = max(self.peak_occupancy, len(self.completions))
+
+            # Intervals start in non decreasing order, so their union is accumulated on the fly
+            self.busy_cycles += serial_cycles
+            self.covered_cycles += max(0, completion - max(self.now, self.covered_until))
+            self.covered_until = max(self.covered_until, completion)
+
+        self.now += self.hit_time
+
+    def total_cycles(self) -> int:
+        """
+        :return: Cycles of the simulation so far, including the outstanding misses
+        """
+        return max(self.now, self.covered_until)
+
+    def get_extra_statistics(self) -> dict:
+        """
+        :return: The statistics of this model (see module documentation)
+        """
+        total_cycles = self.total_cycles()
+        return {
+            'mshr_cycles': total_cycles,
+            'mshr_primary_misses': self.primary_misses,
+            'mshr_merged_misses': self.merged_misses,
+            'mshr_stall_cycles': self.stall_cycles,
+            'mshr_full_stalls': self.full_stalls,
+            'mshr_mlp': self.busy_cycles / self.covered_cycles if self.covered_cycles > 0 else 0.0,
+            'mshr_occupancy': self.busy_cycles / total_cycles if total_cycles > 0 else 0.0,
+            'mshr_peak_occupancy': self.peak_occupancy,
+        }
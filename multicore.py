@@ -0,0 +1,276 @@
+import heapq
+from collections import namedtuple
+
+from l1cache import L1Cache
+from l2cache import L2Cache
+from mem_ifc import MemoryInterface
+from sim_constants import CPU_DATA_SIZE
+from trace_reader import TRACE_OP_STORE, chunk_records, read_trace
+
+
+"""
+    Multi-core hierarchy: several CPUs, each with a private L1 cache, sharing the next levels (L2 cache and main
+    memory). The private caches are kept coherent with a snooping MESI protocol.
+
+    MESI states of a line of a private L1, on top of the valid and dirty bits of L1Cache:
+    -   Modified: valid and dirty
+    -   Exclusive: valid, clean and not shared
+    -   Shared: valid, clean and shared (other caches may hold the block)
+    -   Invalid: not valid
+    Every miss of a private L1 is snooped by all other private caches (see SnoopingBus):
+    -   A read miss finds the block in other caches: a Modified copy is written back to the shared level, and all
+        copies become Shared. The requester gets the block Shared, or Exclusive when no other cache holds it.
+    -   A write miss (read for ownership) writes back a Modified copy, and invalidates all other copies.
+    -   A write hit on a Shared line is an upgrade: all other copies are invalidated (UPGRADE_TIME cycles on the bus).
+        A write hit on an Exclusive line becomes Modified silently.
+    Snoops are looked up in parallel with the shared level, so only write backs and upgrades add cycles. With a
+    single core there is never a Shared line, and the simulation is the same as the single core hierarchy.
+
+    Each core has its own clock. The cores execute their traces interleaved on a common time line: the core whose
+    next access is the earliest executes first (ties go to the lowest core). Contention on the shared levels is only
+    modeled by buses in front of them (see bus.py), otherwise an access takes the same cycles as if it were alone.
+
+    Coherence statistics of each private cache (see CoherentL1Cache.get_extra_statistics):
+    -   coherence_misses: misses of blocks that were invalidated in this cache by another core
+    -   invalidations: copies of this cache invalidated by other cores
+    -   upgrades: write hits on Shared lines, that invalidated the other copies
+    -   coherence_writebacks: Modified copies of this cache written back because another core missed on them
+"""
+
+# Statistics counters of each cache level
+COUNTER_NAMES = ('read_hits', 'write_hits', 'read_misses', 'write_misses')
+
+# Counters summed over the private caches of all cores, in place of a cache object for sim.compute_statistics
+LevelTotals = namedtuple('LevelTotals', COUNTER_NAMES)
+
+
+class CoherentL1Cache(L1Cache):
+    """
+    A private L1 cache of a core, kept coherent with the other private caches by a SnoopingBus (see module
+    documentation).
+    """
+
+    UPGRADE_TIME = 1  # Cycles of the bus transaction invalidating the other copies on an upgrade
+
+    def __init__(self, next_mem_arg: MemoryInterface, block_size: int, cache_size: int = None):
+        super(CoherentL1Cache, self).__init__(next_mem_arg, block_size, cache_size)
+        self.bus = None
+
+        num_of_blocks = len(self.tag_mem)
+        self.shared = bytearray(num_of_blocks)       # Shared state of each line (valid lines only)
+        self.invalidated = bytearray(num_of_blocks)  # Lines invalidated by another core, their tag is kept
+
+        # Statistics
+        self.coherence_misses = 0
+        self.invalidations = 0
+        self.upgrades = 0
+        self.coherence_writebacks = 0
+
+    def count_miss(self, address: int):
+        """
+        Counts a miss as a coherence miss, if the block was invalidated in this line by another core.
+        :param address: Address of the missed access
+        """
+        index = self.address_to_block_num(address)
+        if self.invalidated[index] and (self.tag_mem[index] & self.tag_mem_mask) == self.address_to_tag(address):
+            self.coherence_misses += 1
+        self.invalidated[index] = 0
+
+    def snoop(self, address: int, invalidate: bool) -> (bool, int):
+        """
+        Handles a miss of another core on the bus: a Modified copy is written back to the shared level, then the
+        copy is either invalidated or becomes Shared.
+        :param address: Address of the missed block
+        :param invalidate: True to invalidate the copy (write miss or upgrade), False to share it (read miss)
+        :return: (True if this cache holds the block, clock cycles elapsed for the write back)
+        """
+        if not self.is_address_present(address):
+            return False, 0
+
+        index = self.address_to_block_num(address)
+        cycles_elapsed = 0
+        if self.tag_mem[index] & self.dirty_mask:
+            block_start_address = address - (address % self.block_size)
+            data = self.read(block_start_address, self.block_size)[0]
+            cycles_elapsed = self.next_mem.evict_block(block_start_address, self.block_size, data, True)
+            self.count_write_traffic(self.block_size)
+            self.tag_mem[index] &= ~self.dirty_mask
+            self.coherence_writebacks += 1
+
+        if invalidate:
+            self.tag_mem[index] &= ~self.valid_mask
+            self.invalidated[index] = 1
+            self.invalidations += 1
+        else:
+            self.shared[index] = 1
+        return True, cycles_elapsed
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Loads as L1Cache does, a miss is snooped by the other cores first.
+        """
+        if self.is_address_present(address):
+            return super(CoherentL1Cache, self).load(address, block_size)
+
+        self.count_miss(address)
+        is_shared, cycles_elapsed = self.bus.snoop(self, address, False)
+        data, load_cycles = super(CoherentL1Cache, self).load(address, block_size)
+        self.shared[self.address_to_block_num(address)] = is_shared
+        return data, cycles_elapsed + load_cycles
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Stores as L1Cache does, with an upgrade on a Shared line and a read for ownership on a miss.
+        """
+        index = self.address_to_block_num(address)
+        cycles_elapsed = 0
+        if self.is_address_present(address):
+            if self.shared[index]:
+                self.upgrades += 1
+                cycles_elapsed = self.bus.snoop(self, address, True)[1] + self.UPGRADE_TIME
+        else:
+            self.count_miss(address)
+            cycles_elapsed = self.bus.snoop(self, address, True)[1]
+
+        cycles_elapsed += super(CoherentL1Cache, self).store(address, block_size, data)
+        self.shared[index] = 0  # Modified
+        return cycles_elapsed
+
+    def get_extra_statistics(self) -> dict:
+        return {
+            'coherence_misses': self.coherence_misses,
+            'invalidations': self.invalidations,
+            'upgrades': self.upgrades,
+            'coherence_writebacks': self.coherence_writebacks,
+        }
+
+    def dump_private_memory(self, file_name):
+        """
+        Dumps the contents of this cache only (the shared levels are dumped through the first core).
+        :param file_name: Output file name
+        """
+        self.dump_output_file(file_name, self.data_mem)
+
+
+class SnoopingBus(object):
+    """
+    Connects the private caches of all cores, and broadcasts their misses and upgrades to each other.
+    """
+
+    def __init__(self, caches):
+        """
+        :param caches: The private caches of all cores
+        """
+        self.caches = caches
+        for cache in caches:
+            cache.bus = self
+
+    def snoop(self, requester: CoherentL1Cache, address: int, invalidate: bool) -> (bool, int):
+        """
+        Broadcasts a miss or an upgrade of a private cache to all the other ones.
+        :param requester: The private cache that missed or upgrades
+        :param address: Accessed address
+        :param invalidate: True for write misses and upgrades (the other copies are invalidated), False for reads
+        :return: (True if any other cache held the block, clock cycles elapsed for write backs)
+        """
+        is_shared = False
+        cycles_elapsed = 0
+        for cache in self.caches:
+            if cache is not requester:
+                is_present, snoop_cycles = cache.snoop(address, invalidate)
+                is_shared = is_shared or is_present
+                cycles_elapsed += snoop_cycles
+        return is_shared, cycles_elapsed
+
+
+def build_multicore_hierarchy(levels, b1, b2, main_mem, num_of_cores, l1_size=None,
+                              l2_size=None) -> (list, L2Cache):
+    """
+    Constructs a coherent private L1 cache per core on top of the shared levels (see sim.build_hierarchy).
+    :param levels: Number of cache levels (1 or 2 - the L2 cache is shared)
+    :param b1: Size of blocks for the L1 caches
+    :param b2: Size of blocks for the L2 cache (ignored when levels is 1)
+    :param main_mem: The MainMemory object, last level of the hierarchy
+    :param num_of_cores: Number of cores
+    :param l1_size: Capacity of each L1 cache in bytes (optional)
+    :param l2_size: Capacity of the L2 cache in bytes (optional)
+    :return: (L1 cache objects - one per core, L2 cache object or None when levels is 1)
+    """
+    if num_of_cores < 1:
+        raise ValueError("At least one core is required, got " + str(num_of_cores))
+    if levels == 1:
+        l2_cache = None
+        shared_level = main_mem
+    elif levels == 2:
+        l2_cache = L2Cache(main_mem, b2, l2_size)
+        shared_level = l2_cache
+    else:
+        raise ValueError("Invalid levels argument: " + str(levels))
+
+    l1_caches = [CoherentL1Cache(shared_level, b1, l1_size) for core in range(num_of_cores)]
+    SnoopingBus(l1_caches)
+    return l1_caches, l2_cache
+
+
+def simulate_multicore(traces, l1_caches) -> list:
+    """
+    Simulates the cores executing their traces, interleaved on a common time line (see module documentation).
+    :param traces: Trace file of each core (text or binary), or iterables of TraceChunk objects
+    :param l1_caches: The private cache of each core
+    :return: For each core: (Amount of clock cycles the core took, Amount of clock cycles only its memory
+             operations took, Amount of store / load instructions it executed)
+    """
+    counters = [[0, 0, 0] for core in l1_caches]
+
+    # Levels of each core that follow its time (see MemoryInterface.tick), deepest first. Shared levels (i.e: a bus)
+    # follow the time of the core accessing them.
+    clocked_levels = []
+    for l1_cache in l1_caches:
+        core_clocked_levels = []
+        mem_level = l1_cache
+        while mem_level is not None:
+            if mem_level.clocked:
+                core_clocked_levels.insert(0, mem_level)
+            mem_level = mem_level.next_mem
+        clocked_levels.append(core_clocked_levels)
+
+    core_records = []
+    for trace in traces:
+        trace_chunks = read_trace(trace) if isinstance(trace, str) else trace
+        core_records.append(record for chunk in trace_chunks for record in chunk_records(chunk))
+
+    # Next access of each core: (cycle it starts at, core, record), earliest first
+    pending = []
+    for core, records in enumerate(core_records):
+        record = next(records, None)
+        if record is not None:
+            heapq.heappush(pending, (record[0], core, record))
+
+    while pending:
+        start_cycle, core, (num_of_cycles_passed, op, address, data) = heapq.heappop(pending)
+        for mem_level in clocked_levels[core]:
+            mem_level.tick(start_cycle - num_of_cycles_passed, num_of_cycles_passed)
+        mem_interface = l1_caches[core]
+        if op == TRACE_OP_STORE:
+            cycles_elapsed = mem_interface.store(address, CPU_DATA_SIZE, data.to_bytes(CPU_DATA_SIZE, 'little'))
+        else:
+            cycles_elapsed = mem_interface.load(address, CPU_DATA_SIZE)[1]
+
+        core_counters = counters[core]
+        core_counters[0] = start_cycle + cycles_elapsed
+        core_counters[1] += cycles_elapsed
+        core_counters[2] += 1
+
+        record = next(core_records[core], None)
+        if record is not None:
+            heapq.heappush(pending, (core_counters[0] + record[0], core, record))
+
+    return [tuple(core_counters) for core_counters in counters]
+
+
+def total_counters(caches) -> LevelTotals:
+    """
+    :param caches: Cache objects
+    :return: Their hit / miss counters, summed
+    """
+    return LevelTotals(*[sum(getattr(cache, name) for cache in caches) for name in COUNTER_NAMES])
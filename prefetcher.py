@@ -0,0 +1,266 @@
+from collections import OrderedDict
+
+from l1cache import L1Cache
+from mem_ifc import MemoryInterface
+
+
+"""
+    Hardware prefetchers, plugged into the hierarchy chain in front of any cache level.
+
+    A PrefetchStage wraps a cache: its next_mem is the cache, and the previous level (the CPU or an upper cache)
+    points to the stage instead of the cache. Demand accesses pass through the stage unchanged, while the stage
+    trains a prefetcher on them and issues prefetches of whole blocks into the cache (see MemoryInterface.prefetch).
+
+    Timing: prefetches are off the critical path, their latency is not added to demand accesses. The stage keeps its
+    own clock, advanced by the cycles of the demand accesses through it and by the idle cycles of the CPU (see
+    tick), and records when each prefetched block will be ready. A demand access to a block whose prefetch is still
+    in flight waits for the remaining cycles.
+
+    Statistics (see get_extra_statistics):
+    -   issued: prefetches sent to the cache (blocks that were not present)
+    -   useful: prefetched blocks later accessed by demand
+    -   late: useful prefetches that were still in flight when demand accessed them
+    -   polluting: prefetched blocks evicted before any demand access, they took the line of another block for
+        nothing (blocks still unused at the end of the simulation that were evicted are counted as well)
+"""
+
+
+class Prefetcher(object):
+    """
+    Base class for prefetch address generators. They see the demand stream as block numbers.
+    """
+
+    def __init__(self, degree: int = 1):
+        """
+        :param degree: Amount of blocks to prefetch ahead on each trigger
+        """
+        self.degree = degree
+
+    def observe(self, block_num: int, is_miss: bool) -> list:
+        """
+        Trains the prefetcher with a demand access.
+        :param block_num: Block number of the access (address divided by the block size of the cache)
+        :param is_miss: True if the access missed the cache
+        :return: List of block numbers to prefetch
+        """
+        raise NotImplementedError
+
+
+class NextLinePrefetcher(Prefetcher):
+    """
+    Next-line prefetching: a miss to block N prefetches blocks N+1 .. N+degree.
+    """
+
+    def observe(self, block_num: int, is_miss: bool) -> list:
+        if not is_miss:
+            return []
+        return [block_num + i for i in range(1, self.degree + 1)]
+
+
+class StridePrefetcher(Prefetcher):
+    """
+    PC-less stride prefetching: detects a constant delta between consecutive demand block numbers. Once the same
+    non-zero delta was seen twice in a row, each access prefetches degree blocks ahead along the stride.
+    """
+
+    def __init__(self, degree: int = 1):
+        super(StridePrefetcher, self).__init__(degree)
+        self.last_block = None
+        self.last_delta = 0
+        self.confirmed = False
+
+    def observe(self, block_num: int, is_miss: bool) -> list:
+        if self.last_block is None:
+            self.last_block = block_num
+            return []
+
+        delta = block_num - self.last_block
+        self.last_block = block_num
+        if delta == 0:
+            return []  # Repeated accesses to the same block don't train the stride
+
+        self.confirmed = delta == self.last_delta
+        self.last_delta = delta
+        if not self.confirmed:
+            return []
+        return [block_num + delta * i for i in range(1, self.degree + 1)]
+
+
+class StreamPrefetcher(Prefetcher):
+    """
+    Stream prefetching: tracks up to NUM_OF_STREAMS sequential streams (ascending or descending). A miss close to the
+    head of a stream (within STREAM_WINDOW blocks) advances the stream and prefetches degree blocks ahead of it.
+    Other misses allocate a new stream, replacing the least recently used one.
+    """
+
+    NUM_OF_STREAMS = 8
+    STREAM_WINDOW = 4
+
+    def __init__(self, degree: int = 2):
+        super(StreamPrefetcher, self).__init__(degree)
+        self.streams = OrderedDict()  # Stream id -> (head block number, direction: +1, -1 or 0 until trained)
+        self.next_stream_id = 0
+
+    def observe(self, block_num: int, is_miss: bool) -> list:
+        for stream_id, (head, direction) in self.streams.items():
+            distance = block_num - head
+            if distance == 0 or abs(distance) > self.STREAM_WINDOW:
+                continue
+            if direction != 0 and (distance > 0) != (direction > 0):
+                continue
+
+            direction = 1 if distance > 0 else -1
+            self.streams[stream_id] = (block_num, direction)
+            self.streams.move_to_end(stream_id)
+            return [block_num + direction * i for i in range(1, self.degree + 1)]
+
+        if is_miss:
+            if len(self.streams) == self.NUM_OF_STREAMS:
+                self.streams.popitem(last=False)
+            self.streams[self.next_stream_id] = (block_num, 0)
+            self.next_stream_id += 1
+        return []
+
+
+# Prefetchers by name
+PREFETCHERS = {
+    'next-line': NextLinePrefetcher,
+    'stride': StridePrefetcher,
+    'stream': StreamPrefetcher,
+}
+
+
+class PrefetchStage(MemoryInterface):
+    """
+    A prefetcher in front of a cache, see the module documentation.
+    """
+
+    # Prefetches are limited to the address space of the caches
+    ADDRESS_SPACE_SIZE = 1 << L1Cache.ADDRESS_BITS
+
+    # Follows the idle cycles of the CPU, prefetches complete during them
+    clocked = True
+
+    def __init__(self, cache: MemoryInterface, prefetcher: Prefetcher, name: str = 'prefetch'):
+        """
+        :param cache: The cache to prefetch into, it becomes the next level of this stage
+        :param prefetcher: The prefetch address generator
+        :param name: Prefix of the statistics of this stage
+        """
+        super(PrefetchStage, self).__init__(cache)
+        self.prefetcher = prefetcher
+        self.name = name
+
+        self.clock = 0
+        self.in_flight = {}  # Prefetched block address -> cycle it is ready, until its first demand access
+
+        self.issued = 0
+        self.useful = 0
+        self.late = 0
+        self.polluting = 0
+
+    def get_block_size(self) -> int:
+        return self.next_mem.get_block_size()
+
+    def is_address_present(self, address: int) -> bool:
+        return self.next_mem.is_address_present(address)
+
+    def flush_if_needed(self, address: int) -> int:
+        return self.next_mem.flush_if_needed(address)
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        return self.next_mem.read(address, data_size)
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        return self.next_mem.write(address, mark_dirty, data_size, data)
+
+    def demand_access(self, address: int) -> (bool, int):
+        """
+        Accounts for a demand access to a prefetched block, before it is forwarded to the cache.
+        :param address: Accessed address
+        :return: (True if the access misses the cache, cycles to wait for an in flight prefetch of the block)
+        """
+        is_miss = not self.next_mem.is_address_present(address)
+        block_address = address - (address % self.get_block_size())
+        ready_cycle = self.in_flight.pop(block_address, None)
+        if ready_cycle is None:
+            return is_miss, 0
+
+        if is_miss:
+            self.polluting += 1  # Evicted before it was ever used
+            return is_miss, 0
+
+        self.useful += 1
+        if ready_cycle > self.clock:
+            self.late += 1
+            return is_miss, ready_cycle - self.clock
+        return is_miss, 0
+
+    def issue_prefetches(self, address: int, is_miss: bool):
+        """
+        Trains the prefetcher with a demand access, and issues its prefetches to the cache.
+        :param address: Accessed address
+        :param is_miss: True if the access missed the cache
+        """
+        block_size = self.get_block_size()
+        for block_num in self.prefetcher.observe(address // block_size, is_miss):
+            block_address = block_num * block_size
+            if block_address < 0 or block_address >= self.ADDRESS_SPACE_SIZE:
+                continue
+            if self.next_mem.is_address_present(block_address):
+                continue
+            prefetch_cycles = self.next_mem.prefetch(block_address)
+            self.issued += 1
+            self.in_flight[block_address] = self.clock + prefetch_cycles
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Forwards a demand load to the cache, then issues the prefetches it triggers.
+        """
+        is_miss, wait_cycles = self.demand_access(address)
+        data, cycles_elapsed = self.next_mem.load(address, block_size)
+        data = bytes(data)  # Prefetches below may evict the block the view points to
+        cycles_elapsed += wait_cycles
+        self.clock += cycles_elapsed
+        self.issue_prefetches(address, is_miss)
+        return data, cycles_elapsed
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Forwards a demand store to the cache, then issues the prefetches it triggers.
+        """
+        is_miss, wait_cycles = self.demand_access(address)
+        cycles_elapsed = self.next_mem.store(address, block_size, data) + wait_cycles
+        self.clock += cycles_elapsed
+        self.issue_prefetches(address, is_miss)
+        return cycles_elapsed
+
+    def tick(self, now: int, idle_cycles: int):
+        """
+        Advances the clock of the stage over the idle cycles of the CPU.
+        """
+        self.clock = max(self.clock, now + idle_cycles)
+
+    def warm_access(self, address: int, is_store: bool):
+        """Not warmed, functional warming passes through to the next level (see MemoryInterface.warm_access)"""
+        self.next_mem.warm_access(address, is_store)
+
+    def get_extra_statistics(self) -> dict:
+        """
+        :return: The prefetch statistics of this stage (see module documentation)
+        """
+        evicted_unused = sum(1 for block_address in self.in_flight
+                             if not self.next_mem.is_address_present(block_address))
+        return {
+            self.name + '_issued': self.issued,
+            self.name + '_useful': self.useful,
+            self.name + '_late': self.late,
+            self.name + '_polluting': self.polluting + evicted_unused,
+        }
+
+    def dump_memory(self, *file_names):
+        """The stage holds no data, all files belong to the cache and the levels beyond it."""
+        self.next_mem.dump_memory(*file_names)
+
+    def print_mem(self, limit=-1):
+        self.next_mem.print_mem(limit)
@@ -0,0 +1,193 @@
+import random
+from collections import OrderedDict
+from math import log2
+
+
+"""
+    Replacement policies for set-associative caches (see set_assoc_cache).
+
+    A policy tracks the ways holding valid blocks in each set, and chooses the victim way when a block should be
+    brought into a full set. The cache notifies the policy of:
+    -   on_fill: a block was written into a way (after a miss)
+    -   on_hit: a block residing in a way was accessed
+    -   on_invalidate: a block was evicted or invalidated, its way is now free
+    Free ways are filled by the cache itself (lowest way first), so victim() is only called for full sets.
+"""
+
+
+class ReplacementPolicy(object):
+    """
+    Base class for replacement policies.
+    """
+
+    def __init__(self, num_of_sets: int, num_of_ways: int):
+        """
+        :param num_of_sets: Number of sets in the cache
+        :param num_of_ways: Number of ways in each set
+        """
+        self.num_of_sets = num_of_sets
+        self.num_of_ways = num_of_ways
+
+    def on_fill(self, set_index: int, way: int):
+        """A new block was written into the given way."""
+        self.on_hit(set_index, way)
+
+    def on_hit(self, set_index: int, way: int):
+        """The block in the given way was accessed."""
+        pass
+
+    def on_invalidate(self, set_index: int, way: int):
+        """The block in the given way was evicted or invalidated."""
+        pass
+
+    def victim(self, set_index: int) -> int:
+        """
+        :param set_index: Index of a full set
+        :return: The way to evict from the set
+        """
+        raise NotImplementedError
+
+
+class LRUPolicy(ReplacementPolicy):
+    """
+    True LRU. Each set keeps its valid ways in an OrderedDict, from least to most recently used, so all
+    operations are O(1).
+    """
+
+    def __init__(self, num_of_sets: int, num_of_ways: int):
+        super(LRUPolicy, self).__init__(num_of_sets, num_of_ways)
+        self.recency = [OrderedDict() for i in range(num_of_sets)]
+
+    def on_hit(self, set_index: int, way: int):
+        ways = self.recency[set_index]
+        ways[way] = None
+        ways.move_to_end(way)
+
+    def on_invalidate(self, set_index: int, way: int):
+        self.recency[set_index].pop(way, None)
+
+    def victim(self, set_index: int) -> int:
+        return next(iter(self.recency[set_index]))
+
+
+class FIFOPolicy(ReplacementPolicy):
+    """
+    First in, first out: the block that was filled first is evicted, regardless of accesses.
+    """
+
+    def __init__(self, num_of_sets: int, num_of_ways: int):
+        super(FIFOPolicy, self).__init__(num_of_sets, num_of_ways)
+        self.fill_order = [OrderedDict() for i in range(num_of_sets)]
+
+    def on_fill(self, set_index: int, way: int):
+        ways = self.fill_order[set_index]
+        ways.pop(way, None)
+        ways[way] = None
+
+    def on_invalidate(self, set_index: int, way: int):
+        self.fill_order[set_index].pop(way, None)
+
+    def victim(self, set_index: int) -> int:
+        return next(iter(self.fill_order[set_index]))
+
+
+class RandomPolicy(ReplacementPolicy):
+    """
+    Random replacement, seeded so simulations are reproducible.
+    """
+
+    SEED = 0
+
+    def __init__(self, num_of_sets: int, num_of_ways: int):
+        super(RandomPolicy, self).__init__(num_of_sets, num_of_ways)
+        self.random = random.Random(self.SEED)
+
+    def victim(self, set_index: int) -> int:
+        return self.random.randrange(self.num_of_ways)
+
+
+class TreePLRUPolicy(ReplacementPolicy):
+    """
+    Tree pseudo-LRU: each set keeps a binary tree of num_of_ways - 1 bits (stored heap-like, root at index 0).
+    Each bit points to the half of the ways below it that was used less recently. Requires a power of 2 ways.
+    """
+
+    def __init__(self, num_of_sets: int, num_of_ways: int):
+        super(TreePLRUPolicy, self).__init__(num_of_sets, num_of_ways)
+        if num_of_ways & (num_of_ways - 1):
+            raise ValueError("Tree PLRU requires a power of 2 ways, got " + str(num_of_ways))
+        self.levels = int(log2(num_of_ways))
+        self.tree_bits = [bytearray(max(num_of_ways - 1, 1)) for i in range(num_of_sets)]
+
+    def on_hit(self, set_index: int, way: int):
+        bits = self.tree_bits[set_index]
+        node = 0
+        for level in range(self.levels - 1, -1, -1):
+            direction = (way >> level) & 1
+            bits[node] = 1 - direction  # Point away from the accessed half
+            node = 2 * node + 1 + direction
+
+    def victim(self, set_index: int) -> int:
+        bits = self.tree_bits[set_index]
+        node = 0
+        way = 0
+        for level in range(self.levels):
+            direction = bits[node]
+            way = (way << 1) | direction
+            node = 2 * node + 1 + direction
+        return way
+
+
+class SRRIPPolicy(ReplacementPolicy):
+    """
+    Static re-reference interval prediction (SRRIP-HP): each way holds an RRPV_BITS re-reference prediction value.
+    Blocks are inserted with a long predicted interval (max - 1), promoted to 0 on hits, and the victim is a way
+    predicted to be re-referenced in the distant future (max), aging the set until one exists.
+    """
+
+    RRPV_BITS = 2
+
+    def __init__(self, num_of_sets: int, num_of_ways: int):
+        super(SRRIPPolicy, self).__init__(num_of_sets, num_of_ways)
+        self.max_rrpv = (1 << self.RRPV_BITS) - 1
+        self.rrpv = [bytearray([self.max_rrpv]) * num_of_ways for i in range(num_of_sets)]
+
+    def on_fill(self, set_index: int, way: int):
+        self.rrpv[set_index][way] = self.max_rrpv - 1
+
+    def on_hit(self, set_index: int, way: int):
+        self.rrpv[set_index][way] = 0
+
+    def on_invalidate(self, set_index: int, way: int):
+        self.rrpv[set_index][way] = self.max_rrpv
+
+    def victim(self, set_index: int) -> int:
+        rrpv = self.rrpv[set_index]
+        while True:
+            way = rrpv.find(self.max_rrpv)
+            if way != -1:
+                return way
+            for i in range(self.num_of_ways):
+                rrpv[i] += 1
+
+
+# Replacement policies by name
+REPLACEMENT_POLICIES = {
+    'lru': LRUPolicy,
+    'plru': TreePLRUPolicy,
+    'fifo': FIFOPolicy,
+    'random': RandomPolicy,
+    'srrip': SRRIPPolicy,
+}
+
+
+def create_policy(name: str, num_of_sets: int, num_of_ways: int) -> ReplacementPolicy:
+    """
+    :param name: Name of the replacement policy (see REPLACEMENT_POLICIES)
+    :param num_of_sets: Number of sets in the cache
+    :param num_of_ways: Number of ways in each set
+    :return: A new replacement policy object
+    """
+    if name not in REPLACEMENT_POLICIES:
+        raise ValueError("Unknown replacement policy: " + str(name))
+    return REPLACEMENT_POLICIES[name](num_of_sets, num_of_ways)
@@ -0,0 +1,321 @@
+#!/usr/bin/python
+
+import argparse
+import sys
+import traceback
+
+from l1cache import L1Cache
+from l2cache import L2Cache
+from main_memory import MainMemory
+from sim import simulate_cpu
+from sim_constants import CPU_DATA_SIZE
+from trace_reader import TRACE_OP_STORE, chunk_records, read_trace
+
+
+"""
+    Single pass multi-configuration analysis, based on reuse (stack) distances - Mattson's stack algorithm.
+
+    For an LRU cache that allocates on every access (write-allocate, as L1Cache and L2Cache do), an access hits in a
+    set of W ways if and only if less than W distinct blocks of the same set were accessed since the previous access
+    to the same block. That count is the reuse distance of the access.
+    Hence a single pass over the trace that builds a histogram of reuse distances per number of sets, gives the
+    hits and misses of every associativity at once (capacity = number of sets * ways * block size).
+    Direct-mapped caches are the special case of a single way.
+
+    Reuse distances are computed in O(log n) per access: each block keeps a mark at the (set local) time of its
+    last access in a Fenwick tree, so the distance is the amount of marks set after the previous access to the block.
+
+    Set sampling: when sample_every > 1, only 1 of every sample_every sets is tracked and counts are scaled up,
+    trading accuracy for speed on caches with many sets.
+
+    Example:
+        python reuse_distance.py trace.txt --block-sizes 4 8 16 --capacities 1024 4096 --ways 1 2 --cross-check
+"""
+
+# Reuse distance of an access to a block never accessed before (a compulsory miss, for any cache)
+COLD_MISS = -1
+
+
+class FenwickTree(object):
+    """
+    Fenwick (binary indexed) tree of counts, for prefix sums in O(log n).
+    The tree grows (by doubling) when an index beyond its size is updated, so it can follow an unbounded timeline.
+    """
+
+    def __init__(self, size: int = 1024):
+        """
+        C'tor for an empty Fenwick tree
+        :param size: Initial amount of indices
+        """
+        self.values = [0] * size
+        self.tree = [0] * (size + 1)
+
+    def grow(self, min_size: int):
+        """
+        Rebuilds the tree with at least min_size indices, in O(n).
+        :param min_size: Minimal amount of indices required
+        """
+        size = len(self.values)
+        while size < min_size:
+            size *= 2
+        self.values.extend([0] * (size - len(self.values)))
+        self.tree = [0] + self.values
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if parent <= size:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, index: int, delta: int):
+        """
+        Adds delta to the count at the given index
+        :param index: Index to update (0 based)
+        :param delta: Amount to add
+        """
+        if index >= len(self.values):
+            self.grow(index + 1)
+        self.values[index] += delta
+        tree = self.tree
+        size = len(tree)
+        i = index + 1
+        while i < size:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, end: int) -> int:
+        """
+        :param end: End index (exclusive)
+        :return: Sum of counts at indices [0, end)
+        """
+        tree = self.tree
+        total = 0
+        i = min(end, len(self.values))
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+
+class SetReuseStacks(object):
+    """
+    The reuse distance state and histograms of a single (block size, number of sets) geometry.
+    """
+
+    def __init__(self, num_of_sets: int, sample_every: int = 1):
+        """
+        :param num_of_sets: Number of sets, a power of 2
+        :param sample_every: Track only the sets whose index is a multiple of sample_every (1 tracks all sets)
+        """
+        self.num_of_sets = num_of_sets
+        self.sample_every = sample_every
+
+        self.last_access = {}  # Block number -> set local time of its last access
+        self.set_time = {}     # Set index -> set local time (amount of accesses to the set)
+        self.set_marks = {}    # Set index -> Fenwick tree of last access marks
+
+        # Reuse distance histograms: distance -> amount of accesses, per access type
+        self.load_histogram = {}
+        self.store_histogram = {}
+
+    def access(self, block_num: int, is_store: bool):
+        """
+        Records an access to the given block.
+        :param block_num: Block number (address divided by block size)
+        :param is_store: True for store accesses, False for loads
+        """
+        set_index = block_num & (self.num_of_sets - 1)
+        if set_index % self.sample_every:
+            return
+
+        marks = self.set_marks.get(set_index)
+        if marks is None:
+            marks = FenwickTree()
+            self.set_marks[set_index] = marks
+        now = self.set_time.get(set_index, 0)
+
+        previous = self.last_access.get(block_num)
+        if previous is None:
+            distance = COLD_MISS
+        else:
+            # Distinct blocks of this set accessed since the previous access = marks after the previous access
+            distance = marks.prefix_sum(now) - marks.prefix_sum(previous + 1)
+            marks.add(previous, -1)
+
+        marks.add(now, 1)
+        self.last_access[block_num] = now
+        self.set_time[set_index] = now + 1
+
+        histogram = self.store_histogram if is_store else self.load_histogram
+        histogram[distance] = histogram.get(distance, 0) + 1
+
+    def hits_and_misses(self, ways: int) -> (int, int, int, int):
+        """
+        :param ways: Associativity of the cache
+        :return: (read hits, write hits, read misses, write misses) of an LRU cache of this number of sets and
+                 the given amount of ways. Scaled by the sampling rate when sets are sampled.
+        """
+        counts = []
+        for histogram in (self.load_histogram, self.store_histogram):
+            hits = sum(count for distance, count in histogram.items() if 0 <= distance < ways)
+            misses = sum(histogram.values()) - hits
+            counts.append((hits * self.sample_every, misses * self.sample_every))
+        (read_hits, read_misses), (write_hits, write_misses) = counts
+        return read_hits, write_hits, read_misses, write_misses
+
+
+class ReuseDistanceAnalyzer(object):
+    """
+    Reuse distance analysis of a trace, for all requested block sizes and numbers of sets, in a single pass.
+    """
+
+    def __init__(self, block_sizes, set_counts, sample_every: int = 1):
+        """
+        :param block_sizes: Block sizes to analyze (powers of 2)
+        :param set_counts: Numbers of sets to analyze for each block size (powers of 2) - either a list used for all
+                           block sizes, or a dictionary of block size -> list.
+        :param sample_every: Set sampling rate (see SetReuseStacks)
+        """
+        self.stacks = {}
+        for block_size in block_sizes:
+            counts = set_counts[block_size] if isinstance(set_counts, dict) else set_counts
+            self.stacks[block_size] = {num_of_sets: SetReuseStacks(num_of_sets, sample_every)
+                                       for num_of_sets in counts}
+        self.accesses = 0
+
+    def access(self, address: int, is_store: bool):
+        """
+        Records a CPU access in all analyzed geometries.
+        :param address: Accessed address
+        :param is_store: True for store accesses, False for loads
+        """
+        self.accesses += 1
+        for block_size, stacks in self.stacks.items():
+            block_num = address // block_size
+            for set_stacks in stacks.values():
+                set_stacks.access(block_num, is_store)
+
+    def analyze(self, trace):
+        """
+        Records all accesses of a trace.
+        :param trace: Trace file (text or binary), or an iterable of TraceChunk objects
+        """
+        trace_chunks = read_trace(trace) if isinstance(trace, str) else trace
+        for chunk in trace_chunks:
+            for num_of_cycles_passed, op, address, data in chunk_records(chunk):
+                self.access(address, op == TRACE_OP_STORE)
+
+    def hits_and_misses(self, block_size: int, capacity: int, ways: int) -> (int, int, int, int):
+        """
+        :param block_size: Block size of the cache
+        :param capacity: Capacity of the cache in bytes
+        :param ways: Associativity of the cache (1 for direct-mapped)
+        :return: (read hits, write hits, read misses, write misses) of the cache
+        """
+        num_of_sets = capacity // (block_size * ways)
+        if block_size not in self.stacks or num_of_sets not in self.stacks[block_size]:
+            raise ValueError('Geometry was not analyzed: block size ' + str(block_size) + ', ' +
+                             str(num_of_sets) + ' sets')
+        return self.stacks[block_size][num_of_sets].hits_and_misses(ways)
+
+
+def analyze_trace(trace, block_sizes, capacities, ways, sample_every: int = 1) -> ReuseDistanceAnalyzer:
+    """
+    Analyzes a trace for all combinations of the given cache parameters, in a single pass.
+    :param trace: Trace file (text or binary), or an iterable of TraceChunk objects
+    :param block_sizes: Block sizes to analyze
+    :param capacities: Cache capacities (in bytes) to analyze
+    :param ways: Associativities to analyze
+    :param sample_every: Set sampling rate (see SetReuseStacks)
+    :return: The ReuseDistanceAnalyzer, to query with hits_and_misses
+    """
+    set_counts = {block_size: sorted({capacity // (block_size * num_of_ways)
+                                      for capacity in capacities for num_of_ways in ways
+                                      if capacity >= block_size * num_of_ways})
+                  for block_size in block_sizes}
+    analyzer = ReuseDistanceAnalyzer(block_sizes, set_counts, sample_every)
+    analyzer.analyze(trace)
+    return analyzer
+
+
+def simulate_single_level(cache_class, trace, block_size: int, capacity: int) -> (int, int, int, int):
+    """
+    Simulates a single cache level of the object model directly above main memory.
+    :param cache_class: L1Cache (direct-mapped) or L2Cache (2-way LRU)
+    :param trace: Trace file (text or binary)
+    :param block_size: Block size of the cache
+    :param capacity: Capacity of the cache in bytes
+    :return: (read hits, write hits, read misses, write misses) of the cache
+    """
+    cache = cache_class(MainMemory(None), block_size, capacity)
+    simulate_cpu(trace, cache)
+    return cache.read_hits, cache.write_hits, cache.read_misses, cache.write_misses
+
+
+def cross_check(trace, block_sizes, capacities) -> list:
+    """
+    Compares the analysis against the object model, for the configurations the object model supports:
+    L1Cache (direct-mapped) and L2Cache (2-way LRU) as a single level of cache, with at least 2 sets (the address
+    masks of the object model need at least one index bit).
+    :param trace: Trace file (text or binary)
+    :param block_sizes: Block sizes to compare
+    :param capacities: Cache capacities to compare
+    :return: List of (cache class name, block size, capacity, analysis counts, simulated counts) of mismatches
+    """
+    cache_ways = ((L1Cache, 1), (L2Cache, L2Cache.NUM_OF_WAYS))
+    valid_capacities = [capacity for capacity in capacities if capacity >= CPU_DATA_SIZE]
+    analyzer = analyze_trace(trace, block_sizes, valid_capacities, [ways for cache_class, ways in cache_ways])
+
+    mismatches = []
+    for cache_class, ways in cache_ways:
+        for block_size in block_sizes:
+            for capacity in valid_capacities:
+                if capacity < 2 * block_size * ways:
+                    continue
+                analyzed = analyzer.hits_and_misses(block_size, capacity, ways)
+                simulated = simulate_single_level(cache_class, trace, block_size, capacity)
+                if analyzed != simulated:
+                    mismatches.append((cache_class.__name__, block_size, capacity, analyzed, simulated))
+    return mismatches
+
+
+if __name__ == "__main__":
+    """
+    Main function for the reuse distance analysis: prints the hits / misses of every requested configuration.
+    """
+    parser = argparse.ArgumentParser(description='Single pass hit / miss analysis of many cache configurations.')
+    parser.add_argument('trace', help='Trace file (text or binary)')
+    parser.add_argument('--block-sizes', type=int, nargs='+', default=[4, 8, 16, 32, 64, 128])
+    parser.add_argument('--capacities', type=int, nargs='+', default=[L1Cache.CACHE_SIZE_IN_BYTES])
+    parser.add_argument('--ways', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--sample-every', type=int, default=1, help='Track 1 of every N sets')
+    parser.add_argument('--cross-check', action='store_true',
+                        help='Compare against L1Cache / L2Cache simulations of the same configurations')
+    args = parser.parse_args()
+
+    try:
+        trace_analyzer = analyze_trace(args.trace, args.block_sizes, args.capacities, args.ways, args.sample_every)
+        print('block'.rjust(8) + 'capacity'.rjust(10) + 'ways'.rjust(6) + 'read hits'.rjust(12) +
+              'write hits'.rjust(12) + 'read misses'.rjust(13) + 'write misses'.rjust(14) + 'miss rate'.rjust(11))
+        for trace_block_size in args.block_sizes:
+            for trace_capacity in args.capacities:
+                for trace_ways in args.ways:
+                    if trace_capacity < trace_block_size * trace_ways:
+                        continue
+                    counts = trace_analyzer.hits_and_misses(trace_block_size, trace_capacity, trace_ways)
+                    total = sum(counts)
+                    miss_rate = (counts[2] + counts[3]) / total if total > 0 else 0
+                    print(str(trace_block_size).rjust(8) + str(trace_capacity).rjust(10) + str(trace_ways).rjust(6) +
+                          str(counts[0]).rjust(12) + str(counts[1]).rjust(12) + str(counts[2]).rjust(13) +
+                          str(counts[3]).rjust(14) + "{0:.4f}".format(miss_rate).rjust(11))
+
+        if args.cross_check:
+            check_mismatches = cross_check(args.trace, args.block_sizes, args.capacities)
+            for mismatch in check_mismatches:
+                print('Cross-check mismatch: ' + str(mismatch))
+            print('Cross-check ' + ('passed' if not check_mismatches else 'failed'))
+            if check_mismatches:
+                sys.exit(1)
+    except Exception as err:
+        print("Analysis ended with an error.")
+        tb = traceback.format_exc()
+        print(tb)
+        sys.exit(1)
@@ -0,0 +1,337 @@
+import random
+from collections import namedtuple
+from math import sqrt
+
+from sim_constants import CPU_DATA_SIZE
+from trace_reader import TRACE_OP_STORE, chunk_records, read_trace
+
+
+"""
+    Sampled simulation: estimates the statistics of a long trace by simulating only parts of it in detail.
+
+    Between detailed parts, the trace is functionally fast-forwarded: each access only updates the tags, dirty bits
+    and replacement state of the caches (see MemoryInterface.warm_access), without moving data or counting cycles.
+    The caches are therefore warm when a detailed part starts. A few detailed warm-up records precede each measured
+    part, to settle the state that functional warming does not model.
+
+    Two ways of choosing the detailed parts are supported:
+    -   Periodic (SMARTS-like): the last `window` records of every `period` records are measured. Statistics are
+        extrapolated from the mean of the windows, with 95% confidence intervals from their variance.
+    -   Phases (SimPoint-like): the trace is split into intervals, each described by a vector of features (a hashed
+        histogram of the accessed pages and the fraction of stores). The intervals are clustered with k-means, and
+        the interval closest to each centroid is measured. Statistics are the average of the measured intervals,
+        weighted by the amount of records in their clusters. Phases need 2 passes over the trace.
+
+    Sampled simulations only produce statistics: the data held by the hierarchy is not maintained while fast
+    forwarding, so memory dumps are meaningless.
+"""
+
+# Z score of the 95% confidence intervals (normal approximation, accurate when there are many windows)
+CONFIDENCE_Z = 1.96
+
+# Statistics counters of each cache level
+COUNTER_NAMES = ('read_hits', 'write_hits', 'read_misses', 'write_misses')
+
+# Features of intervals for phase detection: amount of page histogram buckets, page size
+PHASE_FEATURE_BUCKETS = 32
+PHASE_PAGE_BITS = 12
+
+# Estimated hit / miss counters of a cache level, in place of the cache object for compute_statistics
+LevelEstimate = namedtuple('LevelEstimate', COUNTER_NAMES)
+
+SamplingResult = namedtuple('SamplingResult', ['l1_estimate', 'l2_estimate', 'cycles', 'mem_cycles',
+                                               'mem_instructions', 'extra_statistics'])
+
+
+class SampleCollector(object):
+    """
+    Measures the detailed parts of a sampled simulation: the cycles and hit / miss counters of each measured part.
+    """
+
+    def __init__(self, mem_interface, cache_levels):
+        """
+        :param mem_interface: Pointer to first level in the memory hierarchy
+        :param cache_levels: The cache objects whose counters are measured (L1, and L2 when present)
+        """
+        self.mem_interface = mem_interface
+        self.cache_levels = cache_levels
+        self.samples = []  # (records, cycles, memory cycles, counters of each level) of each measured part
+
+        self.records = 0
+        self.cycles = 0
+        self.mem_cycles = 0
+        self.start_counters = None
+
+    def level_counters(self) -> list:
+        """
+        :return: Current counters of all measured levels, flattened
+        """
+        return [getattr(level, name) for level in self.cache_levels for name in COUNTER_NAMES]
+
+    def start(self):
+        """Starts measuring a detailed part."""
+        self.records = 0
+        self.cycles = 0
+        self.mem_cycles = 0
+        self.start_counters = self.level_counters()
+
+    def stop(self):
+        """Stops measuring the current part, and keeps its sample."""
+        if self.start_counters is None:
+            return
+        counters = [end - start for start, end in zip(self.start_counters, self.level_counters())]
+        self.samples.append((self.records, self.cycles, self.mem_cycles, counters))
+        self.start_counters = None
+
+    def execute(self, num_of_cycles_passed, op, address, data) -> int:
+        """
+        Executes a trace record in detail (as simulate_cpu does).
+        :return: Clock cycles of the memory access
+        """
+        if op == TRACE_OP_STORE:
+            cycles_elapsed = self.mem_interface.store(address, CPU_DATA_SIZE, data.to_bytes(CPU_DATA_SIZE, 'little'))
+        else:
+            cycles_elapsed = self.mem_interface.load(address, CPU_DATA_SIZE)[1]
+        if self.start_counters is not None:
+            self.records += 1
+            self.cycles += num_of_cycles_passed + cycles_elapsed
+            self.mem_cycles += cycles_elapsed
+        return cycles_elapsed
+
+
+def mean_and_interval(values) -> (float, float):
+    """
+    :param values: Per sample values
+    :return: (Mean of the values, half width of its 95% confidence interval - 0 for less than 2 values)
+    """
+    count = len(values)
+    if count == 0:
+        return 0.0, 0.0
+    mean = sum(values) / count
+    if count < 2:
+        return mean, 0.0
+    variance = sum((value - mean) ** 2 for value in values) / (count - 1)
+    return mean, CONFIDENCE_Z * sqrt(variance / count)
+
+
+def extrapolate(samples, weights, total_records: int, num_of_levels: int):
+    """
+    Extrapolates the statistics of the whole trace from the measured samples.
+    :param samples: (records, cycles, memory cycles, counters) of each sample, see SampleCollector
+    :param weights: Weight of each sample: the fraction of the trace it represents
+    :param total_records: Amount of records in the whole trace
+    :param num_of_levels: Amount of measured cache levels
+    :return: (estimated cycles, estimated memory cycles, list of LevelEstimate per level)
+    """
+    cycles = 0.0
+    mem_cycles = 0.0
+    counters = [0.0] * (num_of_levels * len(COUNTER_NAMES))
+    for (records, sample_cycles, sample_mem_cycles, sample_counters), weight in zip(samples, weights):
+        if records == 0:
+            continue
+        scale = weight * total_records / records
+        cycles += sample_cycles * scale
+        mem_cycles += sample_mem_cycles * scale
+        counters = [total + value * scale for total, value in zip(counters, sample_counters)]
+
+    counters = [int(round(value)) for value in counters]
+    estimates = [LevelEstimate(*counters[i * len(COUNTER_NAMES):(i + 1) * len(COUNTER_NAMES)])
+                 for i in range(num_of_levels)]
+    return int(round(cycles)), int(round(mem_cycles)), estimates
+
+
+def sample_intervals(samples) -> dict:
+    """
+    :param samples: (records, cycles, memory cycles, counters) of each sample, see SampleCollector
+    :return: 95% confidence intervals (half widths) of the cycles per record, L1 miss rate and AMAT, as extra
+             statistics
+    """
+    cycles_per_record = [cycles / records for records, cycles, mem_cycles, counters in samples if records]
+    l1_miss_rates = [(counters[2] + counters[3]) / records for records, cycles, mem_cycles, counters in samples
+                     if records]
+    amats = [mem_cycles / records for records, cycles, mem_cycles, counters in samples if records]
+    mean_cycles_per_record, cycles_per_record_interval = mean_and_interval(cycles_per_record)
+    return {
+        'sample_cycles_per_record': mean_cycles_per_record,
+        'sample_cycles_per_record_ci95': cycles_per_record_interval,
+        'sample_l1_miss_rate_ci95': mean_and_interval(l1_miss_rates)[1],
+        'sample_amat_ci95': mean_and_interval(amats)[1],
+    }
+
+
+def simulate_periodic(trace, mem_interface, cache_levels, period: int, window: int, warmup: int) -> SamplingResult:
+    """
+    Periodic sampled simulation (see module documentation).
+    :param trace: Trace file (text or binary), or an iterable of TraceChunk objects
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    :param cache_levels: The cache objects whose counters are estimated (L1, and L2 when present)
+    :param period: Amount of records in each sampling period
+    :param window: Amount of measured records at the end of each period
+    :param warmup: Amount of detailed (not measured) records before each window
+    :return: SamplingResult with the estimates, and the confidence intervals as extra statistics
+    """
+    if not 0 < window <= period or warmup < 0:
+        raise ValueError("Invalid sampling parameters: period " + str(period) + ", window " + str(window) +
+                         ", warmup " + str(warmup))
+    detailed_start = max(0, period - window - warmup)
+    window_start = period - window
+
+    collector = SampleCollector(mem_interface, cache_levels)
+    trace_chunks = read_trace(trace) if isinstance(trace, str) else trace
+    total_records = 0
+    for chunk in trace_chunks:
+        for num_of_cycles_passed, op, address, data in chunk_records(chunk):
+            offset = total_records % period
+            total_records += 1
+            if offset < detailed_start:
+                mem_interface.warm_access(address, op == TRACE_OP_STORE)
+                continue
+            if offset == window_start:
+                collector.start()
+            collector.execute(num_of_cycles_passed, op, address, data)
+            if offset == period - 1:
+                collector.stop()
+    collector.stop()  # A window cut by the end of the trace
+
+    samples = collector.samples
+    measured_records = sum(sample[0] for sample in samples)
+    if measured_records == 0:
+        raise ValueError("No sampling window was measured: the trace has " + str(total_records) + " records, the "
+                         "first window starts at record " + str(window_start) + " (period " + str(period) +
+                         ", window " + str(window) + ")")
+    weights = [records / measured_records for records, cycles, mem_cycles, counters in samples]
+    cycles, mem_cycles, estimates = extrapolate(samples, weights, total_records, len(cache_levels))
+    extra_statistics = {'sample_windows': len(samples)}
+    extra_statistics.update(sample_intervals(samples))
+    extra_statistics['sample_cycles_ci95'] = int(round(extra_statistics['sample_cycles_per_record_ci95'] *
+                                                       total_records))
+    return SamplingResult(estimates[0], estimates[1] if len(estimates) > 1 else None, cycles, mem_cycles,
+                          total_records, extra_statistics)
+
+
+def interval_features(trace, interval: int) -> list:
+    """
+    Describes each interval of the trace by a feature vector, for phase detection.
+    :param trace: Trace file (text or binary), or an iterable of TraceChunk objects
+    :param interval: Amount of records in each interval
+    :return: List of feature vectors, one per interval: normalized histogram of hashed page numbers of the accesses,
+             followed by the fraction of stores
+    """
+    features = []
+    histogram = [0] * PHASE_FEATURE_BUCKETS
+    stores = 0
+    records = 0
+    trace_chunks = read_trace(trace) if isinstance(trace, str) else trace
+    for chunk in trace_chunks:
+        for num_of_cycles_passed, op, address, data in chunk_records(chunk):
+            histogram[(address >> PHASE_PAGE_BITS) % PHASE_FEATURE_BUCKETS] += 1
+            stores += op == TRACE_OP_STORE
+            records += 1
+            if records == interval:
+                features.append([count / records for count in histogram] + [stores / records])
+                histogram = [0] * PHASE_FEATURE_BUCKETS
+                stores = 0
+                records = 0
+    if records:
+        features.append([count / records for count in histogram] + [stores / records])
+    return features
+
+
+def squared_distance(a, b) -> float:
+    return sum((x - y) ** 2 for x, y in zip(a, b))
+
+
+def kmeans(vectors, k: int, iterations: int = 50, seed: int = 0) -> (list, list):
+    """
+    Clusters vectors with k-means (k-means++ initialization, seeded so results are reproducible).
+    :param vectors: List of vectors (lists of floats)
+    :param k: Amount of clusters
+    :param iterations: Maximal amount of iterations
+    :param seed: Random seed
+    :return: (Cluster index of each vector, centroid of each cluster)
+    """
+    rng = random.Random(seed)
+    k = min(k, len(vectors))
+    centroids = [list(rng.choice(vectors))]
+    while len(centroids) < k:
+        distances = [min(squared_distance(vector, centroid) for centroid in centroids) for vector in vectors]
+        if sum(distances) == 0:
+            break
+        centroids.append(list(rng.choices(vectors, weights=distances)[0]))
+
+    assignment = None
+    for iteration in range(iterations):
+        new_assignment = [min(range(len(centroids)), key=lambda c: squared_distance(vector, centroids[c]))
+                          for vector in vectors]
+        if new_assignment == assignment:
+            break
+        assignment = new_assignment
+        for c in range(len(centroids)):
+            members = [vector for vector, cluster in zip(vectors, assignment) if cluster == c]
+            if members:
+                centroids[c] = [sum(values) / len(members) for values in zip(*members)]
+    return assignment, centroids
+
+
+def select_phases(features, k: int) -> list:
+    """
+    :param features: Feature vector of each interval (see interval_features)
+    :param k: Amount of phases
+    :return: List of (representative interval index, weight) - the interval closest to the centroid of each
+             cluster, and the fraction of intervals in the cluster
+    """
+    assignment, centroids = kmeans(features, k)
+    phases = []
+    for c, centroid in enumerate(centroids):
+        members = [i for i, cluster in enumerate(assignment) if cluster == c]
+        if members:
+            representative = min(members, key=lambda i: squared_distance(features[i], centroid))
+            phases.append((representative, len(members) / len(features)))
+    return sorted(phases)
+
+
+def simulate_phases(trace, mem_interface, cache_levels, interval: int, num_of_phases: int,
+                    warmup: int) -> SamplingResult:
+    """
+    Phase based sampled simulation (see module documentation).
+    :param trace: Trace file (text or binary), or a list of TraceChunk objects - read twice
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    :param cache_levels: The cache objects whose counters are estimated (L1, and L2 when present)
+    :param interval: Amount of records in each interval
+    :param num_of_phases: Amount of phases (clusters) to detect
+    :param warmup: Amount of detailed (not measured) records before each representative interval
+    :return: SamplingResult with the estimates, and the phases as extra statistics
+    """
+    if interval <= 0 or num_of_phases <= 0 or warmup < 0:
+        raise ValueError("Invalid phase parameters: interval " + str(interval) + ", phases " +
+                         str(num_of_phases) + ", warmup " + str(warmup))
+    features = interval_features(trace, interval)
+    phases = select_phases(features, num_of_phases)
+    representatives = {index for index, weight in phases}
+
+    collector = SampleCollector(mem_interface, cache_levels)
+    total_records = 0
+    trace_chunks = read_trace(trace) if isinstance(trace, str) else trace
+    for chunk in trace_chunks:
+        for num_of_cycles_passed, op, address, data in chunk_records(chunk):
+            index, offset = divmod(total_records, interval)
+            total_records += 1
+            if index in representatives:
+                if offset == 0:
+                    collector.start()
+                collector.execute(num_of_cycles_passed, op, address, data)
+                if offset == interval - 1:
+                    collector.stop()
+            elif index + 1 in representatives and offset >= interval - warmup:
+                collector.execute(num_of_cycles_passed, op, address, data)  # Detailed warm-up
+            else:
+                mem_interface.warm_access(address, op == TRACE_OP_STORE)
+    collector.stop()  # A representative interval cut by the end of the trace
+
+    cycles, mem_cycles, estimates = extrapolate(collector.samples, [weight for index, weight in phases],
+                                                total_records, len(cache_levels))
+    extra_statistics = {'sample_phases': len(phases)}
+    for index, weight in phases:
+        extra_statistics['sample_phase_' + str(index) + '_weight'] = weight
+    return SamplingResult(estimates[0], estimates[1] if len(estimates) > 1 else None, cycles, mem_cycles,
+                          total_records, extra_statistics)
@@ -0,0 +1,332 @@
+from math import log2
+
+from mem_ifc import MemoryInterface
+from set_assoc_cache import SetAssociativeCache
+
+
+class SectoredCache(SetAssociativeCache):
+    """
+        A set-associative cache with sectored (sub-blocked) lines.
+        -   A line (block_size bytes) has a single tag, and is split into sectors of SECTOR_SIZE_IN_BYTES, each with
+            its own valid and dirty bits. Large lines keep the tag memory small, without paying the bandwidth of
+            moving whole lines.
+        -   A miss fetches only the missed sectors from the next level: each missed sector with its neighbours, in
+            aligned groups of FILL_SECTORS sectors (1: only the missed sector). Sectors already valid in a fetched
+            group keep their contents. A miss on a present line (a sector miss) doesn't evict anything.
+        -   A store miss doesn't fetch the sectors it overwrites entirely.
+        -   An evicted line writes back only its dirty sectors, one write back per contiguous run of dirty sectors
+            (clean valid sectors are handed over too when the next level keeps clean victims).
+        The cycles of the fills and write backs are those of the transfers of the sectors, see transfer_cycles of the
+        levels involved. The write policies (see MemoryInterface.write_through, write_allocate) apply as in the other
+        caches. With a single sector per line, the cache behaves like SetAssociativeCache, except that store misses
+        of whole lines are not fetched, and the data returned by a load miss always starts at the requested address.
+
+        Statistics (see get_extra_statistics): sectors fetched, misses on present lines (sector misses), sectors
+        written back, and the write backs of whole lines.
+    """
+
+    SECTOR_SIZE_IN_BYTES = 8
+    FILL_SECTORS = 1  # Sectors fetched on a miss, an aligned group holding the missed sector
+
+    def __init__(self, next_mem_arg: MemoryInterface, block_size: int, sector_size: int = None,
+                 fill_sectors: int = None, cache_size: int = None, num_of_ways: int = None, policy: str = None,
+                 hit_time: int = None, bus_width: int = None, name: str = 'sectored'):
+        """
+        C'tor for a sectored cache (see SetAssociativeCache for the parameters of the cache).
+        :param block_size: Line size of the cache in bytes, the amount of data under a tag
+        :param sector_size: Sector size in bytes (optional, SECTOR_SIZE_IN_BYTES by default)
+        :param fill_sectors: Sectors fetched on a miss (optional, FILL_SECTORS by default)
+        :param name: Prefix of the statistics of this cache
+        """
+        super(SectoredCache, self).__init__(next_mem_arg, block_size, cache_size, num_of_ways, policy, hit_time,
+                                            bus_width)
+        if sector_size is not None:
+            self.SECTOR_SIZE_IN_BYTES = sector_size
+        if fill_sectors is not None:
+            self.FILL_SECTORS = fill_sectors
+        self.name = name
+
+        sector_size = self.SECTOR_SIZE_IN_BYTES
+        if sector_size < 4 or sector_size & (sector_size - 1) or sector_size > block_size:
+            raise ValueError("Sector size must be a power of 2 between 4 and the line size, got " + str(sector_size))
+        self.sectors_per_line = block_size // sector_size
+        if self.FILL_SECTORS < 1 or self.FILL_SECTORS & (self.FILL_SECTORS - 1) or \
+                self.FILL_SECTORS > self.sectors_per_line:
+            raise ValueError("Fill sectors must be a power of 2 up to the sectors of a line, got " +
+                             str(self.FILL_SECTORS))
+        self.sector_bits = int(log2(sector_size))
+        self.fill_mask = (1 << self.FILL_SECTORS) - 1
+
+        # Valid and dirty bits of the sectors of each (set, way), as bit masks (bit i for sector i)
+        self.sector_valid = [0] * (self.num_of_sets * self.NUM_OF_WAYS)
+        self.sector_dirty = [0] * (self.num_of_sets * self.NUM_OF_WAYS)
+
+        # Statistics
+        self.sector_fills = 0
+        self.sector_misses = 0
+        self.sector_writebacks = 0
+        self.line_writebacks = 0
+
+    def sectors_of(self, address: int, data_size: int) -> int:
+        """
+        :param address: Start address of a range, within a single line
+        :param data_size: Size of the range in bytes
+        :return: Mask of the sectors of the line the range touches
+        """
+        first = (address & self.offset_mask) >> self.sector_bits
+        last = ((address & self.offset_mask) + data_size - 1) >> self.sector_bits
+        return ((1 << (last - first + 1)) - 1) << first
+
+    def sectors_covered(self, address: int, data_size: int) -> int:
+        """
+        :param address: Start address of a range, within a single line
+        :param data_size: Size of the range in bytes
+        :return: Mask of the sectors of the line the range overwrites entirely
+        """
+        offset = address & self.offset_mask
+        first = (offset + self.SECTOR_SIZE_IN_BYTES - 1) >> self.sector_bits
+        end = (offset + data_size) >> self.sector_bits
+        return ((1 << (end - first)) - 1) << first if end > first else 0
+
+    def line_of(self, address: int) -> int:
+        """
+        :return: Index of the (set, way) holding the line of the address, or -1 if it is not present
+        """
+        set_index = self.address_to_set(address)
+        way = self.set_ways[set_index].get(self.address_to_tag(address))
+        return -1 if way is None else set_index * self.NUM_OF_WAYS + way
+
+    def is_address_present(self, address: int) -> bool:
+        """
+        :return: True if the line of the address is present, and the sector of the address is valid
+        """
+        line = self.line_of(address)
+        sector = (address & self.offset_mask) >> self.sector_bits
+        return line != -1 and bool((self.sector_valid[line] >> sector) & 1)
+
+    def is_range_present(self, address: int, data_size: int) -> bool:
+        """
+        :return: True if the line of the range is present, and all sectors of the range are valid
+        """
+        line = self.line_of(address)
+        sectors = self.sectors_of(address, data_size)
+        return line != -1 and self.sector_valid[line] & sectors == sectors
+
+    def allocate_way(self, set_index: int, tag: int) -> int:
+        way = super(SectoredCache, self).allocate_way(set_index, tag)
+        line = set_index * self.NUM_OF_WAYS + way
+        self.sector_valid[line] = 0
+        self.sector_dirty[line] = 0
+        return way
+
+    def invalidate_way(self, set_index: int, way: int):
+        super(SectoredCache, self).invalidate_way(set_index, way)
+        line = set_index * self.NUM_OF_WAYS + way
+        self.sector_valid[line] = 0
+        self.sector_dirty[line] = 0
+
+    def evict_way(self, set_index: int, way: int) -> int:
+        """
+        Evicts the line held by the given way: hands its dirty sectors to the next level (and the clean valid ones
+        if the next level keeps clean victims), a block per contiguous run of sectors, then invalidates it.
+        :param set_index: The set number
+        :param way: The way to evict
+        :return: Clock cycles elapsed to write back the sectors (0 if the line was clean or invalid)
+        """
+        tag = self.way_tags[set_index][way]
+        if tag is None:
+            return 0
+        self.evictions += 1
+        if self.evict_hook is not None:
+            self.evict_hook(self.address_from_tag_index(tag, set_index), self.block_size)
+
+        line = set_index * self.NUM_OF_WAYS + way
+        valid = self.sector_valid[line]
+        dirty = self.sector_dirty[line]
+        if dirty == (1 << self.sectors_per_line) - 1:
+            self.line_writebacks += 1
+
+        cycles_elapsed = 0
+        line_address = self.address_from_tag_index(tag, set_index)
+        sector = 0
+        while sector < self.sectors_per_line:
+            is_dirty = (dirty >> sector) & 1
+            if not (valid >> sector) & 1 or not (is_dirty or self.next_mem.keeps_clean_victims):
+                sector += 1
+                continue
+            # A run of valid sectors of the same dirty state
+            run_end = sector + 1
+            while run_end < self.sectors_per_line and (valid >> run_end) & 1 and (dirty >> run_end) & 1 == is_dirty:
+                run_end += 1
+            offset = sector * self.SECTOR_SIZE_IN_BYTES
+            run_size = (run_end - sector) * self.SECTOR_SIZE_IN_BYTES
+            start = line * self.block_size + offset
+            data = self.NO_DATA[:run_size] if self.tag_only else self.data_view[start:start + run_size]
+            cycles_elapsed += self.next_mem.evict_block(line_address + offset, run_size, data, bool(is_dirty))
+            self.count_write_traffic(run_size)
+            if is_dirty:
+                self.sector_writebacks += run_end - sector
+            sector = run_end
+
+        self.invalidate_way(set_index, way)
+        return cycles_elapsed
+
+    def fill(self, address: int, sectors: int) -> int:
+        """
+        Brings the given sectors of the line of the address into the cache, allocating the line (and evicting a
+        victim) if it is not present. Each invalid sector is fetched from the next level with its aligned group of
+        FILL_SECTORS sectors, the sectors of a group that are already valid keep their contents.
+        :param address: Address within the line
+        :param sectors: Mask of the sectors needed
+        :return: Clock cycles elapsed for the fetches and the eviction
+        """
+        line_address = address - (address & self.offset_mask)
+        line = self.line_of(address)
+        valid = self.sector_valid[line] if line != -1 else 0
+        missing = sectors & ~valid
+
+        # Fetch the groups first, then evict (as MemoryInterface.load does)
+        cycles_elapsed = 0
+        fetched = []
+        sector = 0
+        while missing >> sector:
+            if not (missing >> sector) & 1:
+                sector += 1
+                continue
+            group = sector - sector % self.FILL_SECTORS
+            group_address = line_address + group * self.SECTOR_SIZE_IN_BYTES
+            group_size = self.FILL_SECTORS * self.SECTOR_SIZE_IN_BYTES
+            data, fetch_cycles = self.next_mem.load(group_address, group_size)
+            self.count_read_traffic(group_size)
+            # A level that missed returns its whole block (see MemoryInterface.load), take the group out of it
+            offset = group_address % len(data) if len(data) > group_size else 0
+            fetched.append((group, bytes(data[offset:offset + group_size])))  # Snapshot before flushing
+            cycles_elapsed += fetch_cycles
+            missing &= ~(self.fill_mask << group)
+            sector = group + self.FILL_SECTORS
+
+        if line == -1:
+            cycles_elapsed += self.flush_if_needed(address)
+            set_index = self.address_to_set(address)
+            line = set_index * self.NUM_OF_WAYS + self.allocate_way(set_index, self.address_to_tag(address))
+
+        for group, data in fetched:
+            for sector in range(group, group + self.FILL_SECTORS):
+                if (self.sector_valid[line] >> sector) & 1:
+                    continue
+                self.sector_fills += 1
+                self.sector_valid[line] |= 1 << sector
+                if not self.tag_only:
+                    start = line * self.block_size + sector * self.SECTOR_SIZE_IN_BYTES
+                    offset = (sector - group) * self.SECTOR_SIZE_IN_BYTES
+                    self.data_view[start:start + self.SECTOR_SIZE_IN_BYTES] = \
+                        data[offset:offset + self.SECTOR_SIZE_IN_BYTES]
+        return cycles_elapsed
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Loads data from the given address, fetching the missing sectors on a miss (see fill).
+        """
+        line = self.line_of(address)
+        if line != -1:
+            self.policy.on_hit(line // self.NUM_OF_WAYS, line % self.NUM_OF_WAYS)
+        if self.is_range_present(address, block_size):
+            self.read_hits += 1
+            return self.read(address, block_size)
+
+        self.read_misses += 1
+        if line != -1:
+            self.sector_misses += 1
+        cycles_elapsed = self.fill(address, self.sectors_of(address, block_size))
+        data, read_cycles = self.read(address, block_size)
+        return data, cycles_elapsed + read_cycles
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Saves data to the given address, fetching the missing sectors it doesn't overwrite on a miss (see fill).
+        """
+        line = self.line_of(address)
+        if line != -1:
+            self.policy.on_hit(line // self.NUM_OF_WAYS, line % self.NUM_OF_WAYS)
+        if self.is_range_present(address, block_size):
+            self.write_hits += 1
+            if self.write_through:
+                cycles_elapsed = self.write(address, False, block_size, data)
+                return cycles_elapsed + self.write_to_next(address, block_size, data)
+            return self.write(address, True, block_size, data)
+
+        self.write_misses += 1
+        if not self.write_allocate:
+            return self.transfer_cycles(block_size) + self.write_to_next(address, block_size, data)
+        if line != -1:
+            self.sector_misses += 1
+        sectors = self.sectors_of(address, block_size)
+        cycles_elapsed = self.fill(address, sectors & ~self.sectors_covered(address, block_size))
+        if self.line_of(address) == -1:
+            # All sectors are overwritten, nothing was fetched: the line is allocated here
+            cycles_elapsed += self.flush_if_needed(address)
+        cycles_elapsed += self.write(address, not self.write_through, block_size, data)
+        if self.write_through:
+            cycles_elapsed += self.write_to_next(address, block_size, data)
+        return cycles_elapsed
+
+    def prefetch(self, address: int) -> int:
+        """Brings the sector of the given address (with its fill group) into the cache, if it is not present."""
+        if self.is_address_present(address):
+            return 0
+        return self.fill(address, self.sectors_of(address, 1))
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        """
+        Saves the data to the given address (see SetAssociativeCache.write), the sectors written become valid, and
+        dirty when mark_dirty is set.
+        """
+        cycles_elapsed = super(SectoredCache, self).write(address, mark_dirty, data_size, data)
+        line = self.line_of(address)
+        sectors = self.sectors_of(address, data_size)
+        self.sector_valid[line] |= sectors
+        if mark_dirty:
+            self.sector_dirty[line] |= sectors
+        return cycles_elapsed
+
+    def warm_access(self, address: int, is_store: bool):
+        """
+        Tag-only update of the cache for an access (see MemoryInterface.warm_access)
+        """
+        if is_store and self.warm_write_policy(address):
+            return
+        set_index = self.address_to_set(address)
+        tag = self.address_to_tag(address)
+        way = self.set_ways[set_index].get(tag)
+        if way is not None:
+            self.policy.on_hit(set_index, way)
+        elif len(self.set_ways[set_index]) == self.NUM_OF_WAYS:
+            # The victim line writes back its dirty sectors
+            victim_way = self.policy.victim(set_index)
+            line = set_index * self.NUM_OF_WAYS + victim_way
+            victim_address = self.address_from_tag_index(self.way_tags[set_index][victim_way], set_index)
+            for sector in range(self.sectors_per_line):
+                if (self.sector_dirty[line] >> sector) & 1:
+                    self.next_mem.warm_access(victim_address + sector * self.SECTOR_SIZE_IN_BYTES, True)
+            self.invalidate_way(set_index, victim_way)
+        if way is None:
+            way = self.allocate_way(set_index, tag)
+
+        line = set_index * self.NUM_OF_WAYS + way
+        sector = (address & self.offset_mask) >> self.sector_bits
+        if not (self.sector_valid[line] >> sector) & 1:
+            group = sector - sector % self.FILL_SECTORS
+            line_address = address - (address & self.offset_mask)
+            self.next_mem.warm_access(line_address + group * self.SECTOR_SIZE_IN_BYTES, False)
+            self.sector_valid[line] |= self.fill_mask << group
+        if is_store:
+            self.sector_dirty[line] |= 1 << sector
+            self.dirty[line] = 1
+
+    def get_extra_statistics(self) -> dict:
+        return {
+            self.name + '_sector_fills': self.sector_fills,
+            self.name + '_sector_misses': self.sector_misses,
+            self.name + '_sector_writebacks': self.sector_writebacks,
+            self.name + '_line_writebacks': self.line_writebacks,
+        }
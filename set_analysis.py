@@ -0,0 +1,198 @@
+import json
+from array import array
+
+from l1cache import L1Cache
+from l2cache import L2Cache
+from main_memory import MainMemory
+from set_assoc_cache import SetAssociativeCache
+
+
+"""
+    Conflict analysis of a run: where in the caches and in the address space the misses come from.
+
+    A SetAnalysis is handed to sim.run_sim, which instruments the cache levels and main memory with it (like
+    sim_profile.Profiler, the methods of the levels are wrapped on the instance). It counts, in compact arrays:
+    -   For each cache level, per set (the block number of L1Cache, the index of L2Cache, the set of
+        SetAssociativeCache and SectoredCache): the accesses, the misses and the evictions of the set. The counts
+        come from the counters of the level itself (hits, misses, evictions), so they add up to its statistics.
+        The misses of an exclusive pair served around the lower cache (see inclusion.InclusionPort) are the only
+        ones left out: they don't reach the lower cache.
+    -   For each cache level, the misses per page of the address space (PAGE_SIZE_IN_BYTES pages).
+    -   For main memory, the reads (fills of the level above) and writes (write backs, write throughs) per page:
+        the address ranges that drive the traffic to main memory.
+
+    Sets that thrash have many misses and evictions compared to their accesses (and to the other sets): they are
+    reported first in the hot sets of each level.
+
+    The report is a JSON file, rendered as heatmaps by sim_graph.plot_set_analysis:
+        {"page_size": bytes,
+         "levels": [{"level": "l1", "num_of_sets": n, "accesses": [n per set], "misses": [...], "evictions": [...],
+                     "hot_sets": [{"set": i, "accesses": n, "misses": n, "evictions": n}, ...],
+                     "page_misses": {page: n}}, ...],
+         "memory": {"page_reads": {page: n}, "page_writes": {page: n}}}
+    Pages are page numbers (address // page_size), only pages with a non-zero count are listed.
+"""
+
+PAGE_SIZE_IN_BYTES = MainMemory.PAGE_SIZE_IN_BYTES
+NUM_OF_HOT_SETS = 16  # Sets with the most misses listed in the report of each level
+
+# Methods of a cache level that are instrumented: the requests of the levels around it, each one may access, miss
+# and evict (flush_if_needed evicts for the level above in an exclusive pair, see inclusion.InclusionPort)
+INSTRUMENTED_METHODS = ('load', 'store', 'prefetch', 'evict_block', 'flush_if_needed')
+
+
+def cache_sets(cache) -> (int, object):
+    """
+    :param cache: A cache level of the hierarchy
+    :return: (Number of sets of the cache, function of an address -> its set)
+    """
+    if isinstance(cache, L1Cache):
+        return len(cache.tag_mem), cache.address_to_block_num
+    if isinstance(cache, L2Cache):
+        return len(cache.lru_mem), lambda address: cache.apply_mask(address, cache.index_mask, cache.offset_bits)
+    if isinstance(cache, SetAssociativeCache):
+        return cache.num_of_sets, cache.address_to_set
+    raise ValueError("Set analysis doesn't support " + type(cache).__name__ + " levels")
+
+
+class LevelSets(object):
+    """
+    Counters of a cache level, per set and per page.
+    """
+
+    def __init__(self, name: str, num_of_sets: int, num_of_pages: int):
+        self.name = name
+        self.accesses = array('Q', bytes(8 * num_of_sets))
+        self.misses = array('Q', bytes(8 * num_of_sets))
+        self.evictions = array('Q', bytes(8 * num_of_sets))
+        self.page_misses = array('Q', bytes(8 * num_of_pages))
+
+    def report(self) -> dict:
+        """
+        :return: The counters of the level, as a JSON serializable dictionary (see module documentation)
+        """
+        hot_sets = sorted((set_index for set_index in range(len(self.misses)) if self.misses[set_index]),
+                          key=lambda set_index: (-self.misses[set_index], set_index))[:NUM_OF_HOT_SETS]
+        return {
+            'level': self.name,
+            'num_of_sets': len(self.accesses),
+            'accesses': self.accesses.tolist(),
+            'misses': self.misses.tolist(),
+            'evictions': self.evictions.tolist(),
+            'hot_sets': [{'set': set_index, 'accesses': self.accesses[set_index], 'misses': self.misses[set_index],
+                          'evictions': self.evictions[set_index]} for set_index in hot_sets],
+            'page_misses': sparse_counts(self.page_misses),
+        }
+
+
+def sparse_counts(counts) -> dict:
+    """
+    :param counts: Array of counters
+    :return: Dictionary of index -> counter, of the non-zero counters
+    """
+    return {index: count for index, count in enumerate(counts) if count}
+
+
+class SetAnalysis(object):
+    """
+    Collects the per set and per page counters of a run, see the module documentation.
+    """
+
+    def __init__(self, page_size: int = PAGE_SIZE_IN_BYTES):
+        """
+        :param page_size: Size of the pages of the address space histograms, in bytes (a power of 2)
+        """
+        if page_size <= 0 or page_size & (page_size - 1):
+            raise ValueError("Invalid page size: " + str(page_size) + ", expected a power of 2")
+        self.page_size = page_size
+        self.page_bits = page_size.bit_length() - 1
+        self.num_of_pages = max(1, (1 << L1Cache.ADDRESS_BITS) >> self.page_bits)
+        self.levels = []
+        self.page_reads = array('Q', bytes(8 * self.num_of_pages))
+        self.page_writes = array('Q', bytes(8 * self.num_of_pages))
+
+    def instrument(self, named_caches, main_mem):
+        """
+        Instruments the cache levels and the main memory of a hierarchy.
+        :param named_caches: List of (name, cache level), from L1 down
+        :param main_mem: The main memory object, last level of the hierarchy
+        """
+        for name, cache in named_caches:
+            num_of_sets, set_of = cache_sets(cache)
+            level_sets = LevelSets(name, num_of_sets, self.num_of_pages)
+            self.levels.append(level_sets)
+            # Requests of a level to itself (i.e: evict_block storing the block) are counted by the outer request
+            busy = [False]
+            for method_name in INSTRUMENTED_METHODS:
+                setattr(cache, method_name,
+                        self.wrap_cache(cache, getattr(cache, method_name), set_of, level_sets, busy))
+
+        main_mem.load = self.wrap_memory(main_mem.load, self.page_reads)
+        main_mem.store = self.wrap_memory(main_mem.store, self.page_writes)
+
+    def wrap_cache(self, cache, method, set_of, level_sets: LevelSets, busy: list):
+        """
+        :param cache: A cache level
+        :param method: Bound method of the level, taking the address first
+        :param set_of: Function of an address -> its set in the level
+        :param level_sets: Counters of the level
+        :param busy: Shared flag of the instrumented methods of the level, set while one of them runs
+        :return: The method, counting its accesses, misses and evictions in level_sets
+        """
+        accesses, misses, evictions, page_misses = \
+            level_sets.accesses, level_sets.misses, level_sets.evictions, level_sets.page_misses
+        page_bits = self.page_bits
+
+        def counted(address, *args):
+            if busy[0]:
+                return method(address, *args)
+            hits_before = cache.read_hits + cache.write_hits
+            misses_before = cache.read_misses + cache.write_misses
+            evictions_before = cache.evictions
+            busy[0] = True
+            try:
+                result = method(address, *args)
+            finally:
+                busy[0] = False
+            new_misses = cache.read_misses + cache.write_misses - misses_before
+            set_index = set_of(address)
+            accesses[set_index] += cache.read_hits + cache.write_hits - hits_before + new_misses
+            if new_misses:
+                misses[set_index] += new_misses
+                page_misses[address >> page_bits] += new_misses
+            evictions[set_index] += cache.evictions - evictions_before
+            return result
+
+        return counted
+
+    def wrap_memory(self, method, page_counts):
+        """
+        :param method: Bound load or store method of main memory
+        :param page_counts: Per page counters of the method
+        :return: The method, counting its calls per page
+        """
+        page_bits = self.page_bits
+
+        def counted(address, *args):
+            page_counts[address >> page_bits] += 1
+            return method(address, *args)
+
+        return counted
+
+    def report(self) -> dict:
+        """
+        :return: The report of the run, as a JSON serializable dictionary (see module documentation)
+        """
+        return {
+            'page_size': self.page_size,
+            'levels': [level_sets.report() for level_sets in self.levels],
+            'memory': {'page_reads': sparse_counts(self.page_reads), 'page_writes': sparse_counts(self.page_writes)},
+        }
+
+    def save_report(self, file_name):
+        """
+        Writes the report of the run as JSON.
+        :param file_name: Path of the output file
+        """
+        with open(file_name, 'w') as report_out:
+            json.dump(self.report(), report_out)
@@ -0,0 +1,339 @@
+from math import ceil
+from math import log2
+
+from mem_ifc import MemoryInterface
+from replacement import create_policy
+
+
+class SetAssociativeCache(MemoryInterface):
+    """
+        A configurable N-way set-associative cache.
+        -   Can be connected to any next memory level (another cache or Main Memory).
+        -   Cache type: Set-associative (any number of ways), Write-back, Write-allocate (by default, see
+            MemoryInterface.write_through and write_allocate).
+        -   Replacement policy is pluggable (see replacement.py): lru, plru, fifo, random, srrip.
+        -   Uses 24 bits for address, like L1Cache and L2Cache.
+
+        With 2 ways and LRU it behaves like L2Cache, and with a single way like L1Cache (direct-mapped), given the
+        same timing parameters.
+
+        Tags are looked up in O(1): each set keeps a dictionary of tag -> way for its valid blocks.
+        Free ways are filled lowest first, the replacement policy chooses victims in full sets only.
+    """
+
+    # Default parameters, may be overridden per instance by the c'tor
+    CACHE_SIZE_IN_BYTES = 32 * 1024  # Total capacity, all ways
+    NUM_OF_WAYS = 4                  # Number of ways
+    MEM_BUS_WIDTH = 256              # Bus width between this cache and the previous level, in bits
+    MEM_HIT_TIME = 4                 # In clock cycles
+    MEM_BUS_ACCESS_TIME = 1          # Any additional transfer on bus after accessing for first entry
+    ADDRESS_BITS = 24                # Amount of bits allocated for addresses space in cache
+    REPLACEMENT_POLICY = 'lru'
+
+    def __init__(self, next_mem_arg: MemoryInterface, block_size: int, cache_size: int = None,
+                 num_of_ways: int = None, policy: str = None, hit_time: int = None, bus_width: int = None):
+        """
+        C'tor for a set-associative cache, initialized to 0 for each mem cell in the beginning of each simulation.
+        :param next_mem_arg: A pointer to the next memory level in the hierarchy
+        :param block_size: Block size for this level of cache (atomic actions operate on this amount of bytes).
+        :param cache_size: Total capacity of the cache in bytes (optional, CACHE_SIZE_IN_BYTES by default).
+        :param num_of_ways: Associativity (optional, NUM_OF_WAYS by default).
+        :param policy: Name of the replacement policy (optional, REPLACEMENT_POLICY by default).
+        :param hit_time: Hit time in clock cycles (optional, MEM_HIT_TIME by default).
+        :param bus_width: Width of the bus to the previous level in bits (optional, MEM_BUS_WIDTH by default).
+        """
+        super(SetAssociativeCache, self).__init__(next_mem_arg)
+        if cache_size is not None:
+            self.CACHE_SIZE_IN_BYTES = cache_size
+        if num_of_ways is not None:
+            self.NUM_OF_WAYS = num_of_ways
+        if policy is not None:
+            self.REPLACEMENT_POLICY = policy
+        if hit_time is not None:
+            self.MEM_HIT_TIME = hit_time
+        if bus_width is not None:
+            self.MEM_BUS_WIDTH = bus_width
+
+        self.block_size = block_size
+        self.num_of_sets = self.CACHE_SIZE_IN_BYTES // (self.NUM_OF_WAYS * block_size)
+        if self.num_of_sets < 1 or self.num_of_sets & (self.num_of_sets - 1):
+            raise ValueError("Number of sets must be a positive power of 2, got " + str(self.num_of_sets))
+
+        self.offset_bits = int(log2(block_size))  # Includes 2 LSB of alignment bits
+        self.index_bits = int(log2(self.num_of_sets))
+        self.tag_bits = self.ADDRESS_BITS - self.index_bits - self.offset_bits
+        self.offset_mask = block_size - 1
+        self.index_mask = self.num_of_sets - 1
+        self.tag_mask = (1 << self.tag_bits) - 1
+
+        # Data memory is a single contiguous bytearray, laid out set after set, and way after way within each set.
+        self.data_mem = bytearray(self.num_of_sets * self.NUM_OF_WAYS * block_size)
+        self.data_view = memoryview(self.data_mem)
+
+        # Tag memory: the tag held by each way (None when invalid), and a tag -> way dictionary per set for lookups
+        self.way_tags = [[None] * self.NUM_OF_WAYS for i in range(self.num_of_sets)]
+        self.set_ways = [dict() for i in range(self.num_of_sets)]
+        self.dirty = bytearray(self.num_of_sets * self.NUM_OF_WAYS)  # Dirty bit of each (set, way)
+
+        self.policy = create_policy(self.REPLACEMENT_POLICY, self.num_of_sets, self.NUM_OF_WAYS)
+
+    def set_tag_only(self):
+        """Releases the data memory, tags and replacement state are kept (see MemoryInterface.set_tag_only)"""
+        self.tag_only = True
+        self.data_mem = bytearray()
+        self.data_view = memoryview(self.data_mem)
+
+    def get_block_size(self) -> int:
+        """
+        :return: The block size in bytes for this cache
+        """
+        return self.block_size
+
+    def address_to_set(self, address: int) -> int:
+        """
+        :param address: Address input
+        :return: Index bits of the address, the set this address maps to
+        """
+        return (address >> self.offset_bits) & self.index_mask
+
+    def address_to_tag(self, address: int) -> int:
+        """
+        :param address: Address input
+        :return: Tag bits of the address, shifted to LSB
+        """
+        return (address >> (self.offset_bits + self.index_bits)) & self.tag_mask
+
+    def address_from_tag_index(self, tag: int, index: int) -> int:
+        """
+        Construct address from tag and set index bits (offset is assumed as 0)
+        :param tag: tag bits of the address
+        :param index: set index bits of the address
+        :return: Fully reconstructed address composed of "ADDRESS_BITS" amount of bits.
+        """
+        return (tag << (self.offset_bits + self.index_bits)) | (index << self.offset_bits)
+
+    def find_way(self, address: int) -> int:
+        """
+        :param address: Address to look up
+        :return: The way holding the block of the address, or None if it is not present
+        """
+        return self.set_ways[self.address_to_set(address)].get(self.address_to_tag(address))
+
+    def line_offset(self, set_index: int, way: int) -> int:
+        """
+        :param set_index: The set number
+        :param way: The way within the set
+        :return: The offset of the first byte of the block stored in the given set and way, within data_mem.
+        """
+        return (set_index * self.NUM_OF_WAYS + way) * self.block_size
+
+    def is_address_present(self, address: int) -> bool:
+        """
+        Query if the data in the given address is present in the current memory level
+        :param address: Address to query if the data is contained in the current memory level
+        :return: True if the memory of this address resides in the current mem level, false is not.
+        """
+        return self.find_way(address) is not None
+
+    def transfer_cycles(self, data_size: int) -> int:
+        """
+        Returns the amount of cycles needed to read / write the data_size given to the cache.
+        :param data_size: The amount of data passed on the bus, excluding address size
+        :return: Amount of cycles taken to pass the data on the bus
+        """
+        return self.MEM_HIT_TIME +\
+               (ceil(8*data_size / self.MEM_BUS_WIDTH) - 1) * self.MEM_BUS_ACCESS_TIME
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Loads data from the given address (see MemoryInterface.load), updating the replacement policy on hits.
+        """
+        way = self.find_way(address)
+        if way is not None:
+            self.policy.on_hit(self.address_to_set(address), way)
+        return super(SetAssociativeCache, self).load(address, block_size)
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Saves data to the given address (see MemoryInterface.store), updating the replacement policy on hits.
+        """
+        way = self.find_way(address)
+        if way is not None:
+            self.policy.on_hit(self.address_to_set(address), way)
+        return super(SetAssociativeCache, self).store(address, block_size, data)
+
+    def evict_way(self, set_index: int, way: int) -> int:
+        """
+        Evicts the block held by the given way: hands it to the next level if dirty (or if the next level keeps
+        clean victims, see MemoryInterface.evict_block), then invalidates it.
+        :param set_index: The set number
+        :param way: The way to evict
+        :return: Clock cycles elapsed to write back the block (0 if it was clean or invalid)
+        """
+        tag = self.way_tags[set_index][way]
+        if tag is None:
+            return 0
+        self.evictions += 1
+        if self.evict_hook is not None:
+            self.evict_hook(self.address_from_tag_index(tag, set_index), self.block_size)
+
+        cycles_elapsed = 0
+        line = set_index * self.NUM_OF_WAYS + way
+        if self.dirty[line] or self.next_mem.keeps_clean_victims:
+            flushed_address = self.address_from_tag_index(tag, set_index)
+            start = line * self.block_size
+            data = self.NO_DATA[:self.block_size] if self.tag_only else self.data_view[start:start + self.block_size]
+            cycles_elapsed = self.next_mem.evict_block(flushed_address, self.block_size, data, bool(self.dirty[line]))
+            self.count_write_traffic(self.block_size)
+
+        self.invalidate_way(set_index, way)
+        return cycles_elapsed
+
+    def invalidate_way(self, set_index: int, way: int):
+        """
+        Invalidates the block held by the given way, without writing it back.
+        :param set_index: The set number
+        :param way: The way to invalidate
+        """
+        tag = self.way_tags[set_index][way]
+        if tag is not None:
+            del self.set_ways[set_index][tag]
+            self.way_tags[set_index][way] = None
+            self.dirty[set_index * self.NUM_OF_WAYS + way] = 0
+            self.policy.on_invalidate(set_index, way)
+
+    def flush_if_needed(self, address: int) -> int:
+        """
+        This callback is triggered after a new block is loaded from the next mem level.
+        When the set of the address is full, the replacement policy chooses a victim, which is evicted (and flushed
+        to the next level if dirty), so the new block can be written to its way.
+        :param address: Address of new block we wish to write, 4 byte aligned.
+        :return: (clock cycles elapsed to flush old block as int -  0 if no flush have occurred)
+        """
+        set_index = self.address_to_set(address)
+        if len(self.set_ways[set_index]) < self.NUM_OF_WAYS:
+            return 0  # A free way is available
+        return self.evict_way(set_index, self.policy.victim(set_index))
+
+    def allocate_way(self, set_index: int, tag: int) -> int:
+        """
+        Allocates a way of the set for a new block (the lowest free way, evicting a victim if the set is full).
+        :param set_index: The set number
+        :param tag: Tag of the new block
+        :return: The allocated way
+        """
+        if len(self.set_ways[set_index]) == self.NUM_OF_WAYS:
+            # Normally done by flush_if_needed before the write; cycles can't be accounted for here
+            self.evict_way(set_index, self.policy.victim(set_index))
+        way = self.way_tags[set_index].index(None)
+        self.way_tags[set_index][way] = tag
+        self.set_ways[set_index][tag] = way
+        self.policy.on_fill(set_index, way)
+        return way
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        """
+        Save the data to the given address.
+        Data will be marked as "valid" and possibly "dirty", according to write-back policy.
+        A block not present in the cache is allocated a way (see allocate_way).
+        :param address: Address to write to, 4 byte aligned
+        :param mark_dirty: When true, the written block will be marked as dirty. False when not.
+        :param data_size: Data size to write to memory, in amount of bytes
+        :param data: Data to be saved, as a bytes-like object, little endian format expected (will be saved as is)
+        :return: (clock cycles elapsed as int - this is the amount of cycles expected to take to transfer the
+                  writen data on the bus from the previous level to this cache)
+        """
+        set_index = self.address_to_set(address)
+        tag = self.address_to_tag(address)
+        way = self.set_ways[set_index].get(tag)
+        if way is None:
+            way = self.allocate_way(set_index, tag)
+
+        start = self.line_offset(set_index, way) + (address & self.offset_mask)
+        end = start + data_size
+
+        # Copy the first data_size bytes of data to data memory, as a single slice assignment.
+        # (a missed block fetched from the next level may be longer than data_size, when its block size is larger)
+        if not self.tag_only:
+            self.data_view[start:end] = data[:data_size]
+        if mark_dirty:
+            self.dirty[set_index * self.NUM_OF_WAYS + way] = 1
+
+        return self.transfer_cycles(data_size)
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        """
+        Perform read operation from the memory, using the memory's inner logic.
+        This method assumes the data is stored in the cache, and is valid.
+        :param address: Address to read from, 4 byte aligned
+        :param data_size: Amount of data in bytes to read from current memory level and return to previous level.
+        :return: (data read as a memoryview of bytes, clock cycles elapsed as int to pass this data to previous
+                  mem level)
+        """
+        set_index = self.address_to_set(address)
+        way = self.set_ways[set_index][self.address_to_tag(address)]
+        start = self.line_offset(set_index, way) + (address & self.offset_mask)
+        if self.tag_only:
+            return self.NO_DATA[:data_size], self.transfer_cycles(data_size)
+        return self.data_view[start:start + data_size], self.transfer_cycles(data_size)
+
+    def invalidate_block(self, address: int) -> bool:
+        """
+        Invalidates the block of the address, if present (see MemoryInterface.invalidate_block)
+        """
+        set_index = self.address_to_set(address)
+        way = self.set_ways[set_index].get(self.address_to_tag(address))
+        if way is None:
+            return False
+        is_dirty = bool(self.dirty[set_index * self.NUM_OF_WAYS + way])
+        self.invalidate_way(set_index, way)
+        return is_dirty
+
+    def resident_blocks(self) -> list:
+        return [self.address_from_tag_index(tag, set_index)
+                for set_index, tags in enumerate(self.way_tags) for tag in tags if tag is not None]
+
+    def warm_access(self, address: int, is_store: bool):
+        """
+        Tag-only update of the cache for an access (see MemoryInterface.warm_access)
+        """
+        if is_store and self.warm_write_policy(address):
+            return
+        set_index = self.address_to_set(address)
+        tag = self.address_to_tag(address)
+        way = self.set_ways[set_index].get(tag)
+        if way is not None:
+            self.policy.on_hit(set_index, way)
+        else:
+            # Miss: the block is fetched from the next level, then a victim is replaced (written back if dirty)
+            self.next_mem.warm_access(address - (address % self.block_size), False)
+            if len(self.set_ways[set_index]) == self.NUM_OF_WAYS:
+                victim_way = self.policy.victim(set_index)
+                if self.dirty[set_index * self.NUM_OF_WAYS + victim_way]:
+                    victim_tag = self.way_tags[set_index][victim_way]
+                    self.next_mem.warm_access(self.address_from_tag_index(victim_tag, set_index), True)
+                self.invalidate_way(set_index, victim_way)
+            way = self.allocate_way(set_index, tag)
+
+        if is_store:
+            self.dirty[set_index * self.NUM_OF_WAYS + way] = 1
+
+    def way_contents(self, way: int) -> bytes:
+        """
+        :param way: The way to collect
+        :return: The contents of the given way, for all sets in order, as a single bytes object.
+        """
+        return b''.join(self.data_view[self.line_offset(i, way):self.line_offset(i, way) + self.block_size]
+                        for i in range(self.num_of_sets))
+
+    def dump_memory(self, *file_names):
+        """ Dumps the contents of memory hierarchy to the file names given as argument.
+            This cache uses a file per way (NUM_OF_WAYS files), and passes the rest of the list to the next level.
+            The format used in each file is byte-per-line, no headers or footers."""
+        for way in range(self.NUM_OF_WAYS):
+            self.dump_output_file(file_names[way], self.way_contents(way))
+        self.next_mem.dump_memory(*file_names[self.NUM_OF_WAYS:])
+
+    def print_mem(self, limit=-1):
+        self.next_mem.print_mem(limit)  # Unimplemented for set-associative caches
+        return
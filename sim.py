@@ -1,13 +1,35 @@
 #!/usr/bin/python
 
+import argparse
+import os
 import sys
+import tempfile
 import traceback
+from itertools import islice
 
-import sim_constants
+from bus import Bus
+from checkpoint import check_checkpoint_support, restore_checkpoint, save_checkpoint
+from dram import PAGE_POLICIES, DRAMMemory
+from event_kernel import EventKernel, attach_ports, simulate_events
+from inclusion import INCLUSION_POLICIES, InclusionPort
 from l1cache import L1Cache
 from l2cache import L2Cache
 from main_memory import MainMemory
-from sim_constants import CPU_DATA_SIZE
+from mshr import MSHRTimingModel
+from multicore import build_multicore_hierarchy, simulate_multicore, total_counters
+from prefetcher import PREFETCHERS, PrefetchStage
+from sampling import simulate_periodic, simulate_phases
+from sectored_cache import SectoredCache
+from set_analysis import PAGE_SIZE_IN_BYTES, SetAnalysis
+from sim_config import build_config_hierarchy, build_main_memory, config_dump_files, deep_level_statistics, \
+    load_config
+from sim_profile import NULL_PROFILER, Profiler
+from sim_stats import INTERVAL_UNITS, SERIES_FORMATS, StatsRecorder, level_counters
+from victim_cache import VictimCache
+from write_buffer import WriteBuffer
+from write_combining import WriteCombiningBuffer
+from sim_constants import CPU_DATA_SIZE, NO_DUMP
+from trace_reader import TRACE_OP_STORE, chunk_records, read_trace
 
 
 """
@@ -26,95 +48,139 @@ from sim_constants import CPU_DATA_SIZE
         -   When block size is exactly the same size of the CPU word (e.g: both are 4 bytes), we don't optimize
             in case of a write miss: we still fetch the required block from L2 / Main memory even though it will
             completely get overridden (this is keep coherence with the general case of block size > 4).
-        -   Python's representation of bytes is simply an alias of Strings.
-            To keep things simple, memory is represented in integers by this simulator
-            even though we mostly deal with bytes (we make sure to treat only the LSB of those integers, as bytes).
-            The end result of the simulation is not affected, even though output file sizes may seem larger
-            (each byte is wrapped in an integer where the 24 MSB are zeros and aren't used).
+        -   Memory of each level is stored in a single contiguous bytearray (one byte per cell).
+            Blocks are passed between levels as memoryview slices of those bytearrays, so moving a block is a slice
+            assignment and no intermediate lists are created.
 """
 
+# Statistics written as rates (floats) in the stats file
+FLOAT_STATISTICS = ('l1_miss_rate', 'global_miss_rate', 'amat')
 
-def dump_statistics(l1_cache, l2_cache, stats, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count) \
-        -> (float, int, float):
+
+def compute_statistics(l1_cache, l2_cache, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count) -> dict:
     """
-    Dumps the statistics of the simulation to the stats file
+    Computes the statistics of the simulation
     :param l1_cache: L1 Cache object
-    :param l2_cache: L2 Cache object
-    :param stats: Stats file name, the output of this function
+    :param l2_cache: L2 Cache object (or None when there is no L2 cache)
     :param cycles_elapsed: The number of clock cycles the whole simulation took
     :param mem_cycles_elapsed: The number of clock cycles memory operations took
     :param mem_instructions_count: The number of load / store instructions executed
-    @:return Statistics relevant for plotting
+    :return: Dictionary of statistics, ordered as in the stats file
     """
+    statistics = dict()
 
-    # Open stats file for write
-    with open(stats, 'w') as stats_out:
-
-        # program running time in cycles
-        stats_out.write(str(int(cycles_elapsed)) + "\n")
+    # program running time in cycles
+    statistics['cycles'] = int(cycles_elapsed)
 
-        # number of read hits in L1
-        stats_out.write(str(int(l1_cache.read_hits)) + "\n")
+    # number of read / write hits / misses in L1
+    statistics['l1_read_hits'] = int(l1_cache.read_hits)
+    statistics['l1_write_hits'] = int(l1_cache.write_hits)
+    statistics['l1_read_misses'] = int(l1_cache.read_misses)
+    statistics['l1_write_misses'] = int(l1_cache.write_misses)
 
-        # number of write hits in L1
-        stats_out.write(str(int(l1_cache.write_hits)) + "\n")
+    # number of read / write hits / misses in L2 (zeros when there's no L2)
+    statistics['l2_read_hits'] = int(l2_cache.read_hits) if l2_cache is not None else 0
+    statistics['l2_write_hits'] = int(l2_cache.write_hits) if l2_cache is not None else 0
+    statistics['l2_read_misses'] = int(l2_cache.read_misses) if l2_cache is not None else 0
+    statistics['l2_write_misses'] = int(l2_cache.write_misses) if l2_cache is not None else 0
 
-        # number of read misses in L1
-        stats_out.write(str(int(l1_cache.read_misses)) + "\n")
+    # L1 local miss rate
+    l1_misses = l1_cache.read_misses + l1_cache.write_misses
+    l1_hits = l1_cache.read_hits + l1_cache.write_hits
+    if (l1_misses + l1_hits) > 0:
+        l1_miss_rate = l1_misses / (l1_misses + l1_hits)
+    else:
+        l1_miss_rate = 0  # Protect against empty simulations
+    statistics['l1_miss_rate'] = l1_miss_rate
 
-        # number of write misses in L1
-        stats_out.write(str(int(l1_cache.write_misses)) + "\n")
+    # global miss rate
+    if l2_cache is None:
+        # global miss rate for L1 only is L1 miss rate
+        global_miss_rate = l1_miss_rate
+    else:
+        # global miss rate for L1 & L2 miss rate
+        l2_misses = l2_cache.read_misses + l2_cache.write_misses
+        l2_hits = l2_cache.read_hits + l2_cache.write_hits
 
-        if l2_cache is None:
-            stats_out.write(str(0) + "\n")
-            stats_out.write(str(0) + "\n")
-            stats_out.write(str(0) + "\n")
-            stats_out.write(str(0) + "\n")
+        if (l2_misses + l2_hits) > 0:
+            l2_miss_rate = l2_misses / (l2_misses + l2_hits)
+            global_miss_rate = l1_miss_rate * l2_miss_rate
         else:
-            # number of read hits in L2
-            stats_out.write(str(int(l2_cache.read_hits)) + "\n")
+            global_miss_rate = 0  # Protect against empty simulations
+    statistics['global_miss_rate'] = global_miss_rate
 
-            # number or write hits in L2
-            stats_out.write(str(int(l2_cache.write_hits)) + "\n")
+    # AMAT
+    if mem_instructions_count > 0:
+        statistics['amat'] = mem_cycles_elapsed / mem_instructions_count
+    else:
+        statistics['amat'] = 0  # Protect against empty simulations
 
-            # number of read misses in L2
-            stats_out.write(str(int(l2_cache.read_misses)) + "\n")
+    return statistics
 
-            # number of write misses in L2
-            stats_out.write(str(int(l2_cache.write_misses)) + "\n")
 
-        # L1 local miss rate
-        l1_misses = l1_cache.read_misses + l1_cache.write_misses
-        l1_hits = l1_cache.read_hits + l1_cache.write_hits
-        if (l1_misses + l1_hits) > 0:
-            l1_miss_rate = l1_misses / (l1_misses + l1_hits)
-        else:
-            l1_miss_rate = 0  # Protect against empty simulations
-        stats_out.write("{0:.4f}".format(l1_miss_rate) + "\n")
+def collect_extra_statistics(mem_interface, final: bool = True) -> dict:
+    """
+    Collects the extra statistics of all components in the hierarchy (see MemoryInterface.get_extra_statistics),
+    and the traffic between the levels that report it (see MemoryInterface.traffic_statistics)
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    :param final: False for a snapshot taken during the run, without the costly statistics (see
+                  MemoryInterface.get_interval_statistics)
+    :return: Dictionary of statistic name -> value, in hierarchy order
+    """
+    extra_statistics = dict()
+    mem_level = mem_interface
+    while mem_level is not None:
+        extra_statistics.update(mem_level.get_extra_statistics() if final else mem_level.get_interval_statistics())
+        extra_statistics.update(mem_level.traffic_statistics())
+        mem_level = mem_level.next_mem
+    return extra_statistics
 
-        # global miss rate
-        if l2_cache is None:
-            # global miss rate for L1 only is L1 miss rate
-            global_miss_rate = l1_miss_rate
-        else:
-            # global miss rate for L1 & L2 miss rate
-            l2_misses = l2_cache.read_misses + l2_cache.write_misses
-            l2_hits = l2_cache.read_hits + l2_cache.write_hits
 
-            if (l2_misses + l2_hits) > 0:
-                l2_miss_rate = l2_misses / (l2_misses + l2_hits)
-                global_miss_rate = l1_miss_rate * l2_miss_rate
-            else:
-                global_miss_rate = 0  # Protect against empty simulations
+def hierarchy_statistics(mem_interface, hierarchy=None, caches=None, final: bool = True) -> dict:
+    """
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    :param hierarchy: The hierarchy configuration the caches were built from (optional, see sim_config)
+    :param caches: The cache objects built from the configuration
+    :param final: False for a snapshot taken during the run (see collect_extra_statistics)
+    :return: The extra statistics of the hierarchy (see collect_extra_statistics), and the counters of the cache
+             levels below L2 of a configured hierarchy
+    """
+    extra_statistics = collect_extra_statistics(mem_interface, final)
+    if hierarchy is not None:
+        extra_statistics.update(deep_level_statistics(hierarchy, caches))
+    return extra_statistics
+
+
+def dump_statistics(l1_cache, l2_cache, stats, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count,
+                    extra_statistics=None) -> (float, int, float):
+    """
+    Dumps the statistics of the simulation to the stats file
+    :param l1_cache: L1 Cache object
+    :param l2_cache: L2 Cache object
+    :param stats: Stats file name, the output of this function
+    :param cycles_elapsed: The number of clock cycles the whole simulation took
+    :param mem_cycles_elapsed: The number of clock cycles memory operations took
+    :param mem_instructions_count: The number of load / store instructions executed
+    :param extra_statistics: Statistics of optional components (i.e: prefetchers), as a dictionary of name -> value.
+                             Appended after the standard statistics as "<name> <value>" lines (optional, the stats
+                             file keeps the reference format when there are none)
+    @:return Statistics relevant for plotting
+    """
+    statistics = compute_statistics(l1_cache, l2_cache, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count)
 
-        stats_out.write("{0:.4f}".format(global_miss_rate) + "\n")
+    # Counters are written as integers, rates as floats with 4 digits after the decimal point
+    lines = []
+    for name, value in statistics.items():
+        lines.append("{0:.4f}".format(value) if name in FLOAT_STATISTICS else str(value))
+    for name, value in (extra_statistics or {}).items():
+        lines.append(name + ' ' + ("{0:.4f}".format(value) if isinstance(value, float) else str(value)))
 
-        # AMAT
-        amat = mem_cycles_elapsed / mem_instructions_count
-        stats_out.write("{0:.4f}".format(amat))
+    # Open stats file for write
+    with open(stats, 'w') as stats_out:
+        stats_out.write("\n".join(lines))
 
-        # Returns results relevant for plotting
-        return l1_miss_rate, cycles_elapsed, amat
+    # Returns results relevant for plotting
+    return statistics['l1_miss_rate'], cycles_elapsed, statistics['amat']
 
 
 def dump_mem_hierarchy_to_files(mem_interface, levels, memout, l1, l2way0, l2way1):
@@ -133,49 +199,81 @@ def dump_mem_hierarchy_to_files(mem_interface, levels, memout, l1, l2way0, l2way
         mem_interface.dump_memory(l1, l2way0, l2way1, memout)  # Will chain to the entire hierarchy
 
 
-def big_endian_to_little_endian(data: int) -> list:
+def big_endian_to_little_endian(data: int) -> bytes:
     """
     Converts input data from big endian format to little endian
     :param data: Data of 32 bit
-    :return: The data converted to little endian, as a list of bytes
+    :return: The data converted to little endian, as bytes
     """
-    little_end_data = [0] * 4
-    little_end_data[0] = data & 0x000000FF
-    little_end_data[1] = (data & 0x0000FF00) >> 8
-    little_end_data[2] = (data & 0x00FF0000) >> 16
-    little_end_data[3] = (data & 0xFF000000) >> 24
-    return little_end_data
+    return data.to_bytes(CPU_DATA_SIZE, 'little')
 
 
-def simulate_cpu(trace, mem_interface) -> int:
+def simulate_cpu(trace, mem_interface, timing_model=None, start=0, stop=None, counters=(0, 0, 0),
+                 recorder=None) -> int:
     """
     Simulates the functionality of the CPU according to the opcodes in the trace file.
     The CPU will access memory via the memory hierarchy, represented by mem_interface.
-    :param trace: Input file, containing Store and Load commands for the CPU to execute
+    :param trace: Input file, containing Store and Load commands for the CPU to execute (text or binary trace).
+                  Already decoded traces may also be given, as an iterable of TraceChunk objects.
     :param mem_interface: Pointer tot he first memory level in the memory hierarchy, usually the L1 Cache.
                           Next memory levels will be referred indirectly by the hierarchy, when needed.
+    :param timing_model: Optional timing model replaying the accesses on its own clock (i.e: MSHRTimingModel).
+                         It is given each access with its cycles in the serial model, and whether it missed the
+                         first level.
+    :param start: Index of the first trace record to execute, the records before it are skipped (i.e: when
+                  resuming from a checkpoint)
+    :param stop: Index of the trace record to stop before (optional, the simulation runs to the end of the trace)
+    :param counters: Initial values of the 3 returned counters (i.e: as saved in a checkpoint)
+    :param recorder: Optional sim_stats.StatsRecorder, taking a snapshot of the statistics every interval of accesses
+                     or cycles (the snapshot of the end of the run is left to the caller)
     :return: (Amount of clock cycles the entire simulation took,
               Amount of clock cycles only memory operations took,
               Amount of store / load instructions executed)
     """
 
-    cc_counter = 0              # A counter for the total clock cycles the program took
-    mem_cc_counter = 0          # A counter for the amount of clock cycles only memory operations took
-    count_mem_instructions = 0  # A counter for the number of memory instructions executed
+    cc_counter, mem_cc_counter, count_mem_instructions = counters
+    # cc_counter: A counter for the total clock cycles the program took
+    # mem_cc_counter: A counter for the amount of clock cycles only memory operations took
+    # count_mem_instructions: A counter for the number of memory instructions executed
+
+    # Levels that follow the time of the CPU (see MemoryInterface.tick), deepest first
+    clocked_levels = []
+    mem_level = mem_interface
+    while mem_level is not None:
+        if mem_level.clocked:
+            clocked_levels.insert(0, mem_level)
+        mem_level = mem_level.next_mem
+
+    # The trace is decoded in large chunks, see trace_reader
+    trace_chunks = read_trace(trace) if isinstance(trace, str) else trace
+
+    # Records of the trace before start are skipped, whole chunks at a time when possible
+    chunk_start = 0
+    if stop is not None and stop <= start:
+        trace_chunks = []
 
     # Perform instructions according to trace file
-    with open(trace, 'r') as cpu_calls:
-        for next_instruction in cpu_calls:
-
-            next_instruction = next_instruction.rstrip()  # Remove redundant whitespaces
-            inst_decode = next_instruction.split(sim_constants.FILE_DELIMITER)  # Decode instruction
-            num_of_cycles_passed = int(inst_decode[0])  # First component is number of cycles elapsed for non L/S commands
-            cc_counter += num_of_cycles_passed
-            is_store_instruction = (inst_decode[1] == 'S')  # Second component defines (L)oad or (S)tore command
-            address = int(inst_decode[2], 16)  # Third component is the address we're trying to access
-            if is_store_instruction:
-                data = int(inst_decode[3], 16)  # For store commands there is another, 4th component, for data we write
-                data_little_end = big_endian_to_little_endian(data)  # Memory hierarchy stores data in little endian
+    for chunk in trace_chunks:
+        chunk_size = len(chunk.gaps)
+        chunk_start += chunk_size
+        if chunk_start <= start:
+            continue
+        records = chunk_records(chunk)
+        if chunk_start - chunk_size < start:
+            records = islice(records, start - (chunk_start - chunk_size), None)
+        if stop is not None and chunk_start > stop:
+            records = islice(records, max(0, stop - max(start, chunk_start - chunk_size)))
+
+        for num_of_cycles_passed, op, address, data in records:
+            if clocked_levels:
+                for mem_level in clocked_levels:
+                    mem_level.tick(cc_counter, num_of_cycles_passed)
+            cc_counter += num_of_cycles_passed  # Number of cycles elapsed for non L/S commands
+            if timing_model is not None:
+                is_miss = not mem_interface.is_address_present(address)
+            if op == TRACE_OP_STORE:
+                # Memory hierarchy stores data in little endian (same as big_endian_to_little_endian, inlined)
+                data_little_end = data.to_bytes(CPU_DATA_SIZE, 'little')
 
                 # Execute store instruction
                 cycles_elapsed = mem_interface.store(address, CPU_DATA_SIZE, data_little_end)
@@ -185,11 +283,300 @@ def simulate_cpu(trace, mem_interface) -> int:
             cc_counter += cycles_elapsed
             mem_cc_counter += cycles_elapsed
             count_mem_instructions += 1
+            if timing_model is not None:
+                timing_model.access(num_of_cycles_passed, address, is_miss, cycles_elapsed)
+            if recorder is not None and \
+                    (cc_counter if recorder.count_cycles else count_mem_instructions) >= recorder.next_snapshot:
+                recorder.snapshot(cc_counter, mem_cc_counter, count_mem_instructions)
+
+        if stop is not None and chunk_start >= stop:
+            break
 
     return cc_counter, mem_cc_counter, count_mem_instructions
 
 
-def run_sim(levels, b1, b2, trace, memin, memout, l1, l2way0, l2way1, stats):
+def build_hierarchy(levels, b1, b2, main_mem, l1_size=None, l2_size=None) -> (L1Cache, L2Cache):
+    """
+    Constructs the caches of the memory hierarchy on top of the main memory.
+    :param levels: Number of cache levels (1 or 2)
+    :param b1: Size of blocks for L1 cache
+    :param b2: Size of blocks for L2 cache (ignored when levels is 1)
+    :param main_mem: The MainMemory object, last level of the hierarchy
+    :param l1_size: Capacity of L1 cache in bytes (optional, L1Cache.CACHE_SIZE_IN_BYTES by default)
+    :param l2_size: Capacity of L2 cache in bytes (optional, L2Cache.CACHE_SIZE_IN_BYTES by default)
+    :return: (L1 cache object - the first level of the hierarchy, L2 cache object or None when levels is 1)
+    """
+    l2_cache = None
+
+    # Choose L1 cache only or L1 & L2 caches
+    if levels == 1:
+        l1_cache = L1Cache(main_mem, b1, l1_size)
+    elif levels == 2:
+        l2_cache = L2Cache(main_mem, b2, l2_size)
+        l1_cache = L1Cache(l2_cache, b1, l1_size)
+    else:
+        raise ValueError("Invalid levels argument: " + str(levels))
+
+    return l1_cache, l2_cache
+
+
+def set_tag_only(mem_interface):
+    """
+    Switches all levels of the memory hierarchy to tag-only mode (see MemoryInterface.set_tag_only): the caches
+    only track their tags and replacement state and main memory holds no data, so accesses don't move any data.
+    Statistics are the same as in the full mode, but the memory contents can't be dumped.
+    :param mem_interface: Pointer to first level in the memory hierarchy
+    """
+    mem_level = mem_interface
+    while mem_level is not None:
+        mem_level.set_tag_only()
+        mem_level = mem_level.next_mem
+
+
+def check_tag_only_parity(levels, b1, b2, trace, memin) -> dict:
+    """
+    Simulates the trace twice, in the full mode and in tag-only mode, and checks both produce the same statistics.
+    :param levels: Number of cache levels (1 or 2)
+    :param b1: Size of blocks for L1 cache
+    :param b2: Size of blocks for L2 cache (ignored when levels is 1)
+    :param trace: Trace file containing sequence of load / store commands for the CPU to execute
+    :param memin: Initial state of the main memory (only loaded for the full mode)
+    :return: The statistics of the simulation (see compute_statistics)
+    """
+    statistics = []
+    with tempfile.TemporaryDirectory() as dump_dir:
+        for tag_only in (False, True):
+            l1_cache, l2_cache = build_hierarchy(levels, b1, b2, MainMemory(None if tag_only else memin))
+            if tag_only:
+                set_tag_only(l1_cache)
+            counters = simulate_cpu(trace, l1_cache)
+
+            # Dumps are part of the simulation as in run_sim (they write back buffered blocks)
+            dump_files = [NO_DUMP if tag_only else os.path.join(dump_dir, name)
+                          for name in ('memout.txt', 'l1.txt', 'l2way0.txt', 'l2way1.txt')]
+            dump_mem_hierarchy_to_files(l1_cache, levels, *dump_files)
+            statistics.append(compute_statistics(l1_cache, l2_cache, *counters))
+
+    full_statistics, tag_only_statistics = statistics
+    if full_statistics != tag_only_statistics:
+        mismatches = [name for name in full_statistics if full_statistics[name] != tag_only_statistics[name]]
+        raise AssertionError("Tag-only statistics differ from the full mode: " +
+                             ", ".join(name + ' ' + str(full_statistics[name]) + ' != ' +
+                                       str(tag_only_statistics[name]) for name in mismatches))
+    return full_statistics
+
+
+def attach_prefetcher(l1_cache, l2_cache, prefetch, prefetch_level=1, prefetch_degree=None):
+    """
+    Plugs a prefetch stage in front of a cache level (see prefetcher).
+    :param l1_cache: L1 Cache object
+    :param l2_cache: L2 Cache object (or None when there is no L2 cache)
+    :param prefetch: Name of the prefetcher (see prefetcher.PREFETCHERS)
+    :param prefetch_level: The cache level to prefetch into (1 or 2)
+    :param prefetch_degree: Amount of blocks to prefetch on each trigger (optional, prefetcher default)
+    :return: The first level of the hierarchy: the stage itself when prefetching into L1, L1 otherwise
+    """
+    if prefetch not in PREFETCHERS:
+        raise ValueError("Unknown prefetcher: " + str(prefetch))
+    prefetcher = PREFETCHERS[prefetch]() if prefetch_degree is None else PREFETCHERS[prefetch](prefetch_degree)
+
+    if prefetch_level == 1:
+        return PrefetchStage(l1_cache, prefetcher, 'l1_prefetch')
+    elif prefetch_level == 2 and l2_cache is not None:
+        l1_cache.next_mem = PrefetchStage(l2_cache, prefetcher, 'l2_prefetch')
+        return l1_cache
+    raise ValueError("Invalid prefetch level: " + str(prefetch_level))
+
+
+def attach_write_path(l1_cache, l2_cache, victim_cache_entries=None, write_buffer_entries=None,
+                      write_buffer_level=1, write_combining_entries=None):
+    """
+    Plugs a victim cache behind L1, and / or a write buffer behind a cache level, and / or a write-combining buffer
+    behind L1, into the hierarchy.
+    When both are behind L1, the victim cache comes first and its write backs go through the write buffer. The
+    write-combining buffer comes right after L1, in front of both.
+    :param l1_cache: L1 Cache object
+    :param l2_cache: L2 Cache object (or None when there is no L2 cache)
+    :param victim_cache_entries: Number of blocks of the victim cache (optional, no victim cache if None)
+    :param write_buffer_entries: Number of blocks of the write buffer (optional, no write buffer if None)
+    :param write_buffer_level: The cache level whose evictions go through the write buffer (1 or 2)
+    :param write_combining_entries: Number of blocks of the write-combining buffer (optional, no write-combining
+                                    buffer if None)
+    """
+    if write_buffer_entries is not None:
+        if write_buffer_level == 1:
+            l1_cache.next_mem = WriteBuffer(l1_cache.next_mem, write_buffer_entries, 'l1_write_buffer')
+        elif write_buffer_level == 2 and l2_cache is not None:
+            l2_cache.next_mem = WriteBuffer(l2_cache.next_mem, write_buffer_entries, 'l2_write_buffer')
+        else:
+            raise ValueError("Invalid write buffer level: " + str(write_buffer_level))
+
+    if victim_cache_entries is not None:
+        if isinstance(l1_cache, SectoredCache):
+            raise ValueError("Victim caches hold whole blocks, they can't be plugged behind a sectored cache")
+        l1_cache.next_mem = VictimCache(l1_cache.next_mem, l1_cache.get_block_size(), victim_cache_entries,
+                                        'l1_victim_cache')
+
+    if write_combining_entries is not None:
+        l1_cache.next_mem = WriteCombiningBuffer(l1_cache.next_mem, write_combining_entries, 'l1_write_combining')
+
+
+def attach_inclusion(l1_cache, l2_cache, inclusion):
+    """
+    Plugs a port enforcing an inclusion policy between L1 and L2 (see inclusion.InclusionPort). Must be called right
+    after the caches are built, before other components are plugged behind L1.
+    :param l1_cache: L1 Cache object
+    :param l2_cache: L2 Cache object
+    :param inclusion: One of inclusion.INCLUSION_POLICIES
+    """
+    if l2_cache is None:
+        raise ValueError("Inclusion policies require an L2 cache")
+    l1_cache.next_mem = InclusionPort(l1_cache, l2_cache, inclusion)
+
+
+def set_write_policies(caches, write_through_levels=(), no_write_allocate_levels=()):
+    """
+    Switches cache levels to write-through and / or no-write-allocate (see MemoryInterface.write_through,
+    write_allocate), the other levels keep their policies.
+    :param caches: The cache objects, from L1 down
+    :param write_through_levels: Numbers of the levels that write through (1 for L1)
+    :param no_write_allocate_levels: Numbers of the levels that don't allocate on store misses (1 for L1)
+    """
+    for level in list(write_through_levels) + list(no_write_allocate_levels):
+        if not 1 <= level <= len(caches):
+            raise ValueError("Invalid cache level for a write policy: " + str(level) + ", the hierarchy has " +
+                             str(len(caches)) + " cache levels")
+    for level in write_through_levels:
+        caches[level - 1].write_through = True
+    for level in no_write_allocate_levels:
+        caches[level - 1].write_allocate = False
+
+
+def name_traffic_levels(caches, hierarchy=None):
+    """
+    Turns on the traffic statistics of the cache levels (see MemoryInterface.traffic_statistics): the traffic of
+    each level to the next one is reported under its name, l1, l2, ... or the name of the level in a configured
+    hierarchy.
+    :param caches: The cache objects, from L1 down
+    :param hierarchy: The hierarchy configuration the caches were built from (optional, see sim_config)
+    """
+    for cache, name in zip(caches, cache_level_names(caches, hierarchy)):
+        cache.traffic_name = name
+
+
+def cache_level_names(caches, hierarchy=None) -> list:
+    """
+    :param caches: The cache objects, from L1 down
+    :param hierarchy: The hierarchy configuration the caches were built from (optional, see sim_config)
+    :return: The names the statistics of the cache levels are reported under: l1, l2, ... or the names of the levels
+             (lowercase) in a configured hierarchy
+    """
+    if hierarchy is not None:
+        return [level['name'].lower() for level in hierarchy['levels']]
+    return ['l' + str(i + 1) for i in range(len(caches))]
+
+
+def create_stats_recorder(series_file, interval, interval_unit, series_file_format, mem_hierarchy, l1_cache, l2_cache,
+                          main_mem, cache_levels, hierarchy=None, caches=None) -> StatsRecorder:
+    """
+    :param series_file: Path of the statistics series file (see sim_stats)
+    :param interval: Amount of accesses or cycles between snapshots (optional, only the end of the run by default)
+    :param interval_unit: One of sim_stats.INTERVAL_UNITS
+    :param series_file_format: One of sim_stats.SERIES_FORMATS (optional, chosen by the extension by default)
+    :param mem_hierarchy: Pointer to first level in the memory hierarchy
+    :param l1_cache: L1 Cache object
+    :param l2_cache: L2 Cache object (or None when there is no L2 cache)
+    :param main_mem: The main memory object, last level of the hierarchy
+    :param cache_levels: The cache objects, from L1 down
+    :param hierarchy: The hierarchy configuration the caches were built from (optional, see sim_config)
+    :param caches: The cache objects built from the configuration
+    :return: A recorder of the statistics series of the hierarchy. Each snapshot holds the statistics of the stats
+             file (see compute_statistics), the memory accesses, the cycles of the memory and the other
+             instructions, the counters of each level (see sim_stats.level_counters, main memory is named mem) and
+             the extra statistics of the hierarchy (see hierarchy_statistics). Statistics that are costly to collect
+             are only in the final snapshot, they are None in the others (see MemoryInterface.get_interval_statistics).
+    """
+    named_levels = list(zip(cache_level_names(cache_levels, hierarchy), cache_levels)) + [('mem', main_mem)]
+
+    def series_statistics(cycles, mem_cycles, accesses, final) -> dict:
+        statistics = compute_statistics(l1_cache, l2_cache, cycles, mem_cycles, accesses)
+        for name in FLOAT_STATISTICS:
+            statistics[name] = float(statistics[name])  # Rates of empty runs are 0, keep the columns typed
+        statistics['accesses'] = accesses
+        statistics['mem_cycles'] = mem_cycles
+        statistics['compute_cycles'] = cycles - mem_cycles
+        statistics.update(level_counters(named_levels))
+        statistics.update(hierarchy_statistics(mem_hierarchy, hierarchy, caches, final))
+        return statistics
+
+    return StatsRecorder(series_file, series_statistics, interval, interval_unit, series_file_format)
+
+
+def attach_buses(top_levels, bus_levels):
+    """
+    Plugs a bus in front of each of the given levels (see bus): all levels above that point to one of them point to
+    its bus instead, so a level shared by several cores gets a single shared bus.
+    :param top_levels: First level of the hierarchy of each core
+    :param bus_levels: List of (level to put a bus in front of, name of the bus)
+    """
+    buses = {id(level): Bus(level, name=name) for level, name in bus_levels}
+    for top_level in top_levels:
+        mem_level = top_level
+        while mem_level.next_mem is not None:
+            bus = buses.get(id(mem_level.next_mem))
+            if bus is not None and bus is not mem_level:
+                mem_level.next_mem = bus
+            mem_level = mem_level.next_mem
+
+
+def hierarchy_bus_levels(l2_cache, main_mem) -> list:
+    """
+    :param l2_cache: L2 Cache object (or None when there is no L2 cache)
+    :param main_mem: The MainMemory object
+    :return: The levels to put buses in front of, with the names of the buses (see attach_buses)
+    """
+    bus_levels = [(main_mem, 'mem_bus')]
+    if l2_cache is not None:
+        bus_levels.insert(0, (l2_cache, 'l2_bus'))
+    return bus_levels
+
+
+def hierarchy_port_levels(l2_cache, main_mem) -> list:
+    """
+    :param l2_cache: L2 Cache object (or None when there is no L2 cache)
+    :param main_mem: The MainMemory object
+    :return: The levels to put event ports in front of, with the names of the ports (see event_kernel.attach_ports)
+    """
+    port_levels = [(main_mem, 'mem_port')]
+    if l2_cache is not None:
+        port_levels.insert(0, (l2_cache, 'l2_port'))
+    return port_levels
+
+
+def create_main_memory(memin, dram=None, hierarchy=None) -> MainMemory:
+    """
+    :param memin: Initial state of the main memory (may be None, see MainMemory)
+    :param dram: Keyword arguments of DRAMMemory, or None for the flat access time main memory
+    :param hierarchy: A hierarchy configuration whose main memory to build, in place of dram (optional)
+    :return: The main memory object, last level of the hierarchy
+    """
+    if hierarchy is not None:
+        if dram is not None:
+            raise ValueError("DRAM options are part of the hierarchy configuration, they can't be given apart")
+        return build_main_memory(hierarchy, memin)
+    if dram is None:
+        return MainMemory(memin)
+    return DRAMMemory(memin, **dram)
+
+
+def run_sim(levels, b1, b2, trace, memin, memout, l1, l2way0, l2way1, stats, main_mem=None, sparse_dumps=False,
+            prefetch=None, prefetch_level=1, prefetch_degree=None, mshrs=None, victim_cache=None,
+            write_buffer=None, write_buffer_level=1, checkpoint_at=None, checkpoint_file=None, restore=None,
+            sample_period=None, sample_window=None, sample_warmup=0, phases=None, phase_interval=None,
+            tag_only=False, core_traces=None, bus=False, dram=None, event_driven=False, posted_writebacks=False,
+            hierarchy=None, profiler=None, write_through=None, no_write_allocate=None, write_combining=None,
+            traffic=False, inclusion=None, stats_series=None, stats_interval=None, stats_interval_unit='accesses',
+            stats_series_format=None, set_analysis=None):
     """
     Runs a single iteration of the simulation of a CPU on the memory hierarchy.
     :param levels: Number of cache levels (1 or 2)
@@ -202,47 +589,477 @@ def run_sim(levels, b1, b2, trace, memin, memout, l1, l2way0, l2way1, stats):
     :param l2way0: Final state of the L2 cache - way 0 in the end of the simulation (optional)
     :param l2way1: Final state of the L2 cache - way 1 in the end of the simulation (optional)
     :param stats: Output file containing the statistics of the simulation by the end of the simulation
+    :param main_mem: Optional MainMemory object already loaded with memin, to be reused across runs (optional).
+                     It is reset to its initial image before the simulation starts, so memin is not parsed again.
+    :param sparse_dumps: When true, the memory files are dumped in the sparse format (see mem_io), which only
+                         contains non-zero ranges. Use "mem_io.py expand" to convert them back for diffing.
+    :param prefetch: Name of a prefetcher to plug into the hierarchy (optional, see attach_prefetcher).
+                     Its statistics are appended to the stats file.
+    :param prefetch_level: The cache level to prefetch into (1 or 2)
+    :param prefetch_degree: Amount of blocks to prefetch on each trigger (optional)
+    :param mshrs: When given, the accesses are also replayed on a non-blocking L1 with this number of MSHRs
+                  (see mshr). Its statistics are appended to the stats file, the serial statistics are unchanged.
+    :param victim_cache: Number of blocks of a victim cache behind L1 (optional, see attach_write_path)
+    :param write_buffer: Number of blocks of a write buffer (optional, see attach_write_path)
+    :param write_buffer_level: The cache level whose evictions go through the write buffer (1 or 2)
+    :param checkpoint_at: Index of a trace record to checkpoint the simulation before (optional, requires
+                          checkpoint_file). The simulation then continues to the end of the trace.
+    :param checkpoint_file: Path of the checkpoint file written at checkpoint_at (see checkpoint.py)
+    :param restore: Path of a checkpoint file to resume the simulation from (optional). memin is not loaded, and
+                    the trace records before the checkpoint are skipped. The hierarchy must be of the same
+                    configuration as the checkpointed one.
+    :param sample_period: When given, the simulation is sampled: only sample_window records of every sample_period
+                          records are simulated in detail, and the statistics are extrapolated (see sampling).
+                          Memory files are not dumped in sampled simulations.
+    :param sample_window: Amount of measured records in each sampling period
+    :param sample_warmup: Amount of detailed records simulated before each measured window (or representative
+                          interval), and not measured
+    :param phases: When given, the simulation is sampled by phases: the trace is split into intervals of
+                   phase_interval records, clustered into this number of phases, and only one representative
+                   interval of each phase is measured (see sampling). Memory files are not dumped.
+    :param phase_interval: Amount of records in each interval, for phases
+    :param tag_only: When true, the hierarchy runs in tag-only mode (see set_tag_only): no data is moved, memin is
+                     not loaded and the memory files can't be dumped, their names must be NO_DUMP.
+    :param core_traces: Traces of additional cores (optional). When given, the simulation is multi-core: trace
+                        runs on core 0 and each of these on the next cores, with private L1 caches kept coherent
+                        and a shared L2 cache (see multicore, run_multicore).
+    :param bus: When true, buses are plugged in front of the L2 cache and the main memory (see attach_buses), and
+                transfers queue for them. Their statistics are appended to the stats file.
+    :param dram: When given, main memory has DRAM timing (see dram.DRAMMemory) instead of a flat access time: a
+                 dictionary of the keyword arguments of DRAMMemory (empty for the defaults). Its statistics are
+                 appended to the stats file.
+    :param event_driven: When true, the simulation runs on the discrete event kernel (see event_kernel), with a
+                         port in front of each level behind the first. It takes the same cycles as the serial one.
+    :param posted_writebacks: When true, the write backs are posted on the event kernel: the level above doesn't
+                              wait for them, the demand requests that follow them do (implies event_driven).
+                              The statistics of the ports are appended to the stats file.
+    :param hierarchy: A hierarchy configuration, as returned by sim_config.load_config (optional). When given, the
+                      caches and main memory are built from it (levels, b1, b2 and dram are ignored), and the cache
+                      levels are dumped to files named after them next to l1 (see sim_config.config_dump_files).
+                      The counters of the levels below L2 are appended to the stats file.
+    :param profiler: A sim_profile.Profiler collecting the timing of the phases of the run and instrumenting the
+                     hierarchy (optional, nothing is profiled by default)
+    :param write_through: Numbers of the cache levels that write through instead of writing back (optional, see
+                          set_write_policies). Levels of a configured hierarchy may also set their write policy in
+                          the configuration.
+    :param no_write_allocate: Numbers of the cache levels that don't allocate on store misses (optional)
+    :param write_combining: Number of blocks of a write-combining buffer behind L1 (optional, see
+                            write_combining.WriteCombiningBuffer). L1 must be write-through or no-write-allocate (in
+                            write_through, no_write_allocate or the configured hierarchy), a write-back,
+                            write-allocate L1 sends no stores to combine. Its statistics are appended to the stats
+                            file.
+    :param traffic: When true, the read and write traffic between the cache levels is appended to the stats file
+                    (see name_traffic_levels)
+    :param inclusion: An inclusion policy between L1 and L2, one of inclusion.INCLUSION_POLICIES (optional, the
+                      hierarchy is non-inclusive by default). Its statistics are appended to the stats file.
+    :param stats_series: Path of a file to stream snapshots of the statistics to, as a time series (optional, see
+                         sim_stats and create_stats_recorder). The last snapshot is taken at the end of the run.
+    :param stats_interval: Amount of accesses or cycles between the snapshots of stats_series (optional, only the end
+                           of the run is recorded by default)
+    :param stats_interval_unit: Unit of stats_interval, one of sim_stats.INTERVAL_UNITS
+    :param stats_series_format: Format of stats_series, one of sim_stats.SERIES_FORMATS (optional, chosen by the
+                                extension of the file by default)
+    :param set_analysis: A set_analysis.SetAnalysis counting the accesses, misses and evictions of each set of the
+                         cache levels, and the misses of each page of the address space (optional)
     """
+    if profiler is None:
+        profiler = NULL_PROFILER
+
+    if hierarchy is not None:
+        levels = len(hierarchy['levels'])
+        dump_files = config_dump_files(hierarchy, l1, memout)
+    else:
+        dump_files = (l1, memout) if levels == 1 else (l1, l2way0, l2way1, memout)
+
+    if tag_only:
+        if any(file_name != NO_DUMP for file_name in dump_files):
+            raise ValueError("Tag-only simulations hold no data to dump, pass " + NO_DUMP + " as the memory files")
+        if checkpoint_at is not None or restore is not None:
+            raise ValueError("Tag-only simulations don't support checkpoints")
+        main_mem = create_main_memory(None, dram, hierarchy)  # A shared main memory would lose its image
 
     # Construct memory hierarchy
-    main_mem = MainMemory(memin)
-    l1_cache = None
-    l2_cache = None
+    with profiler.phase('memin_load'):
+        if main_mem is None:
+            main_mem = create_main_memory(memin if restore is None else None, dram, hierarchy)
+        else:
+            main_mem.reset()
 
-    # Choose L1 cache only or L1 & L2 caches
-    if levels == 1:
-        l1_cache = L1Cache(main_mem, b1)
-    elif levels == 2:
-        l2_cache = L2Cache(main_mem, b2)
-        l1_cache = L1Cache(l2_cache, b1)
-    else:
-        print("Invalid levels argument")
-        exit(1)
+    event_driven = event_driven or posted_writebacks
+
+    if core_traces:
+        if prefetch is not None or mshrs is not None or victim_cache is not None or write_buffer is not None or \
+                checkpoint_at is not None or restore is not None or sample_period is not None or phases is not None or \
+                hierarchy is not None or write_through or no_write_allocate or write_combining is not None or \
+                traffic or inclusion is not None or stats_series is not None or set_analysis is not None:
+            raise ValueError("Multi-core simulations only support the sparse dumps and tag-only options")
+        with profiler.phase('simulate'):
+            return run_multicore(levels, b1, b2, [trace] + list(core_traces), main_mem, memout, l1, l2way0, l2way1,
+                                 stats, sparse_dumps, tag_only, bus, event_driven, posted_writebacks)
+
+    with profiler.phase('build'):
+        caches = None
+        if hierarchy is not None:
+            caches = build_config_hierarchy(hierarchy, main_mem)
+            l1_cache, l2_cache = caches[0], caches[1] if len(caches) > 1 else None
+        else:
+            l1_cache, l2_cache = build_hierarchy(levels, b1, b2, main_mem)
+
+        if inclusion is not None:
+            if sample_period is not None or phases is not None:
+                raise ValueError("Sampled simulations don't support inclusion policies")
+            attach_inclusion(l1_cache, l2_cache, inclusion)
+
+        cache_levels = caches if caches is not None else [cache for cache in (l1_cache, l2_cache) if cache is not None]
+        set_write_policies(cache_levels, write_through or (), no_write_allocate or ())
+        if traffic:
+            name_traffic_levels(cache_levels, hierarchy)
+
+        if write_combining is not None and l1_cache.write_allocate and not l1_cache.write_through:
+            raise ValueError("A write-combining buffer requires a write-through or no-write-allocate L1: a write-back, "
+                             "write-allocate L1 only evicts whole blocks, there are no stores to combine")
+        if victim_cache is not None or write_buffer is not None or write_combining is not None:
+            attach_write_path(l1_cache, l2_cache, victim_cache, write_buffer, write_buffer_level, write_combining)
+
+        # Memory hierarchy starts here, this is the first memory the CPU tries to access
+        mem_hierarchy = l1_cache
+        if prefetch is not None:
+            mem_hierarchy = attach_prefetcher(l1_cache, l2_cache, prefetch, prefetch_level, prefetch_degree)
+
+        if bus:
+            attach_buses([mem_hierarchy], hierarchy_bus_levels(l2_cache, main_mem))
+
+        if tag_only:
+            set_tag_only(mem_hierarchy)
+
+        if sparse_dumps:
+            mem_level = mem_hierarchy
+            while mem_level is not None:
+                mem_level.sparse_dumps = True
+                mem_level = mem_level.next_mem
+
+    profiler.instrument(mem_hierarchy)
+    if set_analysis is not None:
+        if sample_period is not None or phases is not None:
+            raise ValueError("Sampled simulations don't support the set analysis")
+        set_analysis.instrument(list(zip(cache_level_names(cache_levels, hierarchy), cache_levels)), main_mem)
+
+    # When profiling, the trace is decoded up front so its parse is timed apart from the simulation
+    if profiler.enabled and isinstance(trace, str):
+        with profiler.phase('trace_parse'):
+            trace = list(read_trace(trace))
+
+    timing_model = None
+    if mshrs is not None:
+        timing_model = MSHRTimingModel(mshrs, l1_cache.get_block_size(), l1_cache.transfer_cycles(CPU_DATA_SIZE))
+
+    if event_driven:
+        if timing_model is not None or checkpoint_at is not None or restore is not None or \
+                sample_period is not None or phases is not None or stats_series is not None:
+            raise ValueError("Event driven simulations don't support MSHRs, checkpoints, sampling or statistics series")
+        with profiler.phase('simulate'):
+            return run_event_driven(mem_hierarchy, l1_cache, l2_cache, main_mem, trace, dump_files, stats,
+                                    posted_writebacks, hierarchy, caches)
+
+    if sample_period is not None or phases is not None:
+        if timing_model is not None or checkpoint_at is not None or restore is not None or stats_series is not None:
+            raise ValueError("Sampled simulations don't support MSHRs, checkpoints or statistics series")
+        with profiler.phase('simulate'):
+            return run_sampled(mem_hierarchy, l1_cache, l2_cache, trace, stats, sample_period, sample_window,
+                               sample_warmup, phases, phase_interval, hierarchy, caches)
+
+    recorder = None
+    if stats_series is not None:
+        recorder = create_stats_recorder(stats_series, stats_interval, stats_interval_unit, stats_series_format,
+                                         mem_hierarchy, l1_cache, l2_cache, main_mem, cache_levels, hierarchy, caches)
+
+    trace_offset = 0
+    cpu_counters = (0, 0, 0)
+    if restore is not None:
+        trace_offset, cpu_counters = restore_checkpoint(restore, mem_hierarchy)
 
-    # Memory hierarchy starts here, this is the first memory the CPU tries to access
-    mem_hierarchy = l1_cache
+    if checkpoint_at is not None:
+        if checkpoint_file is None:
+            raise ValueError("A checkpoint file is required to checkpoint the simulation")
+        check_checkpoint_support(mem_hierarchy)
+        cpu_counters = simulate_cpu(trace, mem_hierarchy, timing_model, trace_offset, checkpoint_at, cpu_counters,
+                                    recorder)
+        trace_offset = max(trace_offset, checkpoint_at)
+        save_checkpoint(checkpoint_file, mem_hierarchy, trace_offset, cpu_counters)
 
     # This function drives the simulation of the cpu over the trace file, memory accesses will occur here
-    cycles_elapsed, mem_cycles_elapsed, mem_instructions_count = simulate_cpu(trace, mem_hierarchy)
+    with profiler.phase('simulate'):
+        cycles_elapsed, mem_cycles_elapsed, mem_instructions_count = \
+            simulate_cpu(trace, mem_hierarchy, timing_model, trace_offset, None, cpu_counters, recorder)
 
     # Dumps the state of the memory hierarchy components to the respective output file.
-    dump_mem_hierarchy_to_files(mem_hierarchy, levels, memout, l1, l2way0, l2way1)
+    with profiler.phase('dump'):
+        mem_hierarchy.dump_memory(*dump_files)
 
     # Dumps the statistics of the simulation to the output file
     # Returns statistics relevant for graph plotting
-    l1_miss_rate, cycles_elapsed, amat = \
-        dump_statistics(l1_cache, l2_cache, stats, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count)
+    with profiler.phase('statistics'):
+        extra_statistics = hierarchy_statistics(mem_hierarchy, hierarchy, caches)
+        if timing_model is not None:
+            extra_statistics.update(timing_model.get_extra_statistics())
+        l1_miss_rate, cycles_elapsed, amat = \
+            dump_statistics(l1_cache, l2_cache, stats, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count,
+                            extra_statistics)
+        if recorder is not None:
+            recorder.snapshot(cycles_elapsed, mem_cycles_elapsed, mem_instructions_count, final=True)
+            recorder.close()
     
     print("Simulation ended successfully")
 
     return l1_miss_rate, cycles_elapsed, amat
 
+
+def run_event_driven(mem_hierarchy, l1_cache, l2_cache, main_mem, trace, dump_files, stats, posted_writebacks=False,
+                     hierarchy=None, caches=None):
+    """
+    Runs the simulation on the discrete event kernel, on an already constructed hierarchy (see run_sim).
+    The memory files are dumped to dump_files (see MemoryInterface.dump_memory). The statistics of the kernel are
+    appended to the stats file, after those of the hierarchy.
+    """
+    kernel = EventKernel()
+    attach_ports(kernel, [mem_hierarchy], hierarchy_port_levels(l2_cache, main_mem), posted_writebacks)
+    cycles_elapsed, mem_cycles_elapsed, mem_instructions_count = simulate_events(kernel, [trace], [mem_hierarchy])[0]
+
+    mem_hierarchy.dump_memory(*dump_files)
+
+    extra_statistics = hierarchy_statistics(mem_hierarchy, hierarchy, caches)
+    extra_statistics.update(kernel.get_extra_statistics())
+    l1_miss_rate, cycles_elapsed, amat = \
+        dump_statistics(l1_cache, l2_cache, stats, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count,
+                        extra_statistics)
+
+    print("Event driven simulation ended successfully")
+
+    return l1_miss_rate, cycles_elapsed, amat
+
+
+def run_sampled(mem_hierarchy, l1_cache, l2_cache, trace, stats, sample_period, sample_window, sample_warmup,
+                phases, phase_interval, hierarchy=None, caches=None):
+    """
+    Runs a sampled simulation on an already constructed hierarchy, see run_sim.
+    The extrapolated statistics are written to the stats file, followed by the sampling statistics (confidence
+    intervals or phases) and the statistics of optional components over the detailed parts.
+    """
+    cache_levels = [l1_cache] if l2_cache is None else [l1_cache, l2_cache]
+    if phases is not None:
+        result = simulate_phases(trace, mem_hierarchy, cache_levels, phase_interval, phases, sample_warmup)
+    else:
+        result = simulate_periodic(trace, mem_hierarchy, cache_levels, sample_period,
+                                   sample_window if sample_window is not None else sample_period, sample_warmup)
+
+    extra_statistics = result.extra_statistics
+    extra_statistics.update(hierarchy_statistics(mem_hierarchy, hierarchy, caches))
+    l1_miss_rate, cycles_elapsed, amat = \
+        dump_statistics(result.l1_estimate, result.l2_estimate, stats, result.cycles, result.mem_cycles,
+                        result.mem_instructions, extra_statistics)
+
+    print("Sampled simulation ended successfully")
+
+    return l1_miss_rate, cycles_elapsed, amat
+
+
+def core_file_name(file_name, core: int) -> str:
+    """
+    :param file_name: Name of an output file of the simulation
+    :param core: Core number
+    :return: Name of the same output file for the given core, next to it (i.e: stats.txt -> stats_core1.txt)
+    """
+    if file_name == NO_DUMP:
+        return file_name
+    stem, extension = os.path.splitext(file_name)
+    return stem + '_core' + str(core) + extension
+
+
+def run_multicore(levels, b1, b2, traces, main_mem, memout, l1, l2way0, l2way1, stats, sparse_dumps=False,
+                  tag_only=False, bus=False, event_driven=False, posted_writebacks=False):
+    """
+    Runs a multi-core simulation, a core per trace (see multicore).
+    The stats file holds the statistics of all cores together: the cycles of the core that finished last, and the
+    L1 counters and coherence statistics summed over all cores. Each core also gets a stats file of its own, next
+    to it (see core_file_name), with its own L1 counters and cycles. The L2 counters in all files are those of the
+    shared L2 cache.
+    The shared levels are dumped with the L1 cache of core 0 to the usual files, the L1 caches of the other cores
+    to files next to l1. With bus, the cores share the buses in front of the shared levels, and the statistics of
+    the buses are appended to the stats file. With event_driven, the cores run on the event kernel (see
+    run_event_driven), and share the ports in front of the shared levels.
+    """
+    l1_caches, l2_cache = build_multicore_hierarchy(levels, b1, b2, main_mem, len(traces))
+    if bus:
+        attach_buses(l1_caches, hierarchy_bus_levels(l2_cache, main_mem))
+    kernel = None
+    if event_driven:
+        kernel = EventKernel()
+        attach_ports(kernel, l1_caches, hierarchy_port_levels(l2_cache, main_mem), posted_writebacks)
+    for l1_cache in l1_caches:
+        l1_cache.sparse_dumps = sparse_dumps
+    if l2_cache is not None:
+        l2_cache.sparse_dumps = sparse_dumps
+    main_mem.sparse_dumps = sparse_dumps
+    if tag_only:
+        for l1_cache in l1_caches:
+            set_tag_only(l1_cache)  # The shared levels are switched by the first core
+
+    if kernel is not None:
+        core_counters = simulate_events(kernel, traces, l1_caches)
+    else:
+        core_counters = simulate_multicore(traces, l1_caches)
+
+    dump_mem_hierarchy_to_files(l1_caches[0], levels, memout, l1, l2way0, l2way1)
+    for core, l1_cache in enumerate(l1_caches[1:], 1):
+        l1_cache.dump_private_memory(core_file_name(l1, core))
+
+    for core, (l1_cache, counters) in enumerate(zip(l1_caches, core_counters)):
+        dump_statistics(l1_cache, l2_cache, core_file_name(stats, core), *counters,
+                        extra_statistics=l1_cache.get_extra_statistics())
+
+    extra_statistics = {name: sum(l1_cache.get_extra_statistics()[name] for l1_cache in l1_caches)
+                        for name in l1_caches[0].get_extra_statistics()}
+    extra_statistics.update(collect_extra_statistics(l1_caches[0].next_mem))  # The shared levels
+    if kernel is not None:
+        extra_statistics.update(kernel.get_extra_statistics())
+    l1_miss_rate, cycles_elapsed, amat = \
+        dump_statistics(total_counters(l1_caches), l2_cache, stats, max(counters[0] for counters in core_counters),
+                        sum(counters[1] for counters in core_counters),
+                        sum(counters[2] for counters in core_counters), extra_statistics)
+
+    print("Multi-core simulation ended successfully")
+
+    return l1_miss_rate, cycles_elapsed, amat
+
+
+def parse_options(args):
+    """
+    Parses the optional flags that may follow the 10 positional arguments of the simulator.
+    :param args: Command line arguments following the positional arguments
+    :return: Namespace of parsed options
+    """
+    parser = argparse.ArgumentParser(prog='sim.py <levels> <b1> <b2> <trace> <memin> <memout> <l1> <l2way0> '
+                                          '<l2way1> <stats>')
+    parser.add_argument('--sparse-dumps', action='store_true',
+                        help='Dump memory files in the sparse format (only non-zero ranges)')
+    parser.add_argument('--prefetch', choices=sorted(PREFETCHERS), default=None,
+                        help='Plug a prefetcher into the hierarchy, its statistics are appended to the stats file')
+    parser.add_argument('--prefetch-level', type=int, choices=(1, 2), default=1,
+                        help='The cache level to prefetch into')
+    parser.add_argument('--prefetch-degree', type=int, default=None,
+                        help='Amount of blocks to prefetch on each trigger')
+    parser.add_argument('--mshrs', type=int, default=None,
+                        help='Also report the timing of a non-blocking L1 with this number of MSHRs')
+    parser.add_argument('--victim-cache', type=int, default=None,
+                        help='Plug a victim cache of this number of blocks behind L1')
+    parser.add_argument('--write-buffer', type=int, default=None,
+                        help='Plug a write buffer of this number of blocks behind a cache level')
+    parser.add_argument('--write-buffer-level', type=int, choices=(1, 2), default=1,
+                        help='The cache level whose evictions go through the write buffer')
+    parser.add_argument('--write-through', type=int, action='append', default=None, metavar='LEVEL',
+                        help='Make this cache level write-through (may be repeated)')
+    parser.add_argument('--no-write-allocate', type=int, action='append', default=None, metavar='LEVEL',
+                        help='Make this cache level not allocate on store misses (may be repeated)')
+    parser.add_argument('--write-combining', type=int, default=None, metavar='ENTRIES',
+                        help='Plug a write-combining buffer of this number of blocks behind L1 (requires a '
+                             'write-through or no-write-allocate L1)')
+    parser.add_argument('--traffic', action='store_true',
+                        help='Append the read and write traffic between the cache levels to the stats file')
+    parser.add_argument('--inclusion', choices=INCLUSION_POLICIES, default=None,
+                        help='Inclusion policy between L1 and L2 (non-inclusive by default)')
+    parser.add_argument('--stats-series', default=None, metavar='FILE',
+                        help='Stream snapshots of the named statistics to this file, as a time series (JSON Lines, '
+                             'CSV or Parquet by its extension, see sim_stats)')
+    parser.add_argument('--stats-interval', type=int, default=None,
+                        help='Amount of accesses (or cycles) between the snapshots of --stats-series (only the end '
+                             'of the run by default)')
+    parser.add_argument('--stats-interval-unit', choices=INTERVAL_UNITS, default='accesses',
+                        help='Unit of --stats-interval')
+    parser.add_argument('--stats-format', choices=SERIES_FORMATS, default=None,
+                        help='Format of --stats-series (chosen by the extension of the file by default)')
+    parser.add_argument('--set-analysis', default=None, metavar='REPORT',
+                        help='Count the accesses, misses and evictions of each cache set, and the misses of each '
+                             'page, and write them to this JSON file (see set_analysis, rendered by sim_graph.py)')
+    parser.add_argument('--analysis-page-size', type=int, default=PAGE_SIZE_IN_BYTES,
+                        help='Page size of the per page histograms of --set-analysis, in bytes')
+    parser.add_argument('--checkpoint-at', type=int, default=None,
+                        help='Checkpoint the simulation before this trace record (requires --checkpoint)')
+    parser.add_argument('--checkpoint', default=None, help='Path of the checkpoint file to write')
+    parser.add_argument('--restore', default=None, help='Resume the simulation from this checkpoint file')
+    parser.add_argument('--sample', type=int, default=None, metavar='PERIOD',
+                        help='Sampled simulation: measure a window of every PERIOD records, fast forward the rest '
+                             '(statistics only, memory files are not dumped)')
+    parser.add_argument('--sample-window', type=int, default=None,
+                        help='Amount of measured records in each sampling period')
+    parser.add_argument('--sample-warmup', type=int, default=0,
+                        help='Amount of detailed, not measured, records before each measured window or interval')
+    parser.add_argument('--phases', type=int, default=None,
+                        help='Sampled simulation by phases: measure one representative interval of each of this '
+                             'number of phases (statistics only, memory files are not dumped)')
+    parser.add_argument('--phase-interval', type=int, default=10000,
+                        help='Amount of records in each interval, for --phases')
+    parser.add_argument('--tag-only', action='store_true',
+                        help='Track only tags and replacement state, no data (faster, same statistics). '
+                             'The memory file arguments must be ' + NO_DUMP)
+    parser.add_argument('--core-trace', action='append', default=None, metavar='TRACE',
+                        help='Add a core running this trace, with its own coherent L1 and a shared L2 (may be '
+                             'repeated). Per core stats files are written next to the stats file')
+    parser.add_argument('--bus', action='store_true',
+                        help='Model contention on the buses in front of L2 and main memory, their bandwidth '
+                             'statistics are appended to the stats file')
+    parser.add_argument('--dram', action='store_true',
+                        help='Model main memory as DRAM banks with row buffers, its statistics are appended to the '
+                             'stats file')
+    parser.add_argument('--dram-page-policy', choices=PAGE_POLICIES, default=None,
+                        help='Keep rows open after each access, or precharge the bank (for --dram)')
+    parser.add_argument('--dram-channels', type=int, default=None, help='Number of DRAM channels (for --dram)')
+    parser.add_argument('--dram-ranks', type=int, default=None, help='Number of ranks per channel (for --dram)')
+    parser.add_argument('--dram-banks', type=int, default=None, help='Number of banks per rank (for --dram)')
+    parser.add_argument('--event-driven', action='store_true',
+                        help='Run the simulation on the discrete event kernel (same cycles as the serial model)')
+    parser.add_argument('--posted-writebacks', action='store_true',
+                        help='Post the write backs on the event kernel, the levels stay busy with them while the '
+                             'CPU goes on (implies --event-driven)')
+    parser.add_argument('--config', default=None, metavar='FILE',
+                        help='Build the hierarchy from this configuration file (JSON, TOML or YAML, see sim_config). '
+                             'levels, b1 and b2 are ignored, the caches are dumped next to l1 under their names')
+    parser.add_argument('--profile', default=None, metavar='REPORT',
+                        help='Time the phases of the run and instrument the hierarchy, and write the report to this '
+                             'JSON file (see sim_profile)')
+    parser.add_argument('--cprofile', default=None, metavar='FILE',
+                        help='Capture the run with cProfile, and save it to this file in the pstats format')
+    parser.add_argument('--check-tag-only', action='store_true',
+                        help='Simulate in both the full and the tag-only modes, and check the statistics match')
+    return parser.parse_args(args)
+
+
+def dram_options(options) -> dict:
+    """
+    :param options: Parsed command line options (see parse_options)
+    :return: The keyword arguments of DRAMMemory given on the command line, or None without --dram
+    """
+    if not options.dram:
+        return None
+    dram = {'page_policy': options.dram_page_policy, 'channels': options.dram_channels,
+            'ranks': options.dram_ranks, 'banks': options.dram_banks}
+    return {name: value for name, value in dram.items() if value is not None}
+
+
 if __name__ == "__main__":
     """
     Main function for the memory hierarchy simulation.
     """
     
     try:
+        options = parse_options(sys.argv[11:])
+        hierarchy_config = load_config(options.config) if options.config is not None else None
+        profiler = None
+        if options.profile is not None or options.cprofile is not None:
+            profiler = Profiler(use_cprofile=options.cprofile is not None)
+            profiler.start()
+        set_analysis = None
+        if options.set_analysis is not None:
+            set_analysis = SetAnalysis(options.analysis_page_size)
         run_sim(int(sys.argv[1]),  # levels
                 int(sys.argv[2]),  # b1
                 int(sys.argv[3]),  # b2
@@ -252,7 +1069,52 @@ if __name__ == "__main__":
                 sys.argv[7],       # l1.txt
                 sys.argv[8],       # l2way0.txt
                 sys.argv[9],       # l2way1.txt
-                sys.argv[10])      # stats.txt
+                sys.argv[10],      # stats.txt
+                sparse_dumps=options.sparse_dumps,
+                prefetch=options.prefetch,
+                prefetch_level=options.prefetch_level,
+                prefetch_degree=options.prefetch_degree,
+                mshrs=options.mshrs,
+                victim_cache=options.victim_cache,
+                write_buffer=options.write_buffer,
+                write_buffer_level=options.write_buffer_level,
+                checkpoint_at=options.checkpoint_at,
+                checkpoint_file=options.checkpoint,
+                restore=options.restore,
+                sample_period=options.sample,
+                sample_window=options.sample_window,
+                sample_warmup=options.sample_warmup,
+                phases=options.phases,
+                phase_interval=options.phase_interval,
+                tag_only=options.tag_only,
+                core_traces=options.core_trace,
+                bus=options.bus,
+                dram=dram_options(options),
+                event_driven=options.event_driven,
+                posted_writebacks=options.posted_writebacks,
+                hierarchy=hierarchy_config,
+                profiler=profiler,
+                write_through=options.write_through,
+                no_write_allocate=options.no_write_allocate,
+                write_combining=options.write_combining,
+                traffic=options.traffic,
+                inclusion=options.inclusion,
+                stats_series=options.stats_series,
+                stats_interval=options.stats_interval,
+                stats_interval_unit=options.stats_interval_unit,
+                stats_series_format=options.stats_format,
+                set_analysis=set_analysis)
+        if profiler is not None:
+            profiler.stop()
+            if options.profile is not None:
+                profiler.save_report(options.profile)
+            if options.cprofile is not None:
+                profiler.save_cprofile(options.cprofile)
+        if set_analysis is not None:
+            set_analysis.save_report(options.set_analysis)
+        if options.check_tag_only:
+            check_tag_only_parity(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]), sys.argv[4], sys.argv[5])
+            print("Tag-only statistics match the full mode")
     except NotImplementedError as err:
         print("Simulation ended with an error.")
         tb = traceback.format_exc()
@@ -0,0 +1,338 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import traceback
+from multiprocessing import get_context
+
+import numpy as np
+
+from main_memory import MainMemory
+from sim import build_hierarchy, dump_mem_hierarchy_to_files, simulate_cpu
+from trace_reader import read_trace
+
+
+"""
+    Micro benchmarks of the hot paths of the simulator, and a tracker of throughput regressions between runs.
+
+    Synthetic traces are generated for each access pattern (see PATTERNS), with a memin covering the addresses
+    they access (as tests/l1_and_l2/create_trace_memin.py does, on a larger scale):
+    -   sequential: consecutive words
+    -   strided: a word every STRIDE bytes
+    -   random: uniformly random words
+    -   conflict: a few blocks CONFLICT_DISTANCE bytes apart, mapping to the same set of L1 and L2 (thrashing)
+    -   working_set: random words in a working set that doubles along the trace, up to the whole span
+
+    Each hierarchy configuration runs each trace in a fresh process, whose peak RSS (VmHWM, reset at the start of
+    the run) is its own. Peak RSS is measured on Linux only, it is null elsewhere. The phases of a run are timed
+    separately: memin load, trace parse, simulate_cpu and dumps. The throughput is the amount of accesses per second
+    of simulate_cpu. With repeats, the fastest time of each phase is kept.
+
+    Results are stored as JSON, and the compare command flags the configurations whose throughput dropped by more
+    than a threshold between two result files.
+
+    Example:
+        python sim_bench.py run --accesses 200000 --out before.json
+        python sim_bench.py run --accesses 200000 --out after.json
+        python sim_bench.py compare before.json after.json --threshold 0.1
+"""
+
+PATTERNS = ('sequential', 'strided', 'random', 'conflict', 'working_set')
+
+# Hierarchy configurations benchmarked by default: (levels, b1, b2)
+DEFAULT_CONFIGS = ((1, 4, 0), (1, 32, 0), (2, 8, 32), (2, 32, 128))
+
+SPAN_IN_BYTES = 1024 * 1024      # Addresses accessed by the traces, and covered by memin
+STRIDE = 64                      # In bytes, for the strided pattern
+CONFLICT_DISTANCE = 64 * 1024    # In bytes, a multiple of the L1 size and the L2 way size
+CONFLICT_BLOCKS = 4              # More blocks than the ways of L2
+WORKING_SET_START = 1024         # In bytes, first working set of the working_set pattern
+STORE_FRACTION = 0.3
+MAX_GAP = 10                     # Cycles between accesses are uniform in 0..MAX_GAP, as in create_trace_memin.py
+
+PHASES = ('memin_load', 'trace_parse', 'simulate', 'dump')
+
+# Peak RSS of a worker process, Linux only (see peak_rss_kb)
+PROC_STATUS = '/proc/self/status'
+PROC_CLEAR_REFS = '/proc/self/clear_refs'
+CLEAR_REFS_RESET_PEAK_RSS = '5'
+
+
+def pattern_addresses(pattern: str, num_of_accesses: int, rng: np.random.RandomState) -> np.ndarray:
+    """
+    :param pattern: Name of the access pattern (see PATTERNS)
+    :param num_of_accesses: Length of the trace
+    :param rng: Random generator
+    :return: Word aligned addresses of the accesses
+    """
+    index = np.arange(num_of_accesses, dtype=np.int64)
+    if pattern == 'sequential':
+        addresses = index * 4
+    elif pattern == 'strided':
+        addresses = index * STRIDE
+    elif pattern == 'random':
+        addresses = rng.randint(0, SPAN_IN_BYTES // 4, num_of_accesses) * 4
+    elif pattern == 'conflict':
+        addresses = (index % CONFLICT_BLOCKS) * CONFLICT_DISTANCE + (index // CONFLICT_BLOCKS % 4) * 4
+    elif pattern == 'working_set':
+        # The trace is split in equal segments, the working set doubles from one segment to the next
+        num_of_sets = int(np.log2(SPAN_IN_BYTES // WORKING_SET_START)) + 1
+        working_sets = WORKING_SET_START << (index * num_of_sets // num_of_accesses)
+        addresses = (rng.randint(0, SPAN_IN_BYTES // 4, num_of_accesses) % (working_sets // 4)) * 4
+    else:
+        raise ValueError("Unknown access pattern: " + pattern)
+    return addresses % SPAN_IN_BYTES
+
+
+def generate_trace(pattern: str, num_of_accesses: int, trace_file, memin_file, seed: int = 0):
+    """
+    Writes a synthetic text trace of the given pattern, and a memin covering its addresses.
+    :param pattern: Name of the access pattern (see PATTERNS)
+    :param num_of_accesses: Length of the trace
+    :param trace_file: Path of the output trace file
+    :param memin_file: Path of the output memin file
+    :param seed: Seed of the random generator, the same seed gives the same files
+    """
+    rng = np.random.RandomState(seed)
+    gaps = rng.randint(0, MAX_GAP + 1, num_of_accesses).tolist()
+    is_store = (rng.random_sample(num_of_accesses) < STORE_FRACTION).tolist()
+    store_data = rng.randint(0, 2**32, num_of_accesses, dtype=np.int64).tolist()
+    addresses = pattern_addresses(pattern, num_of_accesses, rng).tolist()
+
+    with open(trace_file, 'w') as trace:
+        trace.write('\n'.join('{0} S {1:06X} {2:08X}'.format(gap, address, data) if store else
+                              '{0} L {1:06X}'.format(gap, address)
+                              for gap, store, address, data in zip(gaps, is_store, addresses, store_data)))
+
+    with open(memin_file, 'w') as mem_in:
+        mem_in.write(rng.randint(0, 256, SPAN_IN_BYTES, dtype=np.uint8).tobytes().hex('\n').upper())
+
+
+def reset_peak_rss():
+    """
+    Resets the peak resident set size of this process to its current RSS, so the next peak_rss_kb only covers what
+    runs from now on. Does nothing when the kernel doesn't support it (the peak then includes the start up).
+    """
+    try:
+        with open(PROC_CLEAR_REFS, 'w') as clear_refs:
+            clear_refs.write(CLEAR_REFS_RESET_PEAK_RSS)
+    except OSError:
+        pass
+
+
+def peak_rss_kb():
+    """
+    :return: Peak resident set size of this process in KB (VmHWM, since its start or reset_peak_rss), or None when
+             it can't be measured. ru_maxrss is not used: it carries over from the parent across fork and exec, so
+             the workers would report the peak of the parent.
+    """
+    try:
+        with open(PROC_STATUS) as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def time_config(trace, memin, levels: int, b1: int, b2: int) -> dict:
+    """
+    Runs a configuration once, timing each phase.
+    :return: Dictionary of phase name -> seconds, and the amount of accesses under 'accesses'
+    """
+    timings = {}
+    start_time = time.perf_counter()
+    main_mem = MainMemory(memin)
+    timings['memin_load'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    trace_chunks = list(read_trace(trace))
+    timings['trace_parse'] = time.perf_counter() - start_time
+
+    l1_cache = build_hierarchy(levels, b1, b2, main_mem)[0]
+    start_time = time.perf_counter()
+    timings['accesses'] = simulate_cpu(trace_chunks, l1_cache)[2]
+    timings['simulate'] = time.perf_counter() - start_time
+
+    with tempfile.TemporaryDirectory() as dump_dir:
+        dump_files = [os.path.join(dump_dir, name) for name in ('memout.txt', 'l1.txt', 'l2way0.txt', 'l2way1.txt')]
+        start_time = time.perf_counter()
+        dump_mem_hierarchy_to_files(l1_cache, levels, *dump_files)
+        timings['dump'] = time.perf_counter() - start_time
+    return timings
+
+
+def bench_config(args) -> dict:
+    """
+    Benchmarks a configuration on a trace, in a worker process of its own (see run_benchmarks).
+    :param args: (pattern, trace file, memin file, levels, b1, b2, repeats)
+    :return: Result row (see run_benchmarks)
+    """
+    pattern, trace, memin, levels, b1, b2, repeats = args
+    reset_peak_rss()
+    runs = [time_config(trace, memin, levels, b1, b2) for repeat in range(repeats)]
+    phases = {phase: min(run[phase] for run in runs) for phase in PHASES}
+    accesses = runs[0]['accesses']
+    return {
+        'pattern': pattern,
+        'levels': levels,
+        'b1': b1,
+        'b2': b2,
+        'accesses': accesses,
+        'phases': phases,
+        'accesses_per_second': accesses / phases['simulate'] if phases['simulate'] else 0.0,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def run_benchmarks(num_of_accesses: int, patterns=PATTERNS, configs=DEFAULT_CONFIGS, repeats: int = 1,
+                   work_dir=None, seed: int = 0) -> dict:
+    """
+    Generates the traces, and benchmarks every configuration on each of them.
+    :param num_of_accesses: Length of each trace
+    :param patterns: Access patterns to generate traces of (see PATTERNS)
+    :param configs: Hierarchy configurations, as (levels, b1, b2) tuples
+    :param repeats: Amount of runs of each configuration, the fastest time of each phase is kept
+    :param work_dir: Directory for the generated traces (optional, a temporary directory by default)
+    :param seed: Seed of the trace generator
+    :return: The benchmark results: the environment, and a result row per pattern and configuration with the
+             time of each phase in seconds, the throughput of simulate_cpu and the peak RSS in KB
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if work_dir is None:
+            work_dir = temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+
+        jobs = []
+        for pattern in patterns:
+            trace = os.path.join(work_dir, pattern + '_trace.txt')
+            memin = os.path.join(work_dir, pattern + '_memin.txt')
+            generate_trace(pattern, num_of_accesses, trace, memin, seed)
+            jobs.extend((pattern, trace, memin, levels, b1, b2, repeats) for levels, b1, b2 in configs)
+
+        # A fresh interpreter per configuration (not a fork of this one, holding the traces), see peak_rss_kb
+        with get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+            results = pool.map(bench_config, jobs, chunksize=1)
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'num_of_accesses': num_of_accesses,
+        'repeats': repeats,
+        'results': results,
+    }
+
+
+def result_key(result: dict) -> tuple:
+    """
+    :param result: Result row (see run_benchmarks)
+    :return: The pattern and configuration of the row, matching rows of different runs
+    """
+    return result['pattern'], result['levels'], result['b1'], result['b2']
+
+
+def compare_results(base: dict, new: dict, threshold: float) -> list:
+    """
+    Compares the throughput of two benchmark runs, configuration by configuration.
+    :param base: Results of the reference run (see run_benchmarks)
+    :param new: Results of the run to check
+    :param threshold: Relative drop of throughput flagged as a regression (i.e: 0.1 for 10%)
+    :return: List of (pattern, levels, b1, b2, base throughput, new throughput, ratio, is regression), for the
+             configurations found in both runs
+    """
+    base_results = {result_key(result): result for result in base['results']}
+    comparison = []
+    for result in new['results']:
+        base_result = base_results.get(result_key(result))
+        if base_result is None:
+            continue
+        base_throughput = base_result['accesses_per_second']
+        new_throughput = result['accesses_per_second']
+        ratio = new_throughput / base_throughput if base_throughput else float('inf')
+        comparison.append(result_key(result) + (base_throughput, new_throughput, ratio, ratio < 1 - threshold))
+    return comparison
+
+
+def print_results(results: dict):
+    """Prints the benchmark results to the console."""
+    columns = ('pattern', 'levels', 'b1', 'b2') + PHASES + ('accesses/s', 'peak_rss_kb')
+    print(' '.join(column.rjust(12) for column in columns))
+    for result in results['results']:
+        values = [result['pattern'], result['levels'], result['b1'], result['b2']] + \
+                 ["{0:.4f}".format(result['phases'][phase]) for phase in PHASES] + \
+                 ["{0:.0f}".format(result['accesses_per_second']), result['peak_rss_kb']]
+        print(' '.join(str(value).rjust(12) for value in values))
+
+
+def print_comparison(comparison: list):
+    """Prints the comparison of two benchmark runs to the console (see compare_results)."""
+    columns = ('pattern', 'levels', 'b1', 'b2', 'base', 'new', 'ratio', '')
+    print(' '.join(column.rjust(12) for column in columns))
+    for pattern, levels, b1, b2, base_throughput, new_throughput, ratio, is_regression in comparison:
+        values = [pattern, levels, b1, b2, "{0:.0f}".format(base_throughput), "{0:.0f}".format(new_throughput),
+                  "{0:.3f}".format(ratio), 'REGRESSION' if is_regression else '']
+        print(' '.join(str(value).rjust(12) for value in values))
+
+
+def parse_config(config: str) -> tuple:
+    """
+    :param config: Configuration given on the command line, as levels,b1,b2 (i.e: 2,8,32)
+    :return: (levels, b1, b2)
+    """
+    values = tuple(int(value) for value in config.split(','))
+    if len(values) != 3:
+        raise argparse.ArgumentTypeError("A configuration is levels,b1,b2, got " + config)
+    return values
+
+
+if __name__ == "__main__":
+    """
+    Main function for benchmarking the simulator.
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks the simulator on synthetic traces, and compares runs.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks')
+    run_parser.add_argument('--accesses', type=int, default=100000, help='Length of each synthetic trace')
+    run_parser.add_argument('--patterns', nargs='+', choices=PATTERNS, default=list(PATTERNS),
+                            help='Access patterns to benchmark')
+    run_parser.add_argument('--config', type=parse_config, action='append', default=None,
+                            help='Hierarchy configuration as levels,b1,b2 (may be repeated, a default set if none)')
+    run_parser.add_argument('--repeat', type=int, default=1, help='Runs of each configuration, the fastest is kept')
+    run_parser.add_argument('--work-dir', default=None, help='Keep the generated traces in this directory')
+    run_parser.add_argument('--seed', type=int, default=0, help='Seed of the trace generator')
+    run_parser.add_argument('--out', default=None, help='Write the results to this JSON file')
+
+    compare_parser = commands.add_parser('compare', help='Flag throughput regressions between two runs')
+    compare_parser.add_argument('base', help='JSON results of the reference run')
+    compare_parser.add_argument('new', help='JSON results of the run to check')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='Relative throughput drop flagged as a regression (default 0.1)')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'run':
+            bench_results = run_benchmarks(args.accesses, args.patterns, args.config or DEFAULT_CONFIGS,
+                                           args.repeat, args.work_dir, args.seed)
+            print_results(bench_results)
+            if args.out is not None:
+                with open(args.out, 'w') as results_out:
+                    json.dump(bench_results, results_out, indent=2)
+        else:
+            with open(args.base) as base_in, open(args.new) as new_in:
+                bench_comparison = compare_results(json.load(base_in), json.load(new_in), args.threshold)
+            print_comparison(bench_comparison)
+            if any(row[-1] for row in bench_comparison):
+                sys.exit(1)
+    except Exception as err:
+        print("Benchmark ended with an error.")
+        tb = traceback.format_exc()
+        print(tb)
+        sys.exit(1)
@@ -0,0 +1,380 @@
+import json
+import os
+
+from dram import PAGE_POLICIES, DRAMMemory
+from l1cache import L1Cache
+from main_memory import MainMemory
+from replacement import REPLACEMENT_POLICIES
+from sectored_cache import SectoredCache
+from set_assoc_cache import SetAssociativeCache
+from sim_constants import NO_DUMP
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11, TOML configurations are then not supported
+    tomllib = None
+
+try:
+    import yaml
+except ImportError:  # PyYAML is optional, YAML configurations are then not supported
+    yaml = None
+
+
+"""
+    Declarative configuration of the memory hierarchy: any number of cache levels, each with its own geometry and
+    timing, on top of main memory. The class constants of the caches and main memory are the defaults of the
+    parameters left out.
+
+    The configuration is a JSON, TOML or YAML file (by extension). Example, in TOML:
+
+        [memory]
+        type = "flat"        # "flat" (MainMemory) or "dram" (DRAMMemory)
+        access_time = 100    # Flat memory only
+        bus_width = 64
+
+        [[levels]]
+        name = "L1"
+        size = 4096
+        block_size = 8
+        hit_time = 1
+        bus_width = 32
+
+        [[levels]]
+        name = "L2"
+        size = 65536
+        block_size = 32
+        ways = 2
+        replacement = "lru"
+        hit_time = 4
+        bus_width = 256
+        write_policy = "write_back"    # "write_back" or "write_through"
+        write_allocate = true
+
+    Levels are listed from the CPU down. A level of a single way is a direct-mapped L1Cache, a level of more ways is
+    a SetAssociativeCache (see LEVEL_PARAMETERS for the parameters of a level, and MEMORY_PARAMETERS for main
+    memory, whose "dram" table holds the keyword arguments of DRAMMemory).
+
+    Configurations are validated as a whole when loaded (see validate_config), so a sweep over many of them fails
+    before any simulation runs, with all the errors found.
+
+    Memory files: a level of a single way is dumped to <name>.txt, a level of N ways to <name>way0.txt ...
+    <name>way<N-1>.txt (lower case names), next to the L1 file given to the simulator. With the names L1 and L2 as
+    above, the files are those of the reference hierarchy.
+"""
+
+# Parameters of a cache level: name -> (types accepted, default - None for the class constant, required if missing)
+LEVEL_PARAMETERS = {
+    'name': (str, ...),
+    'size': (int, None),
+    'block_size': (int, ...),
+    'ways': (int, 1),
+    'replacement': (str, None),
+    'hit_time': (int, None),
+    'bus_width': (int, None),
+    'write_policy': (str, 'write_back'),
+    'write_allocate': (bool, True),
+    'sector_size': (int, None),
+    'fill_sectors': (int, None),
+}
+
+WRITE_POLICIES = ('write_back', 'write_through')
+
+# Parameters of main memory, as above
+MEMORY_PARAMETERS = {
+    'type': (str, 'flat'),
+    'access_time': (int, None),
+    'bus_width': (int, None),
+    'dram': (dict, None),
+}
+
+MEMORY_TYPES = ('flat', 'dram')
+
+# Keyword arguments of DRAMMemory accepted in the dram table of main memory
+DRAM_PARAMETERS = {
+    'channels': int,
+    'ranks': int,
+    'banks': int,
+    'row_size': int,
+    'page_policy': str,
+    't_cl': int,
+    't_rcd': int,
+    't_rp': int,
+    'write_queue_size': int,
+}
+
+MIN_BLOCK_SIZE = 4  # A block holds at least a word of the CPU
+
+
+def is_power_of_2(value: int) -> bool:
+    return value > 0 and not value & (value - 1)
+
+
+def check_parameters(table, parameters: dict, where: str, errors: list) -> dict:
+    """
+    Checks the names and types of the parameters of a table, and fills in the defaults.
+    :param table: Table of the configuration (a dictionary)
+    :param parameters: Known parameters: name -> (types accepted, default)
+    :param where: Name of the table, for the error messages
+    :param errors: List the errors found are appended to
+    :return: The table with all parameters (None for the class constants)
+    """
+    if not isinstance(table, dict):
+        errors.append(where + ": expected a table, got " + repr(table))
+        return {name: default for name, (types, default) in parameters.items() if default is not ...}
+
+    checked = {}
+    for name in table:
+        if name not in parameters:
+            errors.append(where + ": unknown parameter " + repr(name))
+    for name, (types, default) in parameters.items():
+        value = table.get(name, default)
+        if value is ...:
+            errors.append(where + ": missing parameter " + repr(name))
+        elif value is not None and (not isinstance(value, types) or
+                                    (isinstance(value, bool) and types is not bool)):
+            errors.append(where + ": " + name + " must be of type " + types.__name__ + ", got " + repr(value))
+        else:
+            checked[name] = value
+    return checked
+
+
+def validate_level(level: dict, where: str, errors: list):
+    """Checks the geometry and timing of a cache level, see validate_config."""
+    for name in ('block_size', 'ways', 'size'):
+        if level.get(name) is not None and not is_power_of_2(level[name]):
+            errors.append(where + ": " + name + " must be a positive power of 2, got " + str(level[name]))
+    if isinstance(level.get('block_size'), int) and level['block_size'] < MIN_BLOCK_SIZE:
+        errors.append(where + ": block_size must be at least " + str(MIN_BLOCK_SIZE))
+
+    if level.get('sector_size') is not None:
+        default_class = SectoredCache
+    elif level.get('ways') == 1:
+        default_class = L1Cache
+    else:
+        default_class = SetAssociativeCache
+    size = level.get('size') or default_class.CACHE_SIZE_IN_BYTES
+    if is_power_of_2(level.get('block_size') or 0) and is_power_of_2(level.get('ways') or 0) and \
+            size < 2 * level['ways'] * level['block_size']:
+        errors.append(where + ": size " + str(size) + " holds less than 2 sets of " + str(level['ways']) +
+                      " ways of " + str(level['block_size']) + " bytes")
+
+    sector_size = level.get('sector_size')
+    if sector_size is not None:
+        if not is_power_of_2(sector_size) or sector_size < MIN_BLOCK_SIZE:
+            errors.append(where + ": sector_size must be a power of 2 of at least " + str(MIN_BLOCK_SIZE) +
+                          ", got " + str(sector_size))
+        elif isinstance(level.get('block_size'), int) and sector_size > level['block_size']:
+            errors.append(where + ": sector_size " + str(sector_size) + " is larger than the block_size " +
+                          str(level['block_size']))
+        elif level.get('fill_sectors') is not None and is_power_of_2(level.get('block_size') or 0) and \
+                not (is_power_of_2(level['fill_sectors']) and
+                     level['fill_sectors'] <= level['block_size'] // sector_size):
+            errors.append(where + ": fill_sectors must be a power of 2 up to the " +
+                          str(level['block_size'] // sector_size) + " sectors of a block, got " +
+                          str(level['fill_sectors']))
+    elif level.get('fill_sectors') is not None:
+        errors.append(where + ": fill_sectors requires sector_size")
+
+    if level.get('replacement') is not None:
+        if level.get('ways') == 1 and level.get('sector_size') is None:
+            errors.append(where + ": a direct-mapped level has no replacement policy")
+        elif level['replacement'] not in REPLACEMENT_POLICIES:
+            errors.append(where + ": unknown replacement policy " + repr(level['replacement']) + ", expected one of " +
+                          ", ".join(sorted(REPLACEMENT_POLICIES)))
+    if level.get('hit_time') is not None and level['hit_time'] < 0:
+        errors.append(where + ": hit_time can't be negative")
+    if level.get('bus_width') is not None and (level['bus_width'] < 8 or level['bus_width'] % 8):
+        errors.append(where + ": bus_width must be a positive multiple of 8 bits")
+    if level.get('write_policy') is not None and level['write_policy'] not in WRITE_POLICIES:
+        errors.append(where + ": write_policy must be one of " + ", ".join(WRITE_POLICIES) + ", got " +
+                      repr(level['write_policy']))
+
+
+def validate_memory(memory: dict, errors: list):
+    """Checks the parameters of main memory, see validate_config."""
+    if memory.get('type') not in MEMORY_TYPES:
+        errors.append("memory: type must be one of " + ", ".join(MEMORY_TYPES) + ", got " + repr(memory.get('type')))
+    if memory.get('access_time') is not None:
+        if memory.get('type') == 'dram':
+            errors.append("memory: access_time is not used by DRAM, set its timing in the dram table")
+        elif memory['access_time'] < 0:
+            errors.append("memory: access_time can't be negative")
+    if memory.get('bus_width') is not None and (memory['bus_width'] < 8 or memory['bus_width'] % 8):
+        errors.append("memory: bus_width must be a positive multiple of 8 bits")
+
+    dram = memory.get('dram')
+    if dram is not None:
+        if memory.get('type') != 'dram':
+            errors.append("memory: the dram table requires type = \"dram\"")
+        for name, value in dram.items():
+            if name not in DRAM_PARAMETERS:
+                errors.append("memory.dram: unknown parameter " + repr(name))
+            elif not isinstance(value, DRAM_PARAMETERS[name]) or isinstance(value, bool):
+                errors.append("memory.dram: " + name + " must be of type " + DRAM_PARAMETERS[name].__name__ +
+                              ", got " + repr(value))
+            elif name == 'page_policy' and value not in PAGE_POLICIES:
+                errors.append("memory.dram: page_policy must be one of " + ", ".join(PAGE_POLICIES))
+            elif name in ('channels', 'ranks', 'banks', 'row_size') and not is_power_of_2(value):
+                errors.append("memory.dram: " + name + " must be a positive power of 2, got " + str(value))
+            elif name != 'page_policy' and value < (1 if name == 'write_queue_size' else 0):
+                errors.append("memory.dram: " + name + " is out of range, got " + str(value))
+
+
+def validate_config(config) -> dict:
+    """
+    Validates a hierarchy configuration as a whole, and fills in the defaults of the parameters left out.
+    :param config: The configuration, as loaded from its file (see module documentation)
+    :return: The validated configuration: {'memory': {...}, 'levels': [{...}, ...]}, parameters left to the class
+             constants are None
+    :raise ValueError: Listing all the errors found
+    """
+    errors = []
+    if not isinstance(config, dict):
+        raise ValueError("Invalid hierarchy configuration: expected a table, got " + repr(config))
+    for name in config:
+        if name not in ('memory', 'levels'):
+            errors.append("unknown table " + repr(name))
+
+    memory = check_parameters(config.get('memory', {}), MEMORY_PARAMETERS, 'memory', errors)
+    validate_memory(memory, errors)
+
+    levels = []
+    level_tables = config.get('levels')
+    if not isinstance(level_tables, list) or not level_tables:
+        errors.append("levels: expected a list of at least one cache level")
+        level_tables = []
+    for i, level_table in enumerate(level_tables):
+        where = 'levels[' + str(i) + ']'
+        level = check_parameters(level_table, LEVEL_PARAMETERS, where, errors)
+        validate_level(level, where, errors)
+        levels.append(level)
+
+    names = [level.get('name', '').lower() for level in levels]
+    for name in set(names):
+        if names.count(name) > 1:
+            errors.append("levels: the name " + repr(name) + " is used by more than one level (names are not case "
+                          "sensitive, they name the memory files)")
+
+    # A level returns entire blocks of the level above it
+    for i in range(1, len(levels)):
+        above, below = levels[i - 1].get('block_size'), levels[i].get('block_size')
+        if isinstance(above, int) and isinstance(below, int) and below < above:
+            errors.append("levels[" + str(i) + "]: block_size " + str(below) + " is smaller than the block_size " +
+                          str(above) + " of the level above it")
+
+    if errors:
+        raise ValueError("Invalid hierarchy configuration:\n    " + "\n    ".join(errors))
+    return {'memory': memory, 'levels': levels}
+
+
+def load_config(file_name) -> dict:
+    """
+    Loads and validates a hierarchy configuration file (see validate_config).
+    :param file_name: Path of a JSON (.json), TOML (.toml) or YAML (.yaml, .yml) file
+    :return: The validated configuration
+    """
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == '.json':
+        with open(file_name) as config_in:
+            config = json.load(config_in)
+    elif extension == '.toml':
+        if tomllib is None:
+            raise ValueError("TOML configurations require Python 3.11 or later (tomllib)")
+        with open(file_name, 'rb') as config_in:
+            config = tomllib.load(config_in)
+    elif extension in ('.yaml', '.yml'):
+        if yaml is None:
+            raise ValueError("YAML configurations require PyYAML")
+        with open(file_name) as config_in:
+            config = yaml.safe_load(config_in)
+    else:
+        raise ValueError("Unknown configuration format " + repr(extension) + ", expected .json, .toml or .yaml")
+
+    try:
+        return validate_config(config)
+    except ValueError as err:
+        raise ValueError(str(file_name) + ": " + str(err)) from None
+
+
+def build_main_memory(config: dict, memin) -> MainMemory:
+    """
+    :param config: Validated hierarchy configuration
+    :param memin: Initial state of the main memory (may be None, see MainMemory)
+    :return: The main memory of the configuration
+    """
+    memory = config['memory']
+    if memory['type'] == 'dram':
+        main_mem = DRAMMemory(memin, **(memory['dram'] or {}))
+    else:
+        main_mem = MainMemory(memin)
+        if memory['access_time'] is not None:
+            main_mem.MEM_ACCESS_TIME = memory['access_time']
+    if memory['bus_width'] is not None:
+        main_mem.MEM_BUS_WIDTH = memory['bus_width']
+    return main_mem
+
+
+def build_config_hierarchy(config: dict, main_mem: MainMemory) -> list:
+    """
+    Constructs the cache levels of a configuration on top of the main memory.
+    :param config: Validated hierarchy configuration
+    :param main_mem: The main memory, last level of the hierarchy (see build_main_memory)
+    :return: The cache objects, from the first level (the one the CPU accesses) down
+    """
+    caches = []
+    next_level = main_mem
+    for level in reversed(config['levels']):
+        if level['sector_size'] is not None:
+            cache = SectoredCache(next_level, level['block_size'], level['sector_size'], level['fill_sectors'],
+                                  level['size'], level['ways'], level['replacement'], level['hit_time'],
+                                  level['bus_width'], level['name'].lower())
+        elif level['ways'] == 1:
+            cache = L1Cache(next_level, level['block_size'], level['size'])
+            if level['hit_time'] is not None:
+                cache.MEM_HIT_TIME = level['hit_time']
+            if level['bus_width'] is not None:
+                cache.MEM_BUS_WIDTH = level['bus_width']
+        else:
+            cache = SetAssociativeCache(next_level, level['block_size'], level['size'], level['ways'],
+                                        level['replacement'], level['hit_time'], level['bus_width'])
+        cache.write_through = level['write_policy'] == 'write_through'
+        cache.write_allocate = level['write_allocate']
+        caches.insert(0, cache)
+        next_level = cache
+    return caches
+
+
+def config_dump_files(config: dict, l1, memout) -> list:
+    """
+    :param config: Validated hierarchy configuration
+    :param l1: Name of the L1 cache output file, the files of all cache levels are placed next to it
+    :param memout: Name of main memory output file
+    :return: The memory files of the hierarchy, in the order of dump_memory (see module documentation). All are
+             NO_DUMP when l1 is NO_DUMP.
+    """
+    dump_files = []
+    dump_dir = os.path.dirname(l1)
+    for level in config['levels']:
+        name = level['name'].lower()
+        if level['ways'] == 1:
+            names = [name + '.txt']
+        else:
+            names = [name + 'way' + str(way) + '.txt' for way in range(level['ways'])]
+        dump_files.extend(NO_DUMP if l1 == NO_DUMP else os.path.join(dump_dir, name) for name in names)
+    dump_files.append(memout)
+    return dump_files
+
+
+def deep_level_statistics(config: dict, caches) -> dict:
+    """
+    :param config: Validated hierarchy configuration
+    :param caches: The cache objects of the configuration (see build_config_hierarchy)
+    :return: The hit / miss counters of the levels below L2 (the stats file holds those of L1 and L2), named after
+             their levels
+    """
+    statistics = {}
+    for level, cache in list(zip(config['levels'], caches))[2:]:
+        name = level['name'].lower()
+        for counter in ('read_hits', 'write_hits', 'read_misses', 'write_misses'):
+            statistics[name + '_' + counter] = getattr(cache, counter)
+    return statistics
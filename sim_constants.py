@@ -3,3 +3,6 @@ FILE_DELIMITER = ' '
 
 # Size of bytes for CPU data
 CPU_DATA_SIZE = 4
+
+# Name given instead of a memory dump file, when the dump is not wanted (required for tag-only simulations)
+NO_DUMP = '-'
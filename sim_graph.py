@@ -1,6 +1,13 @@
+import json
+import os
+import sys
 import traceback
 import matplotlib.pyplot as plt
-from sim import run_sim
+import numpy as np
+from matplotlib.ticker import MaxNLocator
+from sim_sweep import run_sweep
+
+HEATMAP_COLUMNS = 64  # Sets (or pages) per row of a heatmap
 
 
 def plot(x_vals, y_vals, title, x_axis, y_axis, x_ticks, y_ticks):
@@ -16,23 +23,27 @@ def plot(x_vals, y_vals, title, x_axis, y_axis, x_ticks, y_ticks):
     plt.show()
 
 
-def plot_by_l2_block(block_start, block_end, block_l1):
-
-    mode = 2
+def block_sizes(block_start, block_end) -> list:
+    """
+    :return: Block sizes from block_start to block_end (inclusive), multiplied by 2 each step
+    """
+    sizes = []
+    block = block_start
+    while block <= block_end:
+        sizes.append(block)
+        block *= 2
+    return sizes
 
-    block_l2 = block_start
-    x_vals = []
-    y_vals = []
 
-    while block_l2 <= block_end:
-        l1_miss_rate, cycles_elapsed, amat =\
-            run_sim(mode, block_l1, block_l2, 'trace.txt', 'memin.txt', 'memout.txt', 'l1.txt',
-                'l2way0.txt', 'l2way1.txt', 'stats.txt')
+def plot_by_l2_block(block_start, block_end, block_l1):
 
-        x_vals.append(block_l2)
-        y_vals.append(amat)
+    mode = 2
 
-        block_l2 *= 2
+    # All block sizes are simulated in parallel, parsing trace and memin once
+    results = run_sweep('trace.txt', 'memin.txt', {'levels': [mode], 'b1': [block_l1],
+                                                   'b2': block_sizes(block_start, block_end)})
+    x_vals = [result['b2'] for result in results]
+    y_vals = [result['amat'] for result in results]
 
     x_axis = 'L2 Block size'
     y_axis = 'Amat'
@@ -46,19 +57,11 @@ def plot_by_l1_block(block_start, block_end, block_l2):
 
     mode = 1 if (block_l2 == 0) else 2
 
-    block_l1 = block_start
-    x_vals = []
-    y_vals = []
-
-    while block_l1 <= block_end:
-        l1_miss_rate, cycles_elapsed, amat =\
-            run_sim(mode, block_l1, block_l2, 'trace.txt', 'memin.txt', 'memout.txt', 'l1.txt',
-                'l2way0.txt', 'l2way1.txt', 'stats.txt')
-
-        x_vals.append(block_l1)
-        y_vals.append(l1_miss_rate if (mode == 1) else cycles_elapsed)
-
-        block_l1 *= 2
+    # All block sizes are simulated in parallel, parsing trace and memin once
+    results = run_sweep('trace.txt', 'memin.txt', {'levels': [mode], 'b1': block_sizes(block_start, block_end),
+                                                   'b2': [block_l2]})
+    x_vals = [result['b1'] for result in results]
+    y_vals = [result['l1_miss_rate'] if (mode == 1) else result['cycles'] for result in results]
 
     x_axis = 'L1 Block size'
     y_axis = 'L1 Miss Rate' if (mode == 1) else 'Total Runtime (cycles)'
@@ -68,14 +71,101 @@ def plot_by_l1_block(block_start, block_end, block_l2):
     plot(x_vals, y_vals, title, x_axis, y_axis, x_ticks, y_ticks)
 
 
+def heatmap_grid(counts) -> np.ndarray:
+    """
+    :param counts: Counters, one per set (or page)
+    :return: The counters as rows of HEATMAP_COLUMNS counters (fewer if there are less counters), the last row is
+             padded with NaN, which is drawn blank
+    """
+    columns = max(1, min(HEATMAP_COLUMNS, len(counts)))
+    grid = np.full(-(-len(counts) // columns) * columns, np.nan)
+    grid[:len(counts)] = counts
+    return grid.reshape(-1, columns)
+
+
+def plot_heatmap(figure, axis, counts, title, first_index=0):
+    """
+    Draws counters as a heatmap: counter i is in row i // columns and column i % columns.
+    :param first_index: Index of the first counter (i.e: the first page drawn), for the labels
+    """
+    grid = heatmap_grid(counts)
+    image = axis.imshow(grid, aspect='auto', interpolation='nearest', cmap='hot')
+    axis.set_title(title)
+    axis.set_xlabel('+ column')
+    axis.set_ylabel(str(first_index) + ' + row * ' + str(grid.shape[1]))
+    axis.yaxis.set_major_locator(MaxNLocator(integer=True))
+    figure.colorbar(image, ax=axis)
+
+
+def plot_set_heatmaps(level_report, out_dir='.'):
+    """
+    Draws the accesses, misses and evictions of each set of a cache level (see set_analysis), saved as
+    <level>_sets.png in out_dir. Thrashing sets are hot in the misses and evictions maps.
+    """
+    counter_names = ('accesses', 'misses', 'evictions')
+    figure, axes = plt.subplots(1, len(counter_names), figsize=(6 * len(counter_names), 5))
+    for axis, counter_name in zip(axes, counter_names):
+        plot_heatmap(figure, axis, level_report[counter_name],
+                     level_report['level'].upper() + ' ' + counter_name + ' per set')
+    figure.tight_layout()
+    figure.savefig(os.path.join(out_dir, level_report['level'] + '_sets.png'))
+    plt.close(figure)
+
+
+def plot_page_heatmaps(report, out_dir='.'):
+    """
+    Draws the misses of each cache level, and the reads and writes of main memory, per page of the address space
+    (see set_analysis), over the range of pages with any count. Saved as pages.png in out_dir.
+    """
+    page_maps = [(level_report['level'].upper() + ' misses', level_report['page_misses'])
+                 for level_report in report['levels']]
+    page_maps += [('Memory reads', report['memory']['page_reads']), ('Memory writes', report['memory']['page_writes'])]
+    pages = [int(page) for title, page_counts in page_maps for page in page_counts]
+    first_page = min(pages, default=0)
+    last_page = max(pages, default=0)
+
+    figure, axes = plt.subplots(1, len(page_maps), figsize=(6 * len(page_maps), 5), squeeze=False)
+    for axis, (title, page_counts) in zip(axes[0], page_maps):
+        counts = np.zeros(last_page - first_page + 1)
+        for page, count in page_counts.items():
+            counts[int(page) - first_page] = count
+        plot_heatmap(figure, axis, counts, title + ' per page (' + str(report['page_size']) + ' bytes)', first_page)
+    figure.tight_layout()
+    figure.savefig(os.path.join(out_dir, 'pages.png'))
+    plt.close(figure)
+
+
+def plot_set_analysis(report_file, out_dir='.'):
+    """
+    Renders a set analysis report (see sim.py --set-analysis) as heatmaps in out_dir, and prints the hot sets of
+    each cache level.
+    :param report_file: Path of the JSON report
+    :param out_dir: Directory of the images
+    """
+    with open(report_file) as report_in:
+        report = json.load(report_in)
+    for level_report in report['levels']:
+        plot_set_heatmaps(level_report, out_dir)
+        print(level_report['level'].upper() + ' hot sets (set: accesses / misses / evictions):')
+        for hot_set in level_report['hot_sets']:
+            print('    ' + str(hot_set['set']).rjust(6) + ': ' + str(hot_set['accesses']) + ' / ' +
+                  str(hot_set['misses']) + ' / ' + str(hot_set['evictions']))
+    plot_page_heatmaps(report, out_dir)
+
+
 if __name__ == "__main__":
     """
     Main function for the memory hierarchy simulation.
+    Without arguments, plots the block size sweeps. With a set analysis report (and optionally an output
+    directory), renders its heatmaps.
     """
     try:
-        plot_by_l1_block(4, 128, 0)
-        plot_by_l1_block(4, 128, 128)
-        plot_by_l2_block(8, 256, 8)
+        if len(sys.argv) > 1:
+            plot_set_analysis(*sys.argv[1:3])
+        else:
+            plot_by_l1_block(4, 128, 0)
+            plot_by_l1_block(4, 128, 128)
+            plot_by_l2_block(8, 256, 8)
     except Exception as err:
         print("Simulation plotting ended with an error.")
         tb = traceback.format_exc()
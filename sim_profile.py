@@ -0,0 +1,218 @@
+import cProfile
+import json
+import time
+from contextlib import contextmanager
+
+
+"""
+    Profiling of the simulator itself: where the wall time of a run goes, and where the simulated cycles come from.
+
+    A Profiler is handed to sim.run_sim, which reports to it:
+    -   Phases: wall time of each phase of the run (memin load, hierarchy build, trace parse, simulation, dumps,
+        statistics). When profiling, the trace is decoded before the simulation, so its parse is timed on its own.
+    -   Levels: every level of the hierarchy (caches, main memory, and stages such as buses or write buffers) is
+        instrumented: its methods (see INSTRUMENTED_METHODS) are wrapped on the instance, counting the calls and
+        their wall time (inclusive of the levels they call).
+    -   Simulated cycles of each level, from the cycles returned by the requests between levels:
+        -   access_cycles: all cycles returned by the requests to the level (from the CPU or the level above)
+        -   miss_penalty_cycles: cycles of the loads this level issued to the levels below it
+        -   writeback_cycles: cycles of the write backs (and victims) this level handed to the levels below it
+        -   prefetch_cycles: cycles of the prefetches this level issued to the levels below it
+        -   hit_cycles: the rest of access_cycles, spent in the level itself
+        Components that don't charge the cycles of the levels below them (i.e: a write buffer) make hit_cycles of
+        the level above smaller than its own hit time.
+    -   Write backs of each level: flushes (flush_if_needed calls), write backs it issued and write backs it received.
+    Optionally, the whole run is also captured by cProfile, and saved in the pstats format.
+
+    A disabled profiler (see NULL_PROFILER) doesn't instrument anything, a run then only pays for a handful of
+    no-op phase calls.
+
+    The report is a JSON file:
+        {"phases": {name: seconds}, "total_seconds": seconds,
+         "levels": [{"level": "0:L1Cache", "methods": {name: {"calls": n, "seconds": s}}, "flushes": n,
+                     "writebacks": n, "writebacks_received": n, "cycles": {name: cycles}}, ...]}
+"""
+
+# Methods of a level that are instrumented, and the cycles bucket of the level calling them (None: not a request
+# between levels)
+INSTRUMENTED_METHODS = {
+    'load': 'miss_penalty_cycles',
+    'store': 'writeback_cycles',
+    'prefetch': 'prefetch_cycles',
+    'evict_block': 'writeback_cycles',
+    'read': None,
+    'write': None,
+    'flush_if_needed': None,
+}
+
+CYCLES_NAMES = ('access_cycles', 'hit_cycles', 'miss_penalty_cycles', 'writeback_cycles', 'prefetch_cycles')
+
+
+class LevelProfile(object):
+    """
+    Counters of an instrumented level of the hierarchy.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = {method_name: 0 for method_name in INSTRUMENTED_METHODS}
+        self.seconds = {method_name: 0.0 for method_name in INSTRUMENTED_METHODS}
+        self.cycles = {name: 0 for name in CYCLES_NAMES}
+        self.writebacks = 0
+        self.writebacks_received = 0
+
+    def report(self) -> dict:
+        """
+        :return: The counters of the level, as a JSON serializable dictionary (see module documentation)
+        """
+        cycles = dict(self.cycles)
+        cycles['hit_cycles'] = cycles['access_cycles'] - cycles['miss_penalty_cycles'] - \
+            cycles['writeback_cycles'] - cycles['prefetch_cycles']
+        return {
+            'level': self.name,
+            'methods': {method_name: {'calls': self.calls[method_name], 'seconds': self.seconds[method_name]}
+                        for method_name in INSTRUMENTED_METHODS if self.calls[method_name]},
+            'flushes': self.calls['flush_if_needed'],
+            'writebacks': self.writebacks,
+            'writebacks_received': self.writebacks_received,
+            'cycles': cycles,
+        }
+
+
+class Profiler(object):
+    """
+    Collects the phase timings and the per level counters of a run, see the module documentation.
+    """
+
+    enabled = True
+
+    def __init__(self, use_cprofile: bool = False):
+        """
+        :param use_cprofile: True to also capture the run with cProfile (see start, save_cprofile)
+        """
+        self.phases = {}
+        self.levels = []
+        self.stack = []  # Profiles of the levels whose methods are running, innermost last
+        self.cprofile = cProfile.Profile() if use_cprofile else None
+        self.start_time = None
+        self.total_seconds = 0.0
+
+    def start(self):
+        """Starts timing the run (and the cProfile capture)."""
+        self.start_time = time.perf_counter()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self):
+        """Stops timing the run (and the cProfile capture)."""
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.total_seconds += time.perf_counter() - self.start_time
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Times a phase of the run, the time of phases of the same name adds up.
+        :param name: Name of the phase
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start_time
+
+    def instrument(self, mem_interface):
+        """
+        Instruments all levels of a hierarchy, from the given level to main memory.
+        :param mem_interface: Pointer to first level in the memory hierarchy
+        """
+        mem_level = mem_interface
+        while mem_level is not None:
+            profile = LevelProfile(str(len(self.levels)) + ':' + type(mem_level).__name__)
+            self.levels.append(profile)
+            for method_name, cycles_name in INSTRUMENTED_METHODS.items():
+                setattr(mem_level, method_name,
+                        self.wrap(getattr(mem_level, method_name), method_name, cycles_name, profile))
+            mem_level = mem_level.next_mem
+
+    def wrap(self, method, method_name: str, cycles_name, profile: LevelProfile):
+        """
+        :param method: Bound method of a level
+        :param method_name: Name of the method
+        :param cycles_name: Cycles bucket of the calling level (see INSTRUMENTED_METHODS)
+        :param profile: Counters of the level
+        :return: The method, counting its calls, wall time and cycles in profile
+        """
+        stack = self.stack
+        perf_counter = time.perf_counter
+        is_load = method_name == 'load'
+        is_request = cycles_name is not None
+        is_writeback = method_name in ('store', 'evict_block')
+
+        def instrumented(*args):
+            caller = stack[-1] if stack else None
+            stack.append(profile)
+            start_time = perf_counter()
+            try:
+                result = method(*args)
+            finally:
+                profile.seconds[method_name] += perf_counter() - start_time
+                stack.pop()
+            profile.calls[method_name] += 1
+
+            # Requests of a level to itself (i.e: evict_block storing the block) are part of the outer request
+            if is_request and caller is not profile:
+                cycles_elapsed = result[1] if is_load else result
+                profile.cycles['access_cycles'] += cycles_elapsed
+                if caller is not None:
+                    caller.cycles[cycles_name] += cycles_elapsed
+                    # evict_block(address, block_size, data, is_dirty): clean victims are not write backs
+                    if is_writeback and (method_name == 'store' or args[3]):
+                        caller.writebacks += 1
+                        profile.writebacks_received += 1
+            return result
+
+        return instrumented
+
+    def report(self) -> dict:
+        """
+        :return: The report of the run, as a JSON serializable dictionary (see module documentation)
+        """
+        return {
+            'phases': self.phases,
+            'total_seconds': self.total_seconds,
+            'levels': [profile.report() for profile in self.levels],
+        }
+
+    def save_report(self, file_name):
+        """
+        Writes the report of the run as JSON.
+        :param file_name: Path of the output file
+        """
+        with open(file_name, 'w') as report_out:
+            json.dump(self.report(), report_out, indent=2)
+
+    def save_cprofile(self, file_name):
+        """
+        Saves the cProfile capture of the run, in the pstats format (i.e: for python -m pstats).
+        :param file_name: Path of the output file
+        """
+        self.cprofile.dump_stats(file_name)
+
+
+class NullProfiler(object):
+    """
+    A disabled profiler: phases are not timed and the hierarchy is not instrumented.
+    """
+
+    enabled = False
+
+    @contextmanager
+    def phase(self, name: str):
+        yield
+
+    def instrument(self, mem_interface):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
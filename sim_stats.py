@@ -0,0 +1,230 @@
+import csv
+import json
+import os
+import queue
+import threading
+
+from checkpoint import COUNTER_NAMES
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet series are optional
+    pyarrow = None
+
+
+"""
+    Statistics time series of a run: snapshots of named counters, taken periodically during the simulation and at
+    its end, and streamed to a JSON Lines, CSV or Parquet file.
+
+    A StatsRecorder is handed to sim.simulate_cpu (see sim.run_sim), which takes a snapshot every interval memory
+    accesses or cycles. A snapshot is a row of the series, its counters are cumulative (the activity of an interval
+    is the difference between two consecutive rows):
+    -   interval: number of the snapshot, from 0. final: true for the snapshot of the end of the run only, taken
+        once the hierarchy is dumped, so it matches the stats file.
+    -   The statistics given by the collect function of the recorder, see sim.series_statistics: the statistics of
+        the stats file under their names (see sim.compute_statistics), the split of the cycles, the counters of each
+        level of the hierarchy (see level_counters) and the extra statistics of all components (i.e: bus beats).
+        Statistics that are costly to collect (i.e: the effective capacity of an inclusion policy, which scans the
+        caches) are only in the final snapshot, they are null in the others.
+
+    Snapshots are taken on the simulation thread, so their counters are consistent, and handed to a writer thread
+    through a queue: the simulation doesn't wait for the output file. Errors of the writer thread are raised by
+    close.
+"""
+
+# Units of the interval between snapshots
+INTERVAL_UNITS = ('accesses', 'cycles')
+
+# Formats of the series file, and the extensions they are chosen by when not given
+SERIES_FORMATS = ('jsonl', 'csv', 'parquet')
+SERIES_EXTENSIONS = {'.jsonl': 'jsonl', '.csv': 'csv', '.parquet': 'parquet'}
+
+PARQUET_BATCH_ROWS = 1024  # Rows buffered by the writer thread before a Parquet row group is written
+
+
+def level_counters(named_levels) -> dict:
+    """
+    :param named_levels: List of (name, level) of the levels to report, i.e: [('l1', l1_cache), ('mem', main_mem)]
+    :return: The counters of each level (hits and misses by type, evictions, and its read and write traffic to the
+             next level - the write transfers are its write backs and write throughs), as a dictionary of statistic
+             name -> value prefixed by the name of the level
+    """
+    counters = dict()
+    for name, level in named_levels:
+        for counter_name in COUNTER_NAMES:
+            counters[name + '_' + counter_name] = int(getattr(level, counter_name))
+    return counters
+
+
+def series_format(file_name, file_format=None) -> str:
+    """
+    :param file_name: Path of the series file
+    :param file_format: One of SERIES_FORMATS, or None to choose it by the extension of file_name
+    :return: The format of the series file
+    """
+    if file_format is None:
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension not in SERIES_EXTENSIONS:
+            raise ValueError("Unknown statistics series format " + repr(extension) + ", expected .jsonl, .csv or "
+                             ".parquet")
+        file_format = SERIES_EXTENSIONS[extension]
+    if file_format not in SERIES_FORMATS:
+        raise ValueError("Invalid statistics series format: " + str(file_format) + ", expected one of " +
+                         ", ".join(SERIES_FORMATS))
+    if file_format == 'parquet' and pyarrow is None:
+        raise ValueError("Parquet statistics series require pyarrow")
+    return file_format
+
+
+class JSONLinesWriter(object):
+    """
+    Writes rows of a series as JSON objects, one per line.
+    """
+
+    def __init__(self, file_name):
+        self.series_out = open(file_name, 'w')
+
+    def write(self, row: dict):
+        self.series_out.write(json.dumps(row) + '\n')
+
+    def close(self):
+        self.series_out.close()
+
+
+class CSVWriter(object):
+    """
+    Writes rows of a series as CSV, the columns are those of the first row.
+    """
+
+    def __init__(self, file_name):
+        self.series_out = open(file_name, 'w', newline='')
+        self.csv_writer = None
+
+    def write(self, row: dict):
+        if self.csv_writer is None:
+            self.csv_writer = csv.DictWriter(self.series_out, fieldnames=list(row))
+            self.csv_writer.writeheader()
+        self.csv_writer.writerow(row)
+
+    def close(self):
+        self.series_out.close()
+
+
+class ParquetWriter(object):
+    """
+    Writes rows of a series as Parquet, PARQUET_BATCH_ROWS rows per row group. The schema is that of the first
+    row group, columns that are null all along it (statistics of the final snapshot only) are typed float64.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.rows = []
+        self.parquet_writer = None
+
+    def write(self, row: dict):
+        self.rows.append(row)
+        if len(self.rows) >= PARQUET_BATCH_ROWS:
+            self.write_rows()
+
+    def write_rows(self):
+        """Writes the buffered rows as a row group."""
+        if self.parquet_writer is None:
+            table = pyarrow.Table.from_pylist(self.rows)
+            schema = pyarrow.schema([field.with_type(pyarrow.float64()) if pyarrow.types.is_null(field.type) else field
+                                     for field in table.schema])
+            table = table.cast(schema)
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(self.file_name, schema)
+        else:
+            table = pyarrow.Table.from_pylist(self.rows, schema=self.parquet_writer.schema)
+        self.parquet_writer.write_table(table)
+        self.rows = []
+
+    def close(self):
+        if self.rows:
+            self.write_rows()
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+
+
+SERIES_WRITERS = {
+    'jsonl': JSONLinesWriter,
+    'csv': CSVWriter,
+    'parquet': ParquetWriter,
+}
+
+
+class StatsRecorder(object):
+    """
+    Takes the snapshots of a statistics series, and streams them to a file on a writer thread, see the module
+    documentation.
+    """
+
+    def __init__(self, file_name, collect, interval: int = None, interval_unit: str = 'accesses', file_format=None):
+        """
+        :param file_name: Path of the series file
+        :param collect: Function of (cycles, memory cycles, memory accesses) so far and the final flag of the
+                        snapshot, returning the statistics of the snapshot as a dictionary of name -> value
+        :param interval: Amount of accesses or cycles between snapshots (optional, only the end of the run is
+                         recorded by default)
+        :param interval_unit: One of INTERVAL_UNITS
+        :param file_format: One of SERIES_FORMATS (optional, chosen by the extension of file_name by default)
+        """
+        if interval_unit not in INTERVAL_UNITS:
+            raise ValueError("Invalid statistics interval unit: " + str(interval_unit) + ", expected one of " +
+                             ", ".join(INTERVAL_UNITS))
+        if interval is not None and interval <= 0:
+            raise ValueError("Invalid statistics interval: " + str(interval) + ", expected a positive number")
+        self.writer = SERIES_WRITERS[series_format(file_name, file_format)](file_name)
+        self.collect = collect
+        self.interval = interval
+        self.count_cycles = interval_unit == 'cycles'  # Else the interval counts memory accesses
+
+        # simulate_cpu takes a snapshot once the accesses (or cycles) reach next_snapshot
+        self.next_snapshot = interval if interval is not None else float('inf')
+        self.snapshots = 0
+
+        self.rows = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.write_rows, name='stats-series-writer', daemon=True)
+        self.thread.start()
+
+    def snapshot(self, cycles: int, mem_cycles: int, accesses: int, final: bool = False):
+        """
+        Takes a snapshot of the statistics, and queues it for the writer thread.
+        :param cycles: Clock cycles of the simulation so far
+        :param mem_cycles: Clock cycles of the memory instructions so far
+        :param accesses: Memory instructions executed so far
+        :param final: True for the snapshot of the end of the run
+        """
+        row = {'interval': self.snapshots, 'final': final}
+        row.update(self.collect(cycles, mem_cycles, accesses, final))
+        self.rows.put(row)
+        self.snapshots += 1
+
+        if self.interval is not None:
+            position = cycles if self.count_cycles else accesses
+            self.next_snapshot = (position // self.interval + 1) * self.interval
+
+    def write_rows(self):
+        """Writer thread: writes the queued rows until close. After an error, the rows are dropped."""
+        while True:
+            row = self.rows.get()
+            if row is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.writer.write(row)
+            except Exception as err:
+                self.error = err
+
+    def close(self):
+        """
+        Waits for the writer thread to write all snapshots, and closes the series file.
+        """
+        self.rows.put(None)
+        self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
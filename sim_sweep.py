@@ -0,0 +1,321 @@
+#!/usr/bin/python
+
+import argparse
+import csv
+import itertools
+import os
+import sys
+import traceback
+from multiprocessing import Pool, shared_memory
+
+from l1_fastpath import fast_path_statistics, simulate_l1_records
+from main_memory import MainMemory
+from mem_io import load_mem_file
+from sim import build_hierarchy, compute_statistics, simulate_cpu
+from sim_config import build_config_hierarchy, build_main_memory, config_dump_files, load_config
+from trace_reader import BINARY_RECORD_FIELDS, DEFAULT_CHUNK_SIZE, load_trace_records, records_to_chunk
+
+
+"""
+    Parameter sweep engine: runs many configurations of the memory hierarchy over the same trace and memin.
+
+    The trace and memin are parsed once by the parent process, and placed in shared memory.
+    Configurations are then fanned out over a pool of worker processes, each worker attaches to the shared
+    trace / memin and simulates its configurations without parsing any file.
+    The result is a table (list of dictionaries) of the statistics of each configuration. Per configuration dump
+    files are only written when a dump directory is given.
+    With the fast path option, L1 only configurations are resolved by the vectorized engine of l1_fastpath
+    (same statistics, no per access simulation), unless dumps are requested.
+    Hierarchies may also be given as configuration files (see sim_config), swept along with the other parameters
+    (which they replace). All configuration files are validated before any simulation starts.
+
+    Example:
+        python sim_sweep.py trace.txt memin.txt --levels 1 2 --b1 4 8 16 32 64 128 --b2 128 --out sweep.csv
+        python sim_sweep.py trace.txt memin.txt --config server_a.toml server_b.toml --out sweep.csv
+"""
+
+# Parameters of a configuration, and their default values (None means the class default for cache sizes).
+# config is the path of a hierarchy configuration file, replacing the other parameters.
+SWEEP_PARAMETERS = {'levels': 1, 'b1': 4, 'b2': 0, 'l1_size': None, 'l2_size': None, 'config': None}
+
+# Statistics columns of the result table, following the configuration parameters
+RESULT_COLUMNS = ('cycles', 'mem_cycles', 'mem_instructions', 'l1_read_hits', 'l1_write_hits', 'l1_read_misses',
+                  'l1_write_misses', 'l2_read_hits', 'l2_write_hits', 'l2_read_misses', 'l2_write_misses',
+                  'l1_miss_rate', 'global_miss_rate', 'amat')
+
+# Per process state of workers: the shared trace and memin, and a main memory object reused between runs
+worker_state = {}
+
+
+def expand_grid(grid: dict) -> list:
+    """
+    Expands a grid of parameter values to the list of configurations to simulate.
+    :param grid: Dictionary of parameter name (see SWEEP_PARAMETERS) -> list of values
+    :return: List of configuration dictionaries. L2 parameters are dropped from L1 only configurations, so
+             duplicates are simulated only once. Combinations of an L2 block smaller than the L1 block are skipped,
+             since L2 must be able to return an entire L1 block. Configurations of a hierarchy configuration file
+             only keep the file.
+    """
+    for name in grid:
+        if name not in SWEEP_PARAMETERS:
+            raise ValueError("Unknown sweep parameter: " + name)
+
+    names = list(SWEEP_PARAMETERS)
+    values = [grid.get(name) or [SWEEP_PARAMETERS[name]] for name in names]
+
+    configs = []
+    for combination in itertools.product(*values):
+        config = dict(zip(names, combination))
+        if config['config'] is not None:
+            config = dict(SWEEP_PARAMETERS, config=config['config'])
+        elif config['levels'] == 1:
+            config['b2'] = SWEEP_PARAMETERS['b2']
+            config['l2_size'] = SWEEP_PARAMETERS['l2_size']
+        elif config['b2'] < config['b1']:
+            continue
+        if config not in configs:
+            configs.append(config)
+    if not configs:
+        raise ValueError("The sweep grid has no valid configuration: every L2 block size is smaller than the L1 "
+                         "block sizes")
+    return configs
+
+
+def config_name(config: dict) -> str:
+    """
+    :param config: Configuration dictionary
+    :return: Short name for the configuration, used for naming dump files
+    """
+    if config['config'] is not None:
+        return 'config-' + os.path.splitext(os.path.basename(config['config']))[0]
+    return '_'.join(name + '-' + str(value) for name, value in config.items() if value is not None)
+
+
+def run_config(config: dict, trace_chunks, main_mem: MainMemory, dump_dir=None) -> dict:
+    """
+    Simulates a single configuration.
+    :param config: Configuration dictionary (see SWEEP_PARAMETERS)
+    :param trace_chunks: Decoded trace, as an iterable of TraceChunk objects
+    :param main_mem: MainMemory loaded with memin, reset before the simulation starts
+    :param dump_dir: Directory for the dump files of this configuration (optional, no dumps if None)
+    :return: Result row: the configuration followed by its statistics (see RESULT_COLUMNS)
+    """
+    main_mem.reset()
+    hierarchy = None
+    if config['config'] is not None:
+        hierarchy = load_config(config['config'])
+        config_mem = build_main_memory(hierarchy, None)
+        config_mem.image_pages = main_mem.image_pages  # The memin image is read-only, it is shared
+        caches = build_config_hierarchy(hierarchy, config_mem)
+        l1_cache, l2_cache = caches[0], caches[1] if len(caches) > 1 else None
+    else:
+        l1_cache, l2_cache = build_hierarchy(config['levels'], config['b1'], config['b2'], main_mem,
+                                             config['l1_size'], config['l2_size'])
+
+    cycles_elapsed, mem_cycles_elapsed, mem_instructions_count = simulate_cpu(trace_chunks, l1_cache)
+
+    if dump_dir is not None:
+        prefix = os.path.join(dump_dir, config_name(config) + '_')
+        if hierarchy is not None:
+            # The files of configured levels are named after them, in a directory of their own
+            config_dir = os.path.join(dump_dir, config_name(config))
+            os.makedirs(config_dir, exist_ok=True)
+            l1_cache.dump_memory(*config_dump_files(hierarchy, os.path.join(config_dir, 'l1.txt'),
+                                                    os.path.join(config_dir, 'memout.txt')))
+        elif l2_cache is None:
+            l1_cache.dump_memory(prefix + 'l1.txt', prefix + 'memout.txt')
+        else:
+            l1_cache.dump_memory(prefix + 'l1.txt', prefix + 'l2way0.txt', prefix + 'l2way1.txt',
+                                 prefix + 'memout.txt')
+
+    statistics = compute_statistics(l1_cache, l2_cache, cycles_elapsed, mem_cycles_elapsed, mem_instructions_count)
+    statistics['mem_cycles'] = mem_cycles_elapsed
+    statistics['mem_instructions'] = mem_instructions_count
+
+    result = dict(config)
+    if hierarchy is not None:
+        # The geometry of the first two levels, for reference
+        result['levels'] = len(hierarchy['levels'])
+        result['b1'] = hierarchy['levels'][0]['block_size']
+        result['b2'] = hierarchy['levels'][1]['block_size'] if len(caches) > 1 else SWEEP_PARAMETERS['b2']
+    for column in RESULT_COLUMNS:
+        result[column] = statistics[column]
+    return result
+
+
+def run_fast_config(config: dict, records) -> dict:
+    """
+    Simulates a single L1 only configuration with the vectorized fast path (see l1_fastpath).
+    :param config: Configuration dictionary (see SWEEP_PARAMETERS), levels must be 1
+    :param records: Flat uint32 buffer of trace records
+    :return: Result row (see run_config)
+    """
+    fast_result = simulate_l1_records(records, config['b1'], config['l1_size'])
+    statistics = fast_path_statistics(fast_result)
+    statistics['mem_cycles'] = fast_result.mem_cycles
+    statistics['mem_instructions'] = fast_result.mem_instructions
+
+    result = dict(config)
+    for column in RESULT_COLUMNS:
+        result[column] = statistics[column]
+    return result
+
+
+def uses_fast_path(config: dict, dump_dir, fast_path: bool) -> bool:
+    """
+    :return: True if the configuration should be simulated with the fast path: it was requested, the configuration
+             is L1 only and no dumps are needed (the fast path does not simulate data)
+    """
+    return fast_path and config['levels'] == 1 and config['config'] is None and dump_dir is None
+
+
+def iter_shared_trace(records: memoryview, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    :param records: Flat memoryview of uint32 trace records
+    :param chunk_size: Amount of records in each chunk
+    :return: Generator of TraceChunk objects over the records (no copy is made)
+    """
+    values_per_chunk = chunk_size * BINARY_RECORD_FIELDS
+    for start in range(0, len(records), values_per_chunk):
+        yield records_to_chunk(records[start:start + values_per_chunk])
+
+
+def attach_worker(trace_shm_name, trace_values, memin_shm_name, memin_size):
+    """
+    Pool initializer: attaches the worker process to the shared trace and memin.
+    :param trace_shm_name: Name of shared memory block holding the trace records
+    :param trace_values: Amount of uint32 values in the trace records
+    :param memin_shm_name: Name of shared memory block holding the memin image
+    :param memin_size: Size of the memin image in bytes
+    """
+    trace_shm = shared_memory.SharedMemory(trace_shm_name)
+    memin_shm = shared_memory.SharedMemory(memin_shm_name)
+
+    main_mem = MainMemory(None)
+    main_mem.load_image(memin_shm.buf[:memin_size])  # Copies the non-zero pages, once per worker
+
+    worker_state['shared_memory'] = (trace_shm, memin_shm)  # Keep attached while the worker lives
+    worker_state['trace'] = trace_shm.buf.cast('I')[:trace_values]
+    worker_state['main_mem'] = main_mem
+
+
+def run_worker_config(config_task) -> dict:
+    """
+    Pool task: simulates a single configuration, on the shared trace and memin of the worker.
+    :param config_task: (configuration dictionary, dump directory or None, True to use the fast path if possible)
+    :return: Result row (see run_config)
+    """
+    config, dump_dir, fast_path = config_task
+    if uses_fast_path(config, dump_dir, fast_path):
+        return run_fast_config(config, worker_state['trace'])
+    return run_config(config, iter_shared_trace(worker_state['trace']), worker_state['main_mem'], dump_dir)
+
+
+def create_shared_block(data) -> shared_memory.SharedMemory:
+    """
+    :param data: Bytes-like object to share
+    :return: A new shared memory block holding a copy of the data
+    """
+    data = memoryview(data).cast('B')
+    shm = shared_memory.SharedMemory(create=True, size=max(len(data), 8))
+    shm.buf[:len(data)] = data
+    return shm
+
+
+def run_sweep(trace, memin, grid: dict, processes=None, dump_dir=None, fast_path=False) -> list:
+    """
+    Simulates all configurations of the grid, in parallel.
+    :param trace: Trace file (text or binary)
+    :param memin: Initial state of the main memory
+    :param grid: Dictionary of parameter name (see SWEEP_PARAMETERS) -> list of values
+    :param processes: Amount of worker processes (optional, one per core by default). 1 runs in process.
+    :param dump_dir: Directory for the dump files of each configuration (optional, no dumps if None)
+    :param fast_path: When true, L1 only configurations are simulated with the vectorized fast path (requires
+                      NumPy, and ignored when dumps are requested)
+    :return: List of result rows, in the order of the configurations (see run_config)
+    """
+    configs = expand_grid(grid)
+    for config_file in set(config['config'] for config in configs if config['config'] is not None):
+        load_config(config_file)  # Fails fast, before the trace is parsed, on any invalid configuration file
+    records = load_trace_records(trace)
+    memin_image = load_mem_file(memin)
+    if dump_dir is not None:
+        os.makedirs(dump_dir, exist_ok=True)
+
+    if processes == 1 or len(configs) == 1:
+        main_mem = MainMemory(None)
+        main_mem.load_image(memin_image)
+        return [run_fast_config(config, records) if uses_fast_path(config, dump_dir, fast_path)
+                else run_config(config, iter_shared_trace(records), main_mem, dump_dir) for config in configs]
+
+    trace_shm = create_shared_block(records)
+    memin_shm = create_shared_block(memin_image)
+    try:
+        with Pool(processes, initializer=attach_worker,
+                  initargs=(trace_shm.name, len(records), memin_shm.name, len(memin_image))) as pool:
+            return pool.map(run_worker_config, [(config, dump_dir, fast_path) for config in configs], chunksize=1)
+    finally:
+        trace_shm.close()
+        trace_shm.unlink()
+        memin_shm.close()
+        memin_shm.unlink()
+
+
+def write_results(results: list, file_name):
+    """
+    Writes the result table of a sweep as CSV.
+    :param results: List of result rows (see run_sweep)
+    :param file_name: Path of output CSV file
+    """
+    with open(file_name, 'w', newline='') as results_out:
+        writer = csv.DictWriter(results_out, fieldnames=list(SWEEP_PARAMETERS) + list(RESULT_COLUMNS))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def print_results(results: list):
+    """Prints the result table of a sweep to the console."""
+    columns = list(SWEEP_PARAMETERS) + ['l1_miss_rate', 'global_miss_rate', 'cycles', 'amat']
+    print(' '.join(column.rjust(16) for column in columns))
+    for result in results:
+        values = []
+        for column in columns:
+            value = result[column]
+            values.append(("{0:.4f}".format(value) if isinstance(value, float) else str(value)).rjust(16))
+        print(' '.join(values))
+
+
+if __name__ == "__main__":
+    """
+    Main function for sweeping the memory hierarchy parameters.
+    """
+    parser = argparse.ArgumentParser(description='Simulates a grid of memory hierarchy configurations in parallel.')
+    parser.add_argument('trace', help='Trace file (text or binary)')
+    parser.add_argument('memin', help='Initial state of the main memory')
+    parser.add_argument('--levels', type=int, nargs='+', default=[1], help='Number of cache levels (1 or 2)')
+    parser.add_argument('--b1', type=int, nargs='+', default=[4], help='L1 block sizes')
+    parser.add_argument('--b2', type=int, nargs='+', default=None, help='L2 block sizes (default: the L1 block sizes)')
+    parser.add_argument('--l1-size', type=int, nargs='+', default=[None], help='L1 capacities in bytes')
+    parser.add_argument('--l2-size', type=int, nargs='+', default=[None], help='L2 capacities in bytes')
+    parser.add_argument('--config', nargs='+', default=[None],
+                        help='Hierarchy configuration files (see sim_config), in place of the other parameters')
+    parser.add_argument('--processes', type=int, default=None, help='Worker processes (default: one per core)')
+    parser.add_argument('--dump-dir', default=None, help='Write the dump files of each configuration here')
+    parser.add_argument('--fast-path', action='store_true',
+                        help='Simulate L1 only configurations with the vectorized fast path (no dumps)')
+    parser.add_argument('--out', default=None, help='Write the result table to this CSV file')
+    args = parser.parse_args()
+
+    try:
+        sweep_results = run_sweep(args.trace, args.memin,
+                                  {'levels': args.levels, 'b1': args.b1, 'b2': args.b2 or args.b1,
+                                   'l1_size': args.l1_size, 'l2_size': args.l2_size, 'config': args.config},
+                                  args.processes, args.dump_dir, args.fast_path)
+        print_results(sweep_results)
+        if args.out is not None:
+            write_results(sweep_results, args.out)
+    except Exception as err:
+        print("Sweep ended with an error.")
+        tb = traceback.format_exc()
+        print(tb)
+        sys.exit(1)
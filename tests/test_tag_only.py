@@ -0,0 +1,47 @@
+import glob
+import os
+
+import pytest
+
+from sim import check_tag_only_parity, run_sim
+from sim_bench import generate_trace
+from sim_constants import NO_DUMP
+
+
+"""
+    Statistics parity of the tag-only mode (see sim.set_tag_only) with the full simulation, on the sample traces of
+    this directory and on a synthetic trace long enough to evict and write back blocks.
+"""
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_DIRS = sorted(os.path.dirname(trace) for trace in glob.glob(os.path.join(TESTS_DIR, '*', 'trace.txt'))
+                     if os.path.isfile(os.path.join(os.path.dirname(trace), 'memin.txt')))
+
+# Hierarchy configurations: (levels, b1, b2)
+CONFIGS = ((1, 4, 0), (1, 32, 0), (2, 8, 32), (2, 32, 128))
+
+SYNTHETIC_ACCESSES = 3000
+
+
+@pytest.mark.parametrize('levels, b1, b2', CONFIGS)
+@pytest.mark.parametrize('sample_dir', SAMPLE_DIRS, ids=os.path.basename)
+def test_sample_traces(sample_dir, levels, b1, b2):
+    check_tag_only_parity(levels, b1, b2, os.path.join(sample_dir, 'trace.txt'), os.path.join(sample_dir, 'memin.txt'))
+
+
+@pytest.mark.parametrize('levels, b1, b2', CONFIGS)
+@pytest.mark.parametrize('pattern', ('random', 'conflict'))
+def test_synthetic_traces(tmp_path, pattern, levels, b1, b2):
+    trace = str(tmp_path / 'trace.txt')
+    memin = str(tmp_path / 'memin.txt')
+    generate_trace(pattern, SYNTHETIC_ACCESSES, trace, memin)
+    statistics = check_tag_only_parity(levels, b1, b2, trace, memin)
+    assert statistics['l1_read_misses'] + statistics['l1_write_misses'] > 0
+
+
+def test_no_dump_in_full_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sample_dir = SAMPLE_DIRS[0]
+    run_sim(2, 8, 32, os.path.join(sample_dir, 'trace.txt'), os.path.join(sample_dir, 'memin.txt'), NO_DUMP, NO_DUMP,
+            NO_DUMP, NO_DUMP, str(tmp_path / 'stats.txt'))
+    assert not (tmp_path / NO_DUMP).exists()
@@ -0,0 +1,328 @@
+#!/usr/bin/python
+
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from itertools import islice
+
+import sim_constants
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, the pure Python decoder is used without it
+    np = None
+
+
+"""
+    Readers for the CPU trace consumed by the simulator.
+
+    Two trace formats are supported:
+    -   Text format (trace.txt): one record per line, "<gap cycles> <L|S> <address hex> [<data hex>]".
+    -   Binary format: a 16 byte header (8 byte magic + record count as uint64), followed by fixed width records
+        of 4 little endian uint32 fields each: gap cycles, op (0 for load, 1 for store), address, data.
+        Binary traces are memory-mapped, so records are streamed to the simulator without being copied.
+
+    Traces are decoded in chunks of many records at once. Each chunk is a TraceChunk of 4 parallel sequences:
+    (gaps, ops, addresses, data). Sequences are lists for the pure Python decoder, NumPy arrays for the NumPy
+    decoder and memoryviews (uint32) for binary traces. Use chunk_records() to iterate a chunk record by record.
+"""
+
+# Op codes used in decoded traces
+TRACE_OP_LOAD = 0
+TRACE_OP_STORE = 1
+
+# Binary trace layout
+BINARY_TRACE_MAGIC = b'MEMTRC01'
+BINARY_TRACE_HEADER = struct.Struct('<8sQ')  # Magic, number of records
+BINARY_RECORD_FIELDS = 4                     # Gap cycles, op, address, data - each an uint32
+BINARY_RECORD = struct.Struct('<' + 'I' * BINARY_RECORD_FIELDS)
+
+# Default amount of records decoded at once
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+TraceChunk = namedtuple('TraceChunk', ['gaps', 'ops', 'addresses', 'data'])
+
+
+def chunk_records(chunk: TraceChunk):
+    """
+    Iterates the records of a decoded chunk.
+    :param chunk: A decoded TraceChunk
+    :return: Iterator of (gap cycles, op, address, data) tuples of python ints (data is 0 for loads)
+    """
+    if np is not None and isinstance(chunk.gaps, np.ndarray):
+        # NumPy scalars are slow to operate on one by one, convert the whole chunk to lists at once
+        return zip(chunk.gaps.tolist(), chunk.ops.tolist(), chunk.addresses.tolist(), chunk.data.tolist())
+    return zip(chunk.gaps, chunk.ops, chunk.addresses, chunk.data)
+
+
+def is_binary_trace(trace_file) -> bool:
+    """
+    :param trace_file: Path of trace file
+    :return: True if the trace file is in the binary trace format, False if it's a text trace
+    """
+    with open(trace_file, 'rb') as trace_in:
+        return trace_in.read(len(BINARY_TRACE_MAGIC)) == BINARY_TRACE_MAGIC
+
+
+def decode_text_lines(lines) -> TraceChunk:
+    """
+    Decodes lines of a text trace with pure Python.
+    :param lines: Iterable of text trace lines (str)
+    :return: TraceChunk of lists
+    """
+    gaps = []
+    ops = []
+    addresses = []
+    data = []
+    for line in lines:
+        inst_decode = line.rstrip().split(sim_constants.FILE_DELIMITER)
+        if inst_decode == ['']:  # Skip empty lines
+            continue
+        gaps.append(int(inst_decode[0]))
+        addresses.append(int(inst_decode[2], 16))
+        if inst_decode[1] == 'S':
+            ops.append(TRACE_OP_STORE)
+            data.append(int(inst_decode[3], 16))
+        else:
+            ops.append(TRACE_OP_LOAD)
+            data.append(0)
+    return TraceChunk(gaps, ops, addresses, data)
+
+
+if np is not None:
+    # Value of each ASCII character as a hex digit, 0xFF for non hex digit characters
+    HEX_DIGITS_LUT = np.full(256, 0xFF, dtype=np.uint64)
+    for digit, char in enumerate(b'0123456789ABCDEF'):
+        HEX_DIGITS_LUT[char] = digit
+        HEX_DIGITS_LUT[ord(chr(char).lower())] = digit
+
+
+def decode_numeric_field(buf, field_start, field_len, base: int):
+    """
+    Decodes a numeric field of variable length in all lines at once.
+    :param buf: Chunk contents as a NumPy uint8 array
+    :param field_start: NumPy array of offsets where the field starts, per line
+    :param field_len: NumPy array of field lengths, per line (0 decodes as 0)
+    :param base: 10 or 16
+    :return: NumPy array of decoded values
+    """
+    values = np.zeros(len(field_start), dtype=np.uint64)
+    max_len = int(field_len.max()) if len(field_len) > 0 else 0
+    for digit_index in range(max_len):
+        in_field = digit_index < field_len
+        digits = HEX_DIGITS_LUT[buf[np.where(in_field, field_start + digit_index, 0)]]
+        if np.any(in_field & (digits >= base)):
+            raise ValueError('Invalid character in trace field')
+        values = np.where(in_field, values * base + digits, values)
+    return values
+
+
+def decode_text_buffer_numpy(chunk_bytes: bytes) -> TraceChunk:
+    """
+    Decodes complete lines of a text trace with NumPy, without iterating lines in python.
+    :param chunk_bytes: Contents of complete text lines
+    :return: TraceChunk of NumPy arrays
+    """
+    buf = np.frombuffer(chunk_bytes, dtype=np.uint8)
+    newlines = np.flatnonzero(buf == ord('\n'))
+    line_starts = np.concatenate(([0], newlines + 1))
+    line_ends = np.concatenate((newlines, [len(buf)]))
+
+    # Drop '\r' of windows line endings, and empty lines
+    has_cr = (line_ends > line_starts) & (buf[np.maximum(line_ends - 1, 0)] == ord('\r'))
+    line_ends = line_ends - has_cr
+    non_empty = line_ends > line_starts
+    line_starts = line_starts[non_empty]
+    line_ends = line_ends[non_empty]
+
+    # Locate field delimiters: "<gap> <op> <address>[ <data>]"
+    delimiters = np.flatnonzero(buf == ord(sim_constants.FILE_DELIMITER))
+    delimiters = np.append(delimiters, len(buf))  # Sentinel for lines with no more delimiters
+    gap_end = delimiters[np.searchsorted(delimiters, line_starts)]
+    address_start = gap_end + 3
+    address_end = np.minimum(delimiters[np.searchsorted(delimiters, address_start)], line_ends)
+    if np.any(address_start >= line_ends) or np.any(buf[gap_end + 2] != ord(sim_constants.FILE_DELIMITER)):
+        raise ValueError('Malformed trace line')
+
+    ops = (buf[gap_end + 1] == ord('S')).astype(np.uint32)
+    data_start = address_end + 1
+    data_len = np.where(ops == TRACE_OP_STORE, line_ends - data_start, 0)
+
+    gaps = decode_numeric_field(buf, line_starts, gap_end - line_starts, 10)
+    addresses = decode_numeric_field(buf, address_start, address_end - address_start, 16)
+    data = decode_numeric_field(buf, data_start, np.maximum(data_len, 0), 16)
+
+    return TraceChunk(gaps.astype(np.uint32), ops, addresses.astype(np.uint32), data.astype(np.uint32))
+
+
+def read_text_trace(trace_file, chunk_size=DEFAULT_CHUNK_SIZE, use_numpy=None):
+    """
+    Decodes a text trace file in chunks.
+    :param trace_file: Path of text trace file
+    :param chunk_size: Approximate amount of records to decode at once
+    :param use_numpy: Decode with NumPy (True), with pure python (False), or NumPy when installed (None)
+    :return: Generator of TraceChunk objects
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+
+    if use_numpy:
+        # Read large blocks of bytes, completed to a whole line
+        bytes_per_chunk = chunk_size * 24  # A store record is 20-22 bytes long
+        with open(trace_file, 'rb') as trace_in:
+            while True:
+                chunk_bytes = trace_in.read(bytes_per_chunk)
+                if not chunk_bytes:
+                    break
+                chunk_bytes += trace_in.readline()
+                try:
+                    chunk = decode_text_buffer_numpy(chunk_bytes)
+                except ValueError:
+                    # Irregular lines are left for the forgiving python decoder
+                    chunk = decode_text_lines(chunk_bytes.decode('ascii').splitlines())
+                if len(chunk.gaps) > 0:
+                    yield chunk
+    else:
+        with open(trace_file, 'r') as trace_in:
+            while True:
+                lines = list(islice(trace_in, chunk_size))
+                if not lines:
+                    break
+                yield decode_text_lines(lines)
+
+
+def map_binary_trace(trace_file) -> memoryview:
+    """
+    Memory-maps a binary trace file.
+    :param trace_file: Path of binary trace file
+    :return: Flat memoryview of uint32 values (BINARY_RECORD_FIELDS per record) over the mapped file.
+             The mapping stays open as long as the view (or any slice of it) is referenced.
+    """
+    with open(trace_file, 'rb') as trace_in:
+        header = trace_in.read(BINARY_TRACE_HEADER.size)
+        magic, num_of_records = BINARY_TRACE_HEADER.unpack(header)
+        if magic != BINARY_TRACE_MAGIC:
+            raise ValueError(trace_file + ' is not a binary trace file')
+        if num_of_records == 0:
+            return memoryview(bytes()).cast('I')
+        mapped = mmap.mmap(trace_in.fileno(), 0, access=mmap.ACCESS_READ)
+
+    records_end = BINARY_TRACE_HEADER.size + num_of_records * BINARY_RECORD.size
+    records = memoryview(mapped)[BINARY_TRACE_HEADER.size:records_end]
+    if sys.byteorder == 'little':
+        return records.cast('I')
+
+    # Records are stored little endian, big endian hosts get a (copied) byte swapped array
+    swapped = bytearray(len(records))
+    for offset in range(0, len(records), BINARY_RECORD.size):
+        swapped[offset:offset + BINARY_RECORD.size] = \
+            struct.pack('=' + 'I' * BINARY_RECORD_FIELDS, *BINARY_RECORD.unpack_from(records, offset))
+    return memoryview(swapped).cast('I')
+
+
+def records_to_chunk(records: memoryview) -> TraceChunk:
+    """
+    :param records: Flat memoryview of uint32 binary trace records
+    :return: TraceChunk of (strided, zero-copy) memoryviews over the records
+    """
+    return TraceChunk(records[0::BINARY_RECORD_FIELDS], records[1::BINARY_RECORD_FIELDS],
+                      records[2::BINARY_RECORD_FIELDS], records[3::BINARY_RECORD_FIELDS])
+
+
+def read_binary_trace(trace_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams a binary trace file in chunks, straight from the memory mapping.
+    :param trace_file: Path of binary trace file
+    :param chunk_size: Amount of records in each chunk
+    :return: Generator of TraceChunk objects
+    """
+    records = map_binary_trace(trace_file)
+    values_per_chunk = chunk_size * BINARY_RECORD_FIELDS
+    for start in range(0, len(records), values_per_chunk):
+        yield records_to_chunk(records[start:start + values_per_chunk])
+
+
+def read_trace(trace_file, chunk_size=DEFAULT_CHUNK_SIZE, use_numpy=None):
+    """
+    Decodes a trace file of either format in chunks.
+    :param trace_file: Path of trace file (text or binary, detected by the file header)
+    :param chunk_size: Approximate amount of records to decode at once
+    :param use_numpy: For text traces - see read_text_trace
+    :return: Generator of TraceChunk objects
+    """
+    if is_binary_trace(trace_file):
+        return read_binary_trace(trace_file, chunk_size)
+    return read_text_trace(trace_file, chunk_size, use_numpy)
+
+
+def load_trace_records(trace_file) -> memoryview:
+    """
+    Loads an entire trace file as binary records (i.e: to share a decoded trace between processes).
+    :param trace_file: Path of trace file (text or binary)
+    :return: Flat memoryview of uint32 values, BINARY_RECORD_FIELDS per record (gap cycles, op, address, data).
+             Binary traces are mapped rather than copied.
+    """
+    if is_binary_trace(trace_file):
+        return map_binary_trace(trace_file)
+
+    records = array('I')
+    for chunk in read_text_trace(trace_file):
+        if np is not None:
+            records.frombytes(np.column_stack(chunk).astype(np.uint32).tobytes())
+        else:
+            for record in chunk_records(chunk):
+                records.extend(record)
+    return memoryview(records)
+
+
+def write_binary_trace(records, binary_trace_file):
+    """
+    Writes records to a binary trace file.
+    :param records: Iterable of TraceChunk objects
+    :param binary_trace_file: Path of the binary trace file to create
+    :return: Amount of records written
+    """
+    num_of_records = 0
+    with open(binary_trace_file, 'wb') as trace_out:
+        trace_out.write(BINARY_TRACE_HEADER.pack(BINARY_TRACE_MAGIC, 0))  # Count is patched in the end
+        for chunk in records:
+            if np is not None:
+                # Interleave the fields column by column, and write the entire chunk at once
+                table = np.empty((len(chunk.gaps), BINARY_RECORD_FIELDS), dtype='<u4')
+                for field, values in enumerate(chunk):
+                    table[:, field] = np.asarray(values, dtype=np.uint32)
+                trace_out.write(table.tobytes())
+            else:
+                trace_out.write(b''.join(BINARY_RECORD.pack(*record) for record in chunk_records(chunk)))
+            num_of_records += len(chunk.gaps)
+
+        trace_out.seek(0)
+        trace_out.write(BINARY_TRACE_HEADER.pack(BINARY_TRACE_MAGIC, num_of_records))
+
+    return num_of_records
+
+
+def convert_text_to_binary(text_trace_file, binary_trace_file, chunk_size=DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Converts a text trace file to the binary trace format.
+    :param text_trace_file: Path of the text trace to convert
+    :param binary_trace_file: Path of the binary trace file to create
+    :param chunk_size: Amount of records to convert at once
+    :return: Amount of records converted
+    """
+    return write_binary_trace(read_text_trace(text_trace_file, chunk_size), binary_trace_file)
+
+
+if __name__ == "__main__":
+    """
+    Converts a text trace to the binary trace format.
+    Usage: trace_reader.py <trace.txt> <trace.bin>
+    """
+    if len(sys.argv) != 3:
+        print("Usage: trace_reader.py <trace.txt> <trace.bin>")
+        exit(1)
+
+    count = convert_text_to_binary(sys.argv[1], sys.argv[2])
+    print("Converted " + str(count) + " records")
@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from math import ceil
+
+from mem_ifc import MemoryInterface
+
+
+class VictimCache(MemoryInterface):
+    """
+        A small fully-associative victim cache, behind a direct-mapped cache (L1Cache).
+        -   Holds the last NUM_OF_ENTRIES blocks evicted by the cache above, clean or dirty (keeps_clean_victims),
+            replaced in LRU order. A dirty block displaced from the victim cache is written back to the next level.
+        -   A miss of the cache above that hits the victim cache is served from it, and the block moves back up:
+            it leaves the victim cache, and the victim of the cache above takes its place. The cache above receives
+            the block as clean, so a dirty hit first writes the block back to the next level (its cycles count).
+        -   Misses of the victim cache are forwarded to the next level.
+        Entries are blocks of the cache above, so block_size must be its block size.
+        At the end of the simulation (dump_memory) dirty entries are written back first, so the dumps of the next
+        levels are complete.
+    """
+
+    NUM_OF_ENTRIES = 4
+    MEM_BUS_WIDTH = 256      # In bits
+    MEM_HIT_TIME = 2         # In clock cycles
+    MEM_BUS_ACCESS_TIME = 1  # Any additional transfer on bus after accessing for first entry
+
+    # Receives every block evicted from the cache above
+    keeps_clean_victims = True
+
+    def __init__(self, next_mem_arg: MemoryInterface, block_size: int, num_of_entries: int = None,
+                 name: str = 'victim_cache'):
+        """
+        :param next_mem_arg: The next level of the hierarchy
+        :param block_size: Block size of the cache above
+        :param num_of_entries: Capacity in blocks (optional, NUM_OF_ENTRIES by default)
+        :param name: Prefix of the statistics of this victim cache
+        """
+        super(VictimCache, self).__init__(next_mem_arg)
+        if num_of_entries is not None:
+            self.NUM_OF_ENTRIES = num_of_entries
+        self.block_size = block_size
+
+        self.entries = OrderedDict()  # Block address -> [bytearray of the block, dirty bit], least recent first
+        self.name = name
+
+        # Statistics
+        self.dirty_hit_writebacks = 0
+        self.writebacks = 0
+
+    def get_block_size(self) -> int:
+        return self.block_size
+
+    def block_address(self, address: int) -> int:
+        return address - (address % self.block_size)
+
+    def is_address_present(self, address: int) -> bool:
+        return self.block_address(address) in self.entries
+
+    def transfer_cycles(self, data_size: int) -> int:
+        """
+        :param data_size: The amount of data passed on the bus to the cache above
+        :return: Amount of cycles taken to pass the data on the bus
+        """
+        return self.MEM_HIT_TIME +\
+               (ceil(8*data_size / self.MEM_BUS_WIDTH) - 1) * self.MEM_BUS_ACCESS_TIME
+
+    def flush_if_needed(self, address: int) -> int:
+        """
+        Makes room for a new entry, writing back the least recently used entry if it is dirty.
+        :return: Clock cycles elapsed for the write back (0 if no write back occurred)
+        """
+        if len(self.entries) < self.NUM_OF_ENTRIES:
+            return 0
+        block_address, (block, is_dirty) = self.entries.popitem(last=False)
+        return self.next_mem.evict_block(block_address, self.block_size, block, is_dirty)
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        block, is_dirty = self.entries[self.block_address(address)]
+        start = address % self.block_size
+        return memoryview(block)[start:start + data_size], self.transfer_cycles(data_size)
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        entry = self.entries[self.block_address(address)]
+        start = address % self.block_size
+        entry[0][start:start + data_size] = data[:data_size]
+        entry[1] = entry[1] or mark_dirty
+        return self.transfer_cycles(data_size)
+
+    def evict_block(self, address: int, block_size: int, data, is_dirty: bool) -> int:
+        """
+        Receives a victim of the cache above, as the most recently used entry.
+        """
+        cycles_elapsed = self.flush_if_needed(address)
+        self.entries[address] = [bytearray(data[:block_size]), is_dirty]
+        if is_dirty:
+            self.writebacks += 1
+        return cycles_elapsed
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Serves a miss of the cache above: a hit moves the block back up, a miss is forwarded to the next level.
+        """
+        block_address = self.block_address(address)
+        if block_address not in self.entries:
+            self.read_misses += 1
+            return self.next_mem.load(address, block_size)
+
+        self.read_hits += 1
+        data, cycles_elapsed = self.read(address, block_size)
+        block, is_dirty = self.entries.pop(block_address)
+        if is_dirty:
+            self.dirty_hit_writebacks += 1
+            cycles_elapsed += self.next_mem.store(block_address, self.block_size, block)
+        return data, cycles_elapsed
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Updates a present block in place, stores of absent blocks are forwarded to the next level.
+        """
+        block_address = self.block_address(address)
+        if block_address not in self.entries:
+            self.write_misses += 1
+            return self.next_mem.store(address, block_size, data)
+
+        self.write_hits += 1
+        self.entries.move_to_end(block_address)
+        return self.write(address, True, block_size, data)
+
+    def warm_access(self, address: int, is_store: bool):
+        """Not warmed, functional warming passes through to the next level (see MemoryInterface.warm_access)"""
+        self.next_mem.warm_access(address, is_store)
+
+    def get_extra_statistics(self) -> dict:
+        return {
+            self.name + '_hits': self.read_hits,
+            self.name + '_misses': self.read_misses,
+            self.name + '_dirty_victims': self.writebacks,
+            self.name + '_dirty_hit_writebacks': self.dirty_hit_writebacks,
+        }
+
+    def dump_memory(self, *file_names):
+        """The victim cache has no dump file of its own, dirty entries are written back to the next level."""
+        for block_address, (block, is_dirty) in self.entries.items():
+            if is_dirty:
+                self.next_mem.store(block_address, self.block_size, block)
+                self.entries[block_address][1] = False
+        self.next_mem.dump_memory(*file_names)
+
+    def print_mem(self, limit=-1):
+        self.next_mem.print_mem(limit)
@@ -0,0 +1,182 @@
+from collections import OrderedDict
+
+from mem_ifc import MemoryInterface
+
+
+class WriteBuffer(MemoryInterface):
+    """
+        A write buffer on the write-back path, between a cache and the next level of the hierarchy.
+        -   Stores (the dirty evictions of the cache above) are absorbed in a FIFO of NUM_OF_ENTRIES blocks, and cost
+            only WRITE_TIME cycles instead of the latency of the next level.
+        -   A store to a block already buffered coalesces into its entry.
+        -   When the buffer is full, the oldest entry is drained synchronously: the store stalls for its latency.
+        -   Entries drain in the background while the CPU executes non memory instructions (see tick): the idle
+            cycles are spent on draining the oldest entries, one whole store at a time. The last store may take
+            longer than the idle cycles left, the overrun is deducted from the next idle period.
+        -   Loads of a buffered block are forwarded from the buffer. Loads that only partially overlap buffered
+            entries drain those entries first, so the next level never returns stale data.
+        -   When the next level keeps the victims of the cache above (see MemoryInterface.keeps_clean_victims), the
+            evictions pass through the buffer to it instead of being absorbed.
+        At the end of the simulation (dump_memory) the buffer is drained, so the dumps of the next levels are complete.
+    """
+
+    NUM_OF_ENTRIES = 8
+    WRITE_TIME = 1  # Cycles to place a block in the buffer
+    READ_TIME = 1   # Cycles to forward a buffered block to a load
+
+    # Drains in the idle cycles of the CPU
+    clocked = True
+
+    def __init__(self, next_mem_arg: MemoryInterface, num_of_entries: int = None, name: str = 'write_buffer'):
+        """
+        :param next_mem_arg: The next level of the hierarchy, where the buffered blocks are written to
+        :param num_of_entries: Capacity of the buffer in blocks (optional, NUM_OF_ENTRIES by default)
+        :param name: Prefix of the statistics of this buffer
+        """
+        super(WriteBuffer, self).__init__(next_mem_arg)
+        if num_of_entries is not None:
+            self.NUM_OF_ENTRIES = num_of_entries
+        self.name = name
+        self.keeps_clean_victims = next_mem_arg.keeps_clean_victims  # Victims pass through to the next level
+
+        self.entries = OrderedDict()  # Block address -> bytearray of the block, oldest first
+        self.drain_credit = 0         # Idle cycles available for draining (negative after an overrun)
+
+        # Statistics
+        self.coalesces = 0
+        self.stalls = 0
+        self.stall_cycles = 0
+        self.forwards = 0
+        self.idle_drains = 0
+
+    def get_block_size(self) -> int:
+        return self.next_mem.get_block_size()
+
+    def is_address_present(self, address: int) -> bool:
+        return self.find_entry(address, 1) is not None or self.next_mem.is_address_present(address)
+
+    def flush_if_needed(self, address: int) -> int:
+        return 0  # Nothing is ever fetched into the buffer
+
+    def find_entry(self, address: int, data_size: int):
+        """
+        :param address: Start address of a range
+        :param data_size: Size of the range in bytes
+        :return: Start address of the buffered block that holds the entire range, or None
+        """
+        for block_address, block in self.entries.items():
+            if block_address <= address and address + data_size <= block_address + len(block):
+                return block_address
+        return None
+
+    def drain_entry(self) -> int:
+        """
+        Writes the oldest entry to the next level.
+        :return: Clock cycles elapsed for the write
+        """
+        block_address, block = self.entries.popitem(last=False)
+        return self.next_mem.store(block_address, len(block), block)
+
+    def drain_overlapping(self, address: int, data_size: int) -> int:
+        """
+        Writes all entries overlapping the given range to the next level, oldest first.
+        :return: Clock cycles elapsed for the writes
+        """
+        cycles_elapsed = 0
+        for block_address in [block_address for block_address, block in self.entries.items()
+                              if block_address < address + data_size and address < block_address + len(block)]:
+            block = self.entries.pop(block_address)
+            cycles_elapsed += self.next_mem.store(block_address, len(block), block)
+        return cycles_elapsed
+
+    def drain_all(self):
+        """Writes all entries to the next level (cycles are not accounted for)."""
+        while self.entries:
+            self.drain_entry()
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        block_address = self.find_entry(address, data_size)
+        start = address - block_address
+        return memoryview(self.entries[block_address])[start:start + data_size], self.READ_TIME
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        block_address = self.find_entry(address, data_size)
+        start = address - block_address
+        self.entries[block_address][start:start + data_size] = data[:data_size]
+        return self.WRITE_TIME
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Loads from the buffer when it holds the requested range, from the next level otherwise.
+        """
+        if self.find_entry(address, block_size) is not None:
+            self.forwards += 1
+            self.read_hits += 1
+            return self.read(address, block_size)
+
+        self.read_misses += 1
+        cycles_elapsed = self.drain_overlapping(address, block_size)
+        data, load_cycles = self.next_mem.load(address, block_size)
+        return data, cycles_elapsed + load_cycles
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Absorbs a store in the buffer, coalescing into an existing entry or stalling for a free entry if needed.
+        """
+        if self.find_entry(address, block_size) is not None:
+            self.coalesces += 1
+            self.write_hits += 1
+            return self.write(address, True, block_size, data)
+
+        self.write_misses += 1
+        cycles_elapsed = self.drain_overlapping(address, block_size)
+        if len(self.entries) >= self.NUM_OF_ENTRIES:
+            stall_cycles = self.drain_entry()
+            self.stalls += 1
+            self.stall_cycles += stall_cycles
+            cycles_elapsed += stall_cycles
+
+        self.entries[address] = bytearray(data[:block_size])
+        return cycles_elapsed + self.WRITE_TIME
+
+    def evict_block(self, address: int, block_size: int, data, is_dirty: bool) -> int:
+        """
+        Absorbs the dirty victims of the level above as stores. When the next level keeps the victims itself (i.e:
+        the lower cache of an exclusive pair), they pass through to it, once the entries they overlap are drained.
+        """
+        if not self.keeps_clean_victims:
+            return super(WriteBuffer, self).evict_block(address, block_size, data, is_dirty)
+        cycles_elapsed = self.drain_overlapping(address, block_size)
+        return cycles_elapsed + self.next_mem.evict_block(address, block_size, data, is_dirty)
+
+    def tick(self, now: int, idle_cycles: int):
+        """
+        Drains the oldest entries in the idle cycles of the CPU.
+        """
+        self.drain_credit += idle_cycles
+        while self.entries and self.drain_credit > 0:
+            self.drain_credit -= self.drain_entry()
+            self.idle_drains += 1
+        if not self.entries:
+            self.drain_credit = min(self.drain_credit, 0)  # Idle cycles can't be saved for later
+
+    def warm_access(self, address: int, is_store: bool):
+        """Not warmed, functional warming passes through to the next level (see MemoryInterface.warm_access)"""
+        self.next_mem.warm_access(address, is_store)
+
+    def get_extra_statistics(self) -> dict:
+        return {
+            self.name + '_coalesces': self.coalesces,
+            self.name + '_stalls': self.stalls,
+            self.name + '_stall_cycles': self.stall_cycles,
+            self.name + '_forwards': self.forwards,
+            self.name + '_idle_drains': self.idle_drains,
+        }
+
+    def dump_memory(self, *file_names):
+        """The buffer has no dump file of its own, it is drained so the next levels hold all the data."""
+        self.drain_all()
+        self.next_mem.dump_memory(*file_names)
+
+    def print_mem(self, limit=-1):
+        self.next_mem.print_mem(limit)
@@ -0,0 +1,185 @@
+from collections import OrderedDict
+
+from mem_ifc import MemoryInterface
+
+
+class WriteCombiningBuffer(MemoryInterface):
+    """
+        A write-combining buffer for streaming stores, between a cache and the next level of the hierarchy.
+        -   Stores that reach it (the stores written through or around a write-through / no-write-allocate cache)
+            are merged into entries of a whole block of the next level (BLOCK_SIZE_IN_BYTES in front of main
+            memory), NUM_OF_ENTRIES entries.
+            Each entry keeps a mask of the bytes written to it.
+        -   An entry whose block is completely written is flushed to the next level at once, as a single store of
+            the whole block (so a no-write-allocate next level doesn't fetch it, and a streaming store costs one
+            transfer per block instead of one per word).
+        -   When the buffer is full, the oldest entry is flushed to make room. A partially written entry is flushed
+            as one store per contiguous run of written bytes.
+        -   Victims of the level above (see MemoryInterface.evict_block) are not combined, they pass through to the
+            next level.
+        -   Loads and victims overlapping buffered entries flush those entries first, so the next level never
+            returns stale data. The buffer does not forward data to loads.
+        The cycles of the flushes are charged to the request that causes them (the buffer reduces the traffic to
+        the next level, it doesn't hide its latency, see WriteBuffer for that).
+        At the end of the simulation (dump_memory) the buffer is flushed, so the dumps of the next levels are complete.
+    """
+
+    NUM_OF_ENTRIES = 4
+    BLOCK_SIZE_IN_BYTES = 32  # Size of an entry in front of main memory, which has no blocks
+    WRITE_TIME = 1            # Cycles to merge a store into the buffer
+
+    def __init__(self, next_mem_arg: MemoryInterface, num_of_entries: int = None, name: str = 'write_combining'):
+        """
+        :param next_mem_arg: The next level of the hierarchy, where the combined stores are written to
+        :param num_of_entries: Capacity of the buffer in blocks (optional, NUM_OF_ENTRIES by default)
+        :param name: Prefix of the statistics of this buffer
+        """
+        super(WriteCombiningBuffer, self).__init__(next_mem_arg)
+        if num_of_entries is not None:
+            self.NUM_OF_ENTRIES = num_of_entries
+        self.name = name
+        self.keeps_clean_victims = next_mem_arg.keeps_clean_victims  # Victims pass through to the next level
+
+        try:
+            self.block_size = next_mem_arg.get_block_size()
+        except NotImplementedError:  # Main memory
+            self.block_size = self.BLOCK_SIZE_IN_BYTES
+        self.full_mask = (1 << self.block_size) - 1
+        self.entries = OrderedDict()  # Block address -> [bytearray of the block, mask of the written bytes]
+
+        # Statistics
+        self.stores = 0
+        self.combined = 0
+        self.full_flushes = 0
+        self.partial_flushes = 0
+        self.flushed_stores = 0
+
+    def get_block_size(self) -> int:
+        return self.next_mem.get_block_size()
+
+    def is_address_present(self, address: int) -> bool:
+        return self.next_mem.is_address_present(address)
+
+    def flush_if_needed(self, address: int) -> int:
+        return 0  # Nothing is ever fetched into the buffer
+
+    def read(self, address: int, data_size: int) -> (memoryview, int):
+        return self.next_mem.read(address, data_size)
+
+    def write(self, address: int, mark_dirty: bool, data_size: int, data=b'') -> int:
+        return self.next_mem.write(address, mark_dirty, data_size, data)
+
+    def flush_entry(self, block_address: int) -> int:
+        """
+        Writes a buffered entry to the next level: a single store when the whole block was written, a store per
+        contiguous run of written bytes otherwise.
+        :param block_address: Start address of the buffered block
+        :return: Clock cycles elapsed for the writes
+        """
+        block, mask = self.entries.pop(block_address)
+        if mask == self.full_mask:
+            self.full_flushes += 1
+            self.flushed_stores += 1
+            return self.next_mem.store(block_address, self.block_size, block)
+
+        self.partial_flushes += 1
+        cycles_elapsed = 0
+        offset = 0
+        while mask:
+            if not mask & 1:
+                skipped = (mask & -mask).bit_length() - 1  # Unwritten bytes up to the next run
+                mask >>= skipped
+                offset += skipped
+                continue
+            run_size = (~mask & (mask + 1)).bit_length() - 1  # Written bytes of the run
+            self.flushed_stores += 1
+            cycles_elapsed += self.next_mem.store(block_address + offset, run_size,
+                                                  memoryview(block)[offset:offset + run_size])
+            mask >>= run_size
+            offset += run_size
+        return cycles_elapsed
+
+    def flush_overlapping(self, address: int, data_size: int) -> int:
+        """
+        Writes all entries overlapping the given range to the next level, oldest first.
+        :return: Clock cycles elapsed for the writes
+        """
+        cycles_elapsed = 0
+        for block_address in [block_address for block_address in self.entries
+                              if block_address < address + data_size and address < block_address + self.block_size]:
+            cycles_elapsed += self.flush_entry(block_address)
+        return cycles_elapsed
+
+    def flush_all(self):
+        """Writes all entries to the next level (cycles are not accounted for)."""
+        while self.entries:
+            self.flush_entry(next(iter(self.entries)))
+
+    def load(self, address: int, block_size: int) -> (memoryview, int):
+        """
+        Loads from the next level, once the entries overlapping the requested range are flushed.
+        """
+        cycles_elapsed = self.flush_overlapping(address, block_size)
+        data, load_cycles = self.next_mem.load(address, block_size)
+        return data, cycles_elapsed + load_cycles
+
+    def store(self, address: int, block_size: int, data=b'') -> int:
+        """
+        Merges a store into the entry of its block, allocating an entry (flushing the oldest one if needed) for a
+        block not buffered yet. Stores that cross a block boundary are not combined, they are written to the next
+        level once the entries they overlap are flushed.
+        """
+        block_address = address - (address % self.block_size)
+        offset = address - block_address
+        if offset + block_size > self.block_size:
+            cycles_elapsed = self.flush_overlapping(address, block_size)
+            return cycles_elapsed + self.next_mem.store(address, block_size, data)
+
+        self.stores += 1
+        cycles_elapsed = self.WRITE_TIME
+        entry = self.entries.get(block_address)
+        if entry is not None:
+            self.combined += 1
+            self.write_hits += 1
+        else:
+            self.write_misses += 1
+            if len(self.entries) >= self.NUM_OF_ENTRIES:
+                cycles_elapsed += self.flush_entry(next(iter(self.entries)))
+            entry = self.entries[block_address] = [bytearray(self.block_size), 0]
+
+        entry[0][offset:offset + block_size] = data[:block_size]
+        entry[1] |= ((1 << block_size) - 1) << offset
+        if entry[1] == self.full_mask:
+            cycles_elapsed += self.flush_entry(block_address)
+        return cycles_elapsed
+
+    def prefetch(self, address: int) -> int:
+        return self.next_mem.prefetch(address)
+
+    def evict_block(self, address: int, block_size: int, data, is_dirty: bool) -> int:
+        """
+        Hands a victim of the level above to the next level, once the entries it overlaps are flushed.
+        """
+        cycles_elapsed = self.flush_overlapping(address, block_size)
+        return cycles_elapsed + self.next_mem.evict_block(address, block_size, data, is_dirty)
+
+    def warm_access(self, address: int, is_store: bool):
+        """Not warmed, functional warming passes through to the next level (see MemoryInterface.warm_access)"""
+        self.next_mem.warm_access(address, is_store)
+
+    def get_extra_statistics(self) -> dict:
+        return {
+            self.name + '_stores': self.stores,
+            self.name + '_combined': self.combined,
+            self.name + '_full_flushes': self.full_flushes,
+            self.name + '_partial_flushes': self.partial_flushes,
+            self.name + '_flushed_stores': self.flushed_stores,
+        }
+
+    def dump_memory(self, *file_names):
+        """The buffer has no dump file of its own, it is flushed so the next levels hold all the data."""
+        self.flush_all()
+        self.next_mem.dump_memory(*file_names)
+
+    def print_mem(self, limit=-1):
+        self.next_mem.print_mem(limit)